@@ -4,14 +4,15 @@ from datetime import datetime, timedelta
 class AIDatabase:
     def __init__(self):
         self.receipt_db = ReceiptDatabase()
-        # Access the database object from ReceiptDatabase
-        if self.receipt_db.client is None or not hasattr(self.receipt_db, 'db') or self.receipt_db.db is None:
-            print("⚠️  AIDatabase: MongoDB connection not available")
-            self.briefs_collection = None
-            self.stock_cache_collection = None
-        else:
-            self.briefs_collection = self.receipt_db.db['ai_daily_briefs']
-            self.stock_cache_collection = self.receipt_db.db['ai_stock_cache']
+    
+    # Resolved on use: the shared client connects lazily, after this module is imported
+    @property
+    def briefs_collection(self):
+        return self.receipt_db.db['ai_daily_briefs'] if self.receipt_db.is_connected else None
+    
+    @property
+    def stock_cache_collection(self):
+        return self.receipt_db.db['ai_stock_cache'] if self.receipt_db.is_connected else None
     
     def get_cached_brief(self):
         """Get today's cached brief if exists"""
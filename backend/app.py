@@ -1,27 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-import re
-import io
-from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+import hashlib
+import json
+import time
 from database import ReceiptDatabase
+from exports import EXPORT_FORMATS
+from pagination import InvalidCursorError
+from mongo_registry import mongo_registry
 import uuid
 import os
 from auth import auth_bp
 from ai_hub import ai_hub_bp
 from trading import trading_bp
 from education import education_bp
+from quote_cache import quote_cache
+from single_flight import all_stats as single_flight_stats
 
 
-# Optional imports for OCR functionality
-try:
-    import cv2
-    import numpy as np
-    from PIL import Image, ImageEnhance
-    import pytesseract
-    OCR_AVAILABLE = True
-except ImportError as e:
-    print(f"OCR packages not available: {e}")
-    OCR_AVAILABLE = False
+from receipt_scanner import ANONYMOUS_USER_ID, OCR_AVAILABLE, ReceiptScanError, scan_receipt_image
+from scan_jobs import ScanJobQueue, QueueFullError, DONE, FAILED
+from merchant_catalog import merchant_catalog
+from receipt_dedupe import dedupe_cache
+from receipt_batch import BatchError, collect_batch_images, scan_receipt_batch
+from uploads import MAX_REQUEST_BYTES, UploadTooLargeError, read_upload
+
+if OCR_AVAILABLE:
+    from ocr_engine import ocr_engine
+    from preprocessing import preprocess_stats, resolve_stages
 
 # Create Flask app ONCE with static folder configuration
 app = Flask(__name__, static_folder='../frontend/dist')
@@ -69,6 +75,16 @@ app.config['SESSION_COOKIE_SECURE'] = False  # False for HTTP in development
 app.config['SESSION_COOKIE_HTTPONLY'] = False  # Allow JavaScript access in development
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Lax for development
 
+# Reject oversized uploads before they are parsed or buffered
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({
+        'success': False,
+        'error': f'Upload is larger than {MAX_REQUEST_BYTES // (1024 * 1024)} MB'
+    }), 413
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(ai_hub_bp, url_prefix='/api/ai')
@@ -98,384 +114,17 @@ def serve_static(path):
     else:
         return send_from_directory(app.static_folder, 'index.html')
 
-# Hardcoded popular companies with their variations and stock tickers
-POPULAR_COMPANIES = {
-    'starbucks': {
-        'name': 'Starbucks Corporation',
-        'ticker': 'SBUX',
-        'variations': ['starbucks', 'sbux', 'star bucks', 'starbu'],
-        'logo': '☕'
-    },
-    'target': {
-        'name': 'Target Corporation',
-        'ticker': 'TGT',
-        'variations': ['target', 'tgt', 'target corp'],
-        'logo': '🎯'
-    },
-    'walmart': {
-        'name': 'Walmart Inc',
-        'ticker': 'WMT',
-        'variations': ['walmart', 'wal mart', 'wal-mart', 'wmt'],
-        'logo': '🛒'
-    },
-    'nike': {
-        'name': 'Nike Inc',
-        'ticker': 'NKE',
-        'variations': ['nike', 'nke', 'nike inc'],
-        'logo': '👟'
-    },
-    'apple': {
-        'name': 'Apple Inc',
-        'ticker': 'AAPL',
-        'variations': ['apple', 'aapl', 'apple inc', 'apple store'],
-        'logo': ''
-    },
-    'amazon': {
-        'name': 'Amazon.com Inc',
-        'ticker': 'AMZN',
-        'variations': ['amazon', 'amzn', 'amazon.com', 'amazon fresh', 'whole foods'],
-        'logo': ''
-    },
-    'mcdonalds': {
-        'name': 'McDonald\'s Corporation',
-        'ticker': 'MCD',
-        'variations': ['mcdonalds', 'mcd', 'mcdonald\'s', 'mc donalds'],
-        'logo': ''
-    },
-    'cocacola': {
-        'name': 'The Coca-Cola Company',
-        'ticker': 'KO',
-        'variations': ['coca cola', 'coke', 'coca-cola', 'ko'],
-        'logo': '🥤'
-    },
-    'tesla': {
-        'name': 'Tesla Inc',
-        'ticker': 'TSLA',
-        'variations': ['tesla', 'tsla', 'tesla motors'],
-        'logo': ''
-    },
-    'microsoft': {
-        'name': 'Microsoft Corporation',
-        'ticker': 'MSFT',
-        'variations': ['microsoft', 'msft', 'xbox'],
-        'logo': ''
-    },
-    'netflix': {
-        'name': 'Netflix Inc',
-        'ticker': 'NFLX',
-        'variations': ['netflix', 'nflx'],
-        'logo': ''
-    },
-    'uber': {
-        'name': 'Uber Technologies Inc',
-        'ticker': 'UBER',
-        'variations': ['uber', 'uber eats'],
-        'logo': ''
-    },
-    'spotify': {
-        'name': 'Spotify Technology SA',
-        'ticker': 'SPOT',
-        'variations': ['spotify', 'spot'],
-        'logo': ''
-    },
-    'meta': {
-        'name': 'Meta Platforms Inc',
-        'ticker': 'META',
-        'variations': ['meta', 'facebook', 'fb', 'instagram', 'whatsapp'],
-        'logo': ''
-    },
-    'disney': {
-        'name': 'The Walt Disney Company',
-        'ticker': 'DIS',
-        'variations': ['disney', 'dis', 'walt disney', 'disneyland', 'disney world'],
-        'logo': ''
-    },
-    'costco': {
-        'name': 'Costco Wholesale Corporation',
-        'ticker': 'COST',
-        'variations': ['costco', 'cost', 'costco wholesale'],
-        'logo': ''
-    },
-    'homedepot': {
-        'name': 'The Home Depot Inc',
-        'ticker': 'HD',
-        'variations': ['home depot', 'hd', 'homedepot'],
-        'logo': ''
-    },
-    'cvs': {
-        'name': 'CVS Health Corporation',
-        'ticker': 'CVS',
-        'variations': ['cvs', 'cvs pharmacy', 'cvs health'],
-        'logo': ''
-    },
-    'walgreens': {
-        'name': 'Walgreens Boots Alliance Inc',
-        'ticker': 'WBA',
-        'variations': ['walgreens', 'wba', 'walgreen'],
-        'logo': ''
-    },
-    'chipotle': {
-        'name': 'Chipotle Mexican Grill Inc',
-        'ticker': 'CMG',
-        'variations': ['chipotle', 'cmg'],
-        'logo': ''
-    }
-}
+def run_scan_job(job):
+    """Worker-side handler for queued scans"""
+    return scan_receipt_image(job['image'], job['file_name'], job['user_id'], db,
+                              **job.get('options', {}))
 
-def enhance_receipt_image(image):
-    """Enhanced preprocessing for better OCR"""
-    # Convert to OpenCV
-    opencv_img = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    gray = cv2.cvtColor(opencv_img, cv2.COLOR_BGR2GRAY)
-    
-    # Resize to optimal size for OCR
-    height, width = gray.shape
-    target_height = 1500
-    if height < target_height:
-        scale = target_height / height
-        new_width = int(width * scale)
-        gray = cv2.resize(gray, (new_width, target_height), interpolation=cv2.INTER_CUBIC)
-    
-    # Advanced denoising
-    denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-    
-    # Gaussian blur
-    blurred = cv2.GaussianBlur(denoised, (1, 1), 0)
-    
-    # Enhanced contrast
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    enhanced = clahe.apply(blurred)
-    
-    # Morphological operations
-    kernel = np.ones((1,1), np.uint8)
-    morph = cv2.morphologyEx(enhanced, cv2.MORPH_CLOSE, kernel)
-    
-    # Adaptive threshold
-    binary = cv2.adaptiveThreshold(
-        morph, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-        cv2.THRESH_BINARY, 15, 4
-    )
-    
-    # Cleanup
-    kernel = np.ones((2,2), np.uint8)
-    cleaned = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
-    
-    return cleaned
+# Uploads with async=true are queued here and return 202 with a job id
+scan_queue = ScanJobQueue(db, run_scan_job)
 
-def extract_text_robust(processed_img):
-    """Multi-pass OCR extraction"""
-    psm_modes = [6, 4, 8, 11, 13, 3]
-    oem_modes = [3, 1, 2]
-    
-    all_results = []
-    
-    for oem in oem_modes:
-        for psm in psm_modes:
-            try:
-                config = f'--oem {oem} --psm {psm} -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$/():- '
-                text = pytesseract.image_to_string(processed_img, config=config)
-                
-                if text.strip() and len(text.strip()) > 20:
-                    all_results.append({
-                        'text': text.strip(),
-                        'length': len(text.strip()),
-                        'oem': oem,
-                        'psm': psm
-                    })
-            except Exception as e:
-                continue
-    
-    if not all_results:
-        return ""
-    
-    # Return the longest result
-    best_result = max(all_results, key=lambda x: x['length'])
-    print(f"Best OCR: OEM {best_result['oem']}, PSM {best_result['psm']}, Length: {best_result['length']}")
-    return best_result['text']
-
-def detect_popular_company(text):
-    """Detect popular companies from OCR text using fuzzy matching"""
-    text_lower = text.lower()
-    
-    # First, try exact matches and variations
-    for company_key, company_data in POPULAR_COMPANIES.items():
-        for variation in company_data['variations']:
-            if variation.lower() in text_lower:
-                print(f"Found company variation '{variation}' for {company_data['name']}")
-                return {
-                    'name': company_data['name'],
-                    'ticker': company_data['ticker'],
-                    'logo': company_data['logo'],
-                    'confidence': 'high',
-                    'matched_text': variation
-                }
-    
-    # If no exact match, try partial matching for common words
-    words = re.findall(r'\b\w+\b', text_lower)
-    
-    for company_key, company_data in POPULAR_COMPANIES.items():
-        for variation in company_data['variations']:
-            variation_words = variation.split()
-            if len(variation_words) == 1:
-                # Single word company names
-                for word in words:
-                    if word in variation or variation in word:
-                        if len(word) >= 3:  # Avoid very short matches
-                            print(f"Found partial match '{word}' for {company_data['name']}")
-                            return {
-                                'name': company_data['name'],
-                                'ticker': company_data['ticker'],
-                                'logo': company_data['logo'],
-                                'confidence': 'medium',
-                                'matched_text': word
-                            }
-    
-    return None
-
-def find_company_name(text):
-    """Find company name with enhanced popular company detection"""
-    
-    # First, try to detect popular companies
-    popular_company = detect_popular_company(text)
-    if popular_company:
-        return popular_company['name']
-    
-    # Fallback to original logic for unknown companies
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    
-    # Patterns to skip
-    skip_patterns = [
-        r'^\d+\s+.*(?:street|st|avenue|ave|road|rd|boulevard|blvd)',
-        r'^\(\d{3}\)\s*\d{3}-\d{4}',
-        r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
-        r'^store\s*#?\d+',
-        r'^\d{1,2}:\d{2}',
-        r'^\$\d+\.?\d*',
-        r'^receipt\s*#?\d*',
-        r'^transaction\s*#?\d*',
-        r'^cashier:?\s*\w+',
-        r'^terminal:?\s*\d+',
-        r'^card\s*#?\*+\d+',
-        r'^\*+\d{4}$',
-        r'^auth\s*code:?\s*\d+',
-        r'^ref\s*#?\d+'
-    ]
-    
-    potential_companies = []
-    
-    for i, line in enumerate(lines[:12]):
-        line_clean = line.strip()
-        
-        if len(line_clean) < 3:
-            continue
-            
-        # Skip patterns
-        skip = False
-        for pattern in skip_patterns:
-            if re.match(pattern, line_clean, re.IGNORECASE):
-                skip = True
-                break
-        if skip:
-            continue
-        
-        # Skip numbers only or common words
-        if re.match(r'^[\d\s\.\-\(\)]+$', line_clean):
-            continue
-            
-        if line_clean.lower() in ['receipt', 'thank you', 'thanks', 'visit', 'again', 'customer', 'copy']:
-            continue
-        
-        # Good company name indicators
-        if (len(line_clean) >= 4 and 
-            not re.match(r'^\d+$', line_clean) and
-            not re.match(r'^\d+\.\d+$', line_clean) and
-            any(c.isalpha() for c in line_clean)):
-            
-            clean_name = re.sub(r'[^\w\s&\'-]', ' ', line_clean)
-            clean_name = ' '.join(clean_name.split())
-            
-            # Score the company name
-            score = 0
-            if i < 3:
-                score += 10
-            if len(clean_name.split()) <= 4:
-                score += 5
-            if clean_name.upper() == clean_name:
-                score += 3
-            if any(word in clean_name.upper() for word in ['STORE', 'MARKET', 'SHOP', 'FOODS', 'MART']):
-                score += 5
-                
-            potential_companies.append({
-                'name': clean_name.title(),
-                'score': score,
-                'position': i
-            })
-    
-    if potential_companies:
-        best = max(potential_companies, key=lambda x: x['score'])
-        return best['name']
-    
-    return "Unknown Store"
-
-def find_total_amount(text):
-    """Find total amount with better patterns"""
-    
-    # Total patterns
-    total_patterns = [
-        r'(?i)(?:total|amount\s*due|balance\s*due|grand\s*total)\s*:?\s*\$?(\d{1,4}\.\d{2})',
-        r'(?i)total\s*\$?(\d{1,4}\.\d{2})',
-        r'(?i)\$(\d{1,4}\.\d{2})\s*(?:total|due)',
-        r'(?i)(?:final|net)\s*(?:total|amount)\s*:?\s*\$?(\d{1,4}\.\d{2})',
-        r'(?i)amount\s*:?\s*\$?(\d{1,4}\.\d{2})'
-    ]
-    
-    found_amounts = []
-    
-    # Look for explicit patterns
-    for pattern in total_patterns:
-        matches = re.findall(pattern, text)
-        for match in matches:
-            try:
-                amount = float(match)
-                if 0.50 <= amount <= 9999.99:
-                    found_amounts.append(amount)
-            except:
-                continue
-    
-    if found_amounts:
-        return max(found_amounts)
-    
-    # Look near total-related words
-    lines = text.split('\n')
-    for i, line in enumerate(lines):
-        if re.search(r'\b(?:total|amount|due|balance|grand)\b', line, re.IGNORECASE):
-            search_lines = lines[max(0, i-1):i+3]
-            for search_line in search_lines:
-                amounts = re.findall(r'\$(\d{1,4}\.\d{2})', search_line)
-                for amount in amounts:
-                    try:
-                        val = float(amount)
-                        if 1.00 <= val <= 9999.99:
-                            found_amounts.append(val)
-                    except:
-                        continue
-    
-    if found_amounts:
-        return max(found_amounts)
-    
-    # Last resort: largest reasonable amount
-    all_amounts = re.findall(r'\$(\d{1,4}\.\d{2})', text)
-    valid_amounts = []
-    
-    for amount in all_amounts:
-        try:
-            val = float(amount)
-            if 5.00 <= val <= 999.99:
-                valid_amounts.append(val)
-        except:
-            continue
-    
-    return max(valid_amounts) if valid_amounts else 0.0
+def form_flag(name):
+    value = request.form.get(name, request.args.get(name, 'false'))
+    return str(value).lower() in ('1', 'true', 'yes')
 
 @app.route('/api/scan-receipt', methods=['POST'])
 def scan_receipt():
@@ -494,107 +143,45 @@ def scan_receipt():
             return jsonify({'error': 'No file selected', 'success': False}), 400
 
         # Get user_id from request
-        user_id = request.form.get('user_id', 'anonymous_user')
-        
-        # Process image
-        image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        print(f"Processing receipt for user: {user_id}")
-        
-        # Enhanced preprocessing
-        processed_image = enhance_receipt_image(image)
-        
-        # Extract text
-        extracted_text = extract_text_robust(processed_image)
-        
-        print("=== EXTRACTED TEXT ===")
-        print(extracted_text)
-        print("=== END TEXT ===")
+        user_id = request.form.get('user_id') or ANONYMOUS_USER_ID
+        try:
+            image_bytes = read_upload(file)
+        except UploadTooLargeError as e:
+            return jsonify({'success': False, 'error': str(e)}), 413
+        # force=true rescans a photo even if it matches an earlier upload
+        options = {'use_cache': not form_flag('force')}
+        try:
+            preprocess_profile = form_preprocess_profile()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if preprocess_profile:
+            options['preprocess_profile'] = preprocess_profile
         
-        if not extracted_text or len(extracted_text.strip()) < 10:
+        if form_flag('async'):
+            try:
+                job_id = scan_queue.submit(user_id, file.filename, image_bytes, options)
+            except QueueFullError as e:
+                response = jsonify({'success': False, 'error': str(e)})
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response, 429
             return jsonify({
-                'success': False,
-                'error': 'Could not extract readable text. Please try a clearer image.',
-                'extracted_text': extracted_text
-            }), 400
-        
-        # Detect popular company first
-        popular_company = detect_popular_company(extracted_text)
-        
-        if popular_company:
-            company_name = popular_company['name']
-            ticker = popular_company['ticker']
-            logo = popular_company['logo']
-            confidence_boost = 30  # Boost confidence for known companies
-            print(f"Detected popular company: {company_name} ({ticker})")
-        else:
-            company_name = find_company_name(extracted_text)
-            ticker = None
-            logo = '🏪'
-            confidence_boost = 0
-        
-        total_amount = find_total_amount(extracted_text)
-        
-        # Calculate confidence with boost for popular companies
-        confidence_score = 100 + confidence_boost
-        
-        if company_name == "Unknown Store":
-            confidence_score -= 40
-        if total_amount == 0.0:
-            confidence_score -= 50
-        if len(extracted_text.strip()) < 100:
-            confidence_score -= 20
-            
-        # Cap confidence at 100
-        confidence_score = min(confidence_score, 100)
-            
-        if confidence_score >= 80:
-            confidence = "high"
-        elif confidence_score >= 50:
-            confidence = "medium"
-        else:
-            confidence = "low"
-        
-        print(f"Results: Company='{company_name}', Amount=${total_amount}, Confidence={confidence}, Ticker={ticker}")
-        
-        # Save to database
-        scan_metadata = {
-            'file_name': file.filename,
-            'file_size': len(image_bytes),
-            'processing_time': datetime.now().isoformat(),
-            'detected_company': popular_company is not None,
-            'ticker': ticker,
-            'logo': logo
-        }
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/scan-receipt/{job_id}'
+            }), 202
         
-        receipt_id = db.save_receipt_scan(
-            user_id=user_id,
-            company_name=company_name,
-            total_amount=total_amount,
-            confidence=confidence,
-            extracted_text=extracted_text,
-            scan_metadata=scan_metadata
-        )
-        
-        response_data = {
-            'success': True,
-            'company_name': company_name,
-            'total_amount': total_amount,
-            'confidence': confidence,
-            'extracted_text': extracted_text,
-            'ticker': ticker,
-            'logo': logo,
-            'is_popular_company': popular_company is not None
-        }
-        
-        if receipt_id:
-            response_data['receipt_id'] = receipt_id
-        
-        return jsonify(response_data)
+        return jsonify(scan_receipt_image(image_bytes, file.filename, user_id, db, **options))
+    
+    except ReceiptScanError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'extracted_text': e.extracted_text
+        }), 400
+    
+    except RequestEntityTooLarge:
+        raise
     
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -603,24 +190,145 @@ def scan_receipt():
             'error': f'Processing error: {str(e)}'
         }), 500
 
+def form_preprocess_profile():
+    """preprocess=fast|balanced|accurate or a comma-separated stage list; raises ValueError if unknown"""
+    preprocess_profile = request.form.get('preprocess', request.args.get('preprocess'))
+    if preprocess_profile:
+        resolve_stages(preprocess_profile)
+    return preprocess_profile
+
+@app.route('/api/scan-receipts/batch', methods=['POST'])
+def scan_receipts_batch():
+    """Scan many receipts (files in 'receipts' and/or zip archives); streams one NDJSON line per receipt"""
+    if not OCR_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'OCR functionality not available. Please install opencv-python, Pillow, pytesseract, and numpy packages.'
+        }), 503
+    
+    try:
+        uploads = [(file.filename, read_upload(file, MAX_REQUEST_BYTES))
+                   for file in request.files.getlist('receipts') if file and file.filename]
+        if not uploads:
+            return jsonify({'error': 'No files uploaded', 'success': False}), 400
+        images = collect_batch_images(uploads)
+        preprocess_profile = form_preprocess_profile()
+    except UploadTooLargeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except (BatchError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    user_id = request.form.get('user_id') or ANONYMOUS_USER_ID
+    results = scan_receipt_batch(images, user_id, db, use_cache=not form_flag('force'),
+                                 preprocess_profile=preprocess_profile)
+    
+    def lines():
+        for result in results:
+            yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/scan-receipt/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """Poll an async scan; result holds the usual scan response once status is 'done'"""
+    try:
+        job = scan_queue.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Scan job not found'}), 404
+        return jsonify({'success': True, 'job': job})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# An open stream holds a request thread (gthread workers, see Procfile), so streams are kept under the
+# worker --timeout of 120s; EventSource reconnects after the timeout event, or clients fall back to polling
+SCAN_EVENTS_MAX_SECONDS = 100
+
+@app.route('/api/scan-receipt/<job_id>/events', methods=['GET'])
+def stream_scan_job(job_id):
+    """Server-sent events: one event per status change until the job finishes (or a timeout event)"""
+    try:
+        timeout = min(float(request.args.get('timeout', SCAN_EVENTS_MAX_SECONDS)), SCAN_EVENTS_MAX_SECONDS)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'timeout must be a number of seconds'}), 400
+
+    def events():
+        last_status = None
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = scan_queue.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Scan job not found'})}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"data: {json.dumps(job)}\n\n"
+            if last_status in (DONE, FAILED):
+                return
+            time.sleep(0.5)
+        yield f"event: timeout\ndata: {json.dumps({'job_id': job_id})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/scan-queue/stats', methods=['GET'])
+def scan_queue_stats():
+    """Queue depth, worker liveness and accepted/rejected counts"""
+    return jsonify({'success': True, 'stats': scan_queue.stats()})
+
 # Dashboard API endpoints (keeping existing endpoints)
+def _receipt_fields(value):
+    """Projection fields from a ?fields=a,b.c query value (None for the summary shape)"""
+    fields = [field for field in (value or '').split(',') if field]
+    for field in fields:
+        if field == 'extracted_text':
+            raise ValueError('extracted_text is not listed; fetch it per receipt from /api/receipts/<receipt_id>')
+        if not all(part.isidentifier() for part in field.split('.')):
+            raise ValueError(f'Invalid field: {field}')
+    return fields or None
+
 @app.route('/api/dashboard/receipts/<user_id>', methods=['GET'])
 def get_user_receipts(user_id):
-    """Get all receipts for a user"""
+    """Get a page of receipt summaries for a user (?cursor=<next_cursor> to continue; ?page=N still works)"""
     try:
-        page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
+        cursor = request.args.get('cursor')
+        try:
+            fields = _receipt_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        if cursor:
+            receipts, next_cursor = db.get_user_receipts_page(user_id, limit=limit, cursor=cursor, fields=fields)
+            return jsonify({
+                'success': True,
+                'receipts': receipts,
+                'limit': limit,
+                'next_cursor': next_cursor
+            })
+        
+        # Legacy page numbers: skip-based, slower for deep pages
+        page = int(request.args.get('page', 1))
         skip = (page - 1) * limit
         
-        receipts = db.get_user_receipts(user_id, limit=limit, skip=skip)
+        receipts, next_cursor = db.get_user_receipts_page(user_id, limit=limit, skip=skip, fields=fields)
         
         return jsonify({
             'success': True,
             'receipts': receipts,
             'page': page,
-            'limit': limit
+            'limit': limit,
+            'next_cursor': next_cursor
         })
         
+    except InvalidCursorError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -685,6 +393,136 @@ def get_monthly_spending(user_id):
             'error': str(e)
         }), 500
 
+DASHBOARD_SECTIONS = ('stats', 'companies', 'monthly', 'receipts')
+
+def _select_fields(value, fields):
+    """Keep only the requested fields of a section (each item's, for list sections)"""
+    if isinstance(value, list):
+        return [_select_fields(item, fields) for item in value]
+    return {key: value[key] for key in fields if key in value}
+
+@app.route('/api/dashboard/<user_id>', methods=['GET'])
+def get_dashboard(user_id):
+    """All dashboard sections in one request; ?sections=stats,companies and ?<section>_fields=a,b narrow it"""
+    try:
+        sections = [name for name in request.args.get('sections', ','.join(DASHBOARD_SECTIONS)).split(',') if name]
+        unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+        if unknown or not sections:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown dashboard section(s): {', '.join(unknown)}. Choose from: {', '.join(DASHBOARD_SECTIONS)}"
+            }), 400
+        
+        try:
+            receipt_fields = _receipt_fields(request.args.get('receipts_fields'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        months = int(request.args.get('months', 12))
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', 20))
+        
+        # The same data under different query parameters is a different representation
+        def etag_for(version):
+            return hashlib.sha1(f"{user_id}:{version}:{request.query_string.decode()}".encode()).hexdigest()
+        
+        if request.if_none_match:
+            # Unchanged since the client's copy: answer from the rollup version alone
+            version = db.get_dashboard_version(user_id)
+            if version is not None and etag_for(version) in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(etag_for(version))
+                return response
+        
+        version, data = db.get_dashboard(user_id, sections, months=months, limit=limit, skip=(page - 1) * limit,
+                                         receipt_fields=receipt_fields)
+        if data is None:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to get dashboard'
+            }), 500
+        
+        for name in sections:
+            fields = [field for field in request.args.get(f'{name}_fields', '').split(',') if field]
+            if fields:
+                data[name] = _select_fields(data[name], fields)
+        if 'receipts' in sections:
+            data.update(page=page, limit=limit)
+        
+        response = jsonify(dict(success=True, **data))
+        response.set_etag(etag_for(version))
+        # Cacheable, but always revalidated so a new scan shows up immediately
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/export/receipts/<user_id>', methods=['GET'])
+def export_receipts(user_id):
+    """Stream all of a user's receipts (?format=ndjson|csv, ?from=/?to= ISO dates, ?include_text=1)"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown format '{export_format}'. Choose from: {', '.join(EXPORT_FORMATS)}"
+        }), 400
+    
+    if not db.is_connected:
+        return jsonify({
+            'success': False,
+            'error': 'Database not connected'
+        }), 500
+    
+    try:
+        chunks = db.export_receipts(user_id, export_format, start=request.args.get('from'),
+                                    end=request.args.get('to'),
+                                    include_text=request.args.get('include_text') in ('1', 'true', 'yes'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid date: {e}'
+        }), 400
+    
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename=receipts.{export_format}',
+                             'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/receipts/<receipt_id>', methods=['GET'])
+def get_receipt(receipt_id):
+    """Get one receipt in full, including its OCR text"""
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'user_id is required'
+            }), 400
+        
+        receipt = db.get_receipt(receipt_id, user_id)
+        if receipt is None:
+            return jsonify({
+                'success': False,
+                'error': 'Receipt not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'receipt': receipt
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/receipts/<receipt_id>', methods=['DELETE'])
 def delete_receipt(receipt_id):
     """Delete a receipt"""
@@ -697,6 +535,8 @@ def delete_receipt(receipt_id):
             }), 400
         
         success = db.delete_receipt(receipt_id, user_id)
+        if success:
+            dedupe_cache.forget_receipt(receipt_id)
         
         return jsonify({
             'success': success,
@@ -732,6 +572,9 @@ def update_receipt(receipt_id):
             updates['confidence'] = data['confidence']
         
         success = db.update_receipt(receipt_id, user_id, updates)
+        if success:
+            # Later re-uploads should pick up the corrected values from the database
+            dedupe_cache.forget_receipt(receipt_id)
         
         return jsonify({
             'success': success,
@@ -748,6 +591,67 @@ def update_receipt(receipt_id):
 def health():
     return jsonify({'status': 'healthy', 'database': 'connected' if db.is_connected else 'disconnected'})
 
+@app.route('/api/cache/quotes/stats', methods=['GET'])
+def quote_cache_stats():
+    """Quote cache hit/miss counters and entry ages"""
+    include_entries = request.args.get('entries', 'false').lower() == 'true'
+    return jsonify({
+        'success': True,
+        'stats': quote_cache.stats(include_entries=include_entries)
+    })
+
+@app.route('/api/cache/receipts/stats', methods=['GET'])
+def receipt_dedupe_stats():
+    """Duplicate-upload cache size and exact/near/database hit rates"""
+    return jsonify({
+        'success': True,
+        'stats': dedupe_cache.stats()
+    })
+
+@app.route('/api/cache/single-flight/stats', methods=['GET'])
+def single_flight_stats_endpoint():
+    """How many upstream fetches were coalesced, per single-flight group"""
+    return jsonify({
+        'success': True,
+        'stats': single_flight_stats()
+    })
+
+@app.route('/api/ocr/stats', methods=['GET'])
+def ocr_stats():
+    """Which OCR passes win, how often scans exit early, passes per scan"""
+    if not OCR_AVAILABLE:
+        return jsonify({'success': False, 'error': 'OCR functionality not available'}), 503
+    return jsonify({
+        'success': True,
+        'stats': ocr_engine.stats()
+    })
+
+@app.route('/api/preprocess/stats', methods=['GET'])
+def preprocess_timing_stats():
+    """Time spent in each preprocessing stage and how often each profile runs"""
+    if not OCR_AVAILABLE:
+        return jsonify({'success': False, 'error': 'OCR functionality not available'}), 503
+    return jsonify({
+        'success': True,
+        'stats': preprocess_stats.stats()
+    })
+
+@app.route('/api/db/pool/stats', methods=['GET'])
+def db_pool_stats():
+    """This worker's MongoDB pool: open and checked-out connections, checkout wait times, failures"""
+    return jsonify({
+        'success': True,
+        'stats': mongo_registry.stats()
+    })
+
+@app.route('/api/merchants/stats', methods=['GET'])
+def merchant_catalog_stats():
+    """Loaded merchant catalog version and index sizes"""
+    return jsonify({
+        'success': True,
+        'stats': merchant_catalog.stats()
+    })
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({'message': 'Enhanced Receipt Scanner API with Popular Company Detection'})
@@ -9,6 +9,9 @@ from datetime import datetime, timezone
 import json
 import yfinance as yf
 from db_connection_helper import get_db_error_response, log_db_error
+from quote_cache import quote_cache
+from user_resolver import user_resolver
+from market_data import get_quote_summaries, MAX_BATCH_SYMBOLS
 
 load_dotenv()
 
@@ -240,15 +243,8 @@ def get_user_profile(user_id):
         return jsonify(get_db_error_response()), 500
     
     try:
-        users_collection = db.db['users']
-        
-        # Find user by ID or email
-        from bson import ObjectId
-        try:
-            user = users_collection.find_one({'_id': ObjectId(user_id)})
-        except:
-            # If not valid ObjectId, try email
-            user = users_collection.find_one({'email': user_id})
+        # Find user by ID, email or google_id, leaving out sensitive data
+        user = user_resolver.find_user(user_id, {'google_id': 0})
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -256,9 +252,6 @@ def get_user_profile(user_id):
         # Convert ObjectId to string
         user['_id'] = str(user['_id'])
         
-        # Remove sensitive data
-        user.pop('google_id', None)
-        
         return jsonify({
             'success': True,
             'user': user
@@ -299,7 +292,6 @@ def save_onboarding_data():
         users_collection = db.db['users']
         
         # Update user with onboarding data and remove old portfolio (cleanup mock data)
-        from bson import ObjectId
         update_operation = {
             '$set': onboarding_data,
             '$unset': {
@@ -308,33 +300,15 @@ def save_onboarding_data():
             }
         }
         
-        # Try to find user by ObjectId, email, or google_id in a single query (faster)
-        user = None
-        query_conditions = []
-        
-        # Build query conditions for all possible identifiers
-        # Always check email (most common)
-        query_conditions.append({'email': user_id})
-        
-        # Check google_id (could be numeric string)
-        query_conditions.append({'google_id': user_id})
+        # Find user by ObjectId, email, or google_id (cached, at most one query)
+        user_oid = user_resolver.resolve_id(user_id)
         
-        # Try as ObjectId if it looks like one (24 hex characters)
-        if len(user_id) == 24 and all(c in '0123456789abcdefABCDEF' for c in user_id):
-            try:
-                query_conditions.append({'_id': ObjectId(user_id)})
-            except:
-                pass
-        
-        # Single query with $or for better performance (MongoDB will use index if available)
-        user = users_collection.find_one({'$or': query_conditions})
-        
-        if not user:
+        if user_oid is None:
             # Auto-create user if not found (similar to trading endpoints)
             print(f"⚠️ User not found for onboarding: {user_id}, attempting auto-create...")
             # Assume user_id is an email for auto-creation
             from trading import STARTING_CASH
-            new_user_data = {
+            user = user_resolver.create_user({
                 'email': user_id if '@' in user_id else f'{user_id}@unknown.com',
                 'name': user_id.split('@')[0] if '@' in user_id else user_id,
                 'cash_balance': STARTING_CASH,
@@ -342,14 +316,13 @@ def save_onboarding_data():
                 'created_at': datetime.now(timezone.utc),
                 'updated_at': datetime.now(timezone.utc),
                 'last_login': datetime.now(timezone.utc)
-            }
-            result = users_collection.insert_one(new_user_data)
-            user = users_collection.find_one({'_id': result.inserted_id})
-            print(f"✅ Auto-created user: {user.get('email')} with ID: {str(user.get('_id'))}")
+            })
+            user_oid = user['_id']
+            print(f"✅ Auto-created user: {user.get('email')} with ID: {str(user_oid)}")
         
         # Update the found user
         result = users_collection.update_one(
-            {'_id': user['_id']},
+            {'_id': user_oid},
             update_operation
         )
         
@@ -409,44 +382,51 @@ def update_portfolio():
         'message': 'Portfolio is now only built from actual trades. Use /api/trading/portfolio instead.'
     }), 400
 
+def fetch_stock_quote(symbol):
+    """Fetch a full stock quote from yfinance"""
+    ticker = yf.Ticker(symbol)
+    info = ticker.info
+    
+    if not info or 'regularMarketPrice' not in info:
+        # Try fast_info as fallback
+        fast_info = ticker.fast_info
+        quote = {
+            'symbol': symbol,
+            'price': fast_info.get('lastPrice', 0) or fast_info.get('last_price', 0),
+            'change': 0,
+            'changePercent': 0,
+            'volume': fast_info.get('lastVolume', 0),
+            'previousClose': fast_info.get('previousClose', 0) or fast_info.get('previous_close', 0),
+            'high': fast_info.get('dayHigh', 0),
+            'low': fast_info.get('dayLow', 0),
+            'open': fast_info.get('open', 0)
+        }
+    else:
+        quote = {
+            'symbol': symbol,
+            'price': info.get('regularMarketPrice', 0) or info.get('currentPrice', 0),
+            'change': info.get('regularMarketChange', 0),
+            'changePercent': info.get('regularMarketChangePercent', 0),
+            'volume': info.get('regularMarketVolume', 0) or info.get('volume', 0),
+            'previousClose': info.get('previousClose', 0) or info.get('regularMarketPreviousClose', 0),
+            'high': info.get('dayHigh', 0) or info.get('regularMarketDayHigh', 0),
+            'low': info.get('dayLow', 0) or info.get('regularMarketDayLow', 0),
+            'open': info.get('open', 0) or info.get('regularMarketOpen', 0)
+        }
+    
+    # Calculate change if not provided
+    if quote['change'] == 0 and quote['previousClose'] > 0:
+        quote['change'] = quote['price'] - quote['previousClose']
+        quote['changePercent'] = (quote['change'] / quote['previousClose']) * 100
+    
+    return quote
+
 @auth_bp.route('/stock-quote/<symbol>', methods=['GET'])
 def get_stock_quote(symbol):
     """Get real-time stock quote using yfinance"""
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
-        
-        if not info or 'regularMarketPrice' not in info:
-            # Try fast_info as fallback
-            fast_info = ticker.fast_info
-            quote = {
-                'symbol': symbol,
-                'price': fast_info.get('lastPrice', 0) or fast_info.get('last_price', 0),
-                'change': 0,
-                'changePercent': 0,
-                'volume': fast_info.get('lastVolume', 0),
-                'previousClose': fast_info.get('previousClose', 0) or fast_info.get('previous_close', 0),
-                'high': fast_info.get('dayHigh', 0),
-                'low': fast_info.get('dayLow', 0),
-                'open': fast_info.get('open', 0)
-            }
-        else:
-            quote = {
-                'symbol': symbol,
-                'price': info.get('regularMarketPrice', 0) or info.get('currentPrice', 0),
-                'change': info.get('regularMarketChange', 0),
-                'changePercent': info.get('regularMarketChangePercent', 0),
-                'volume': info.get('regularMarketVolume', 0) or info.get('volume', 0),
-                'previousClose': info.get('previousClose', 0) or info.get('regularMarketPreviousClose', 0),
-                'high': info.get('dayHigh', 0) or info.get('regularMarketDayHigh', 0),
-                'low': info.get('dayLow', 0) or info.get('regularMarketDayLow', 0),
-                'open': info.get('open', 0) or info.get('regularMarketOpen', 0)
-            }
-        
-        # Calculate change if not provided
-        if quote['change'] == 0 and quote['previousClose'] > 0:
-            quote['change'] = quote['price'] - quote['previousClose']
-            quote['changePercent'] = (quote['change'] / quote['previousClose']) * 100
+        # Cached and coalesced: concurrent requests for the same symbol share one fetch
+        quote = quote_cache.get_or_fetch(f'quote:{symbol}', lambda: fetch_stock_quote(symbol))
         
         return jsonify({
             'success': True,
@@ -518,9 +498,47 @@ def get_stock_details(symbol):
             'error': str(e)
         }), 500
 
+def fetch_quote_summary(symbol):
+    """Fetch a price/change summary for one symbol, or None if unavailable"""
+    ticker = yf.Ticker(symbol)
+    
+    # Try fast_info first (faster)
+    try:
+        fast_info = ticker.fast_info
+        price = fast_info.get('lastPrice', 0) or fast_info.get('last_price', 0)
+        prev_close = fast_info.get('previousClose', 0) or fast_info.get('previous_close', 0)
+        
+        if price > 0:
+            change = price - prev_close if prev_close > 0 else 0
+            change_percent = (change / prev_close * 100) if prev_close > 0 else 0
+            
+            return {
+                'symbol': symbol,
+                'price': price,
+                'change': change,
+                'changePercent': change_percent,
+                'volume': fast_info.get('lastVolume', 0),
+                'previousClose': prev_close
+            }
+    except Exception as fast_error:
+        print(f"   Fast info failed for {symbol}, trying regular info...")
+    
+    # Fallback to regular info
+    info = ticker.info
+    if info and 'regularMarketPrice' in info:
+        return {
+            'symbol': symbol,
+            'price': info.get('regularMarketPrice', 0) or info.get('currentPrice', 0),
+            'change': info.get('regularMarketChange', 0),
+            'changePercent': info.get('regularMarketChangePercent', 0),
+            'volume': info.get('regularMarketVolume', 0),
+            'previousClose': info.get('previousClose', 0)
+        }
+    return None
+
 @auth_bp.route('/stock-quotes', methods=['POST'])
 def get_multiple_quotes():
-    """Get multiple stock quotes at once using yfinance"""
+    """Get multiple stock quotes at once using a single bulk yfinance download"""
     try:
         data = request.get_json()
         symbols = data.get('symbols', [])
@@ -530,46 +548,20 @@ def get_multiple_quotes():
         
         print(f"📊 Fetching {len(symbols)} quotes: {symbols}")
         
-        quotes = []
-        for symbol in symbols[:15]:  # Limit to 15 symbols
+        # One bulk download for every uncached symbol
+        quotes = get_quote_summaries(symbols)
+        
+        # Per-symbol fallback for anything the bulk download could not price
+        found = {quote['symbol'] for quote in quotes}
+        for symbol in symbols[:MAX_BATCH_SYMBOLS]:
+            if symbol.upper() in found:
+                continue
             try:
-                ticker = yf.Ticker(symbol)
-                
-                # Try fast_info first (faster)
-                try:
-                    fast_info = ticker.fast_info
-                    price = fast_info.get('lastPrice', 0) or fast_info.get('last_price', 0)
-                    prev_close = fast_info.get('previousClose', 0) or fast_info.get('previous_close', 0)
-                    
-                    if price > 0:
-                        change = price - prev_close if prev_close > 0 else 0
-                        change_percent = (change / prev_close * 100) if prev_close > 0 else 0
-                        
-                        quote = {
-                            'symbol': symbol,
-                            'price': price,
-                            'change': change,
-                            'changePercent': change_percent,
-                            'volume': fast_info.get('lastVolume', 0),
-                            'previousClose': prev_close
-                        }
-                        quotes.append(quote)
-                        print(f"   {symbol}: ${price:.2f}")
-                        continue
-                except Exception as fast_error:
-                    print(f"   Fast info failed for {symbol}, trying regular info...")
-                
-                # Fallback to regular info
-                info = ticker.info
-                if info and 'regularMarketPrice' in info:
-                    quote = {
-                        'symbol': symbol,
-                        'price': info.get('regularMarketPrice', 0) or info.get('currentPrice', 0),
-                        'change': info.get('regularMarketChange', 0),
-                        'changePercent': info.get('regularMarketChangePercent', 0),
-                        'volume': info.get('regularMarketVolume', 0),
-                        'previousClose': info.get('previousClose', 0)
-                    }
+                quote = quote_cache.get_or_fetch(
+                    f'quote_summary:{symbol}',
+                    lambda symbol=symbol: fetch_quote_summary(symbol)
+                )
+                if quote:
                     quotes.append(quote)
                     print(f"   {symbol}: ${quote['price']:.2f}")
                     
@@ -619,6 +611,8 @@ def save_or_update_user(user_data):
                     }
                 }
             )
+            # Email may have changed; drop stale identifier mappings
+            user_resolver.invalidate(existing_user.get('email'), user_data['email'])
             return str(existing_user['_id'])
         else:
             # Create new user
@@ -634,9 +628,9 @@ def save_or_update_user(user_data):
                 'onboarding_completed': False
             }
             
-            result = users_collection.insert_one(user_doc)
-            print(f"New user created with ID: {result.inserted_id}")
-            return str(result.inserted_id)
+            user_resolver.create_user(user_doc)
+            print(f"New user created with ID: {user_doc['_id']}")
+            return str(user_doc['_id'])
             
     except Exception as e:
         print(f"Error saving user: {e}")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: compiled CompanyMatcher vs the original nested-loop detect_popular_company
+Checks both return the same match on every text, then times them on catalogs
+of growing size (the real 20-entry catalog padded with synthetic merchants).
+
+Usage: python benchmarks/bench_company_matcher.py [--sizes 20,1000,10000] [--texts 200]
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from company_matcher import CompanyMatcher
+from merchant_catalog import merchant_catalog
+
+FILLER_LINES = [
+    'STORE #1234', '123 MAIN STREET', '(555) 123-4567', '01/15/2024 12:34',
+    'SUBTOTAL $23.45', 'TAX $1.88', 'TOTAL $25.33', 'VISA ****1234',
+    'THANK YOU FOR SHOPPING', 'CASHIER: MARIA', 'ITEM 2 @ 3.99', 'AUTH CODE 123456',
+]
+
+
+def legacy_detect(companies, text):
+    """The original detect_popular_company loops, without the logging"""
+    text_lower = text.lower()
+    for company_key, company_data in companies.items():
+        for variation in company_data['variations']:
+            if variation.lower() in text_lower:
+                return company_data['name'], 'high', variation
+
+    words = re.findall(r'\b\w+\b', text_lower)
+    for company_key, company_data in companies.items():
+        for variation in company_data['variations']:
+            if len(variation.split()) == 1:
+                for word in words:
+                    if word in variation or variation in word:
+                        if len(word) >= 3:
+                            return company_data['name'], 'medium', word
+    return None
+
+
+def synthetic_catalog(size, rng):
+    """Real catalog followed by random merchants with 1-3 variations each"""
+    catalog = dict(merchant_catalog.snapshot().companies)
+    while len(catalog) < size:
+        name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10)))
+        suffix = rng.choice(['market', 'foods', 'cafe', 'outlet', 'supply'])
+        catalog[name] = {
+            'name': name.title(),
+            'ticker': name[:4].upper(),
+            'logo': '🏪',
+            'variations': [name, f'{name} {suffix}', name[:rng.randint(4, 6)]][:rng.randint(1, 3)]
+        }
+    return catalog
+
+
+def synthetic_texts(catalog, count, rng):
+    """Receipt-like texts: some name a merchant, some only a fragment, some nothing known"""
+    keys = list(catalog)
+    texts = []
+    for i in range(count):
+        lines = rng.sample(FILLER_LINES, 8)
+        company = catalog[rng.choice(keys)]
+        kind = i % 3
+        if kind == 0:
+            lines.insert(0, rng.choice(company['variations']).upper())
+        elif kind == 1:
+            lines.insert(0, company['variations'][0][:4].upper() + ' XQ')
+        texts.append('\n'.join(lines))
+    return texts
+
+
+def time_per_text(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='20,1000,10000')
+    parser.add_argument('--texts', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'merchants':>10} {'build ms':>10} {'legacy us/text':>15} {'matcher us/text':>16} {'speedup':>8}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        catalog = synthetic_catalog(size, rng)
+        texts = synthetic_texts(catalog, args.texts, rng)
+
+        start = time.perf_counter()
+        matcher = CompanyMatcher(catalog)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for text in texts:
+            expected = legacy_detect(catalog, text)
+            got = matcher.match(text)
+            got = (got['name'], got['confidence'], got['matched_text']) if got else None
+            if got != expected:
+                print(f"MISMATCH on {text!r}: legacy={expected} matcher={got}")
+                return False
+
+        legacy_us = time_per_text(lambda t: legacy_detect(catalog, t), texts, args.repeat)
+        matcher_us = time_per_text(matcher.match, texts, args.repeat)
+        print(f"{size:>10} {build_ms:>10.1f} {legacy_us:>15.1f} {matcher_us:>16.1f} {legacy_us / matcher_us:>7.1f}x")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
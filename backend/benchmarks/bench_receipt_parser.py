@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass parse_receipt vs the original find_company_name / find_total_amount
+Generates a corpus of OCR-like receipt texts (clean, noisy, split totals, no totals),
+checks company and total agree with the original functions, then times both.
+
+Usage: python benchmarks/bench_receipt_parser.py [--texts 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_parser import parse_receipt
+
+STORES = ['TRADER JOES', 'Corner Market', 'BLUE BOTTLE COFFEE', 'Joe\'s Hardware Store', 'FRESH FOODS MART', 'Pho 99']
+HEADERS = ['123 MAIN STREET', '(555) 123-4567', 'STORE #0421', 'RECEIPT #8891', 'Cashier: Dana', '01/15/2024 12:34']
+ITEMS = ['MILK 2%', 'BREAD', 'EGGS LARGE', 'COFFEE BEANS', 'BANANAS', 'PAPER TOWELS', 'HAMMER', 'PHO TAI']
+FOOTERS = ['VISA ****1234', 'AUTH CODE 554211', 'THANK YOU', 'PLEASE COME AGAIN', 'REF #2231']
+
+
+def legacy_find_company_name(text):
+    """Header-line fallback of the original find_company_name (catalog lookups removed)"""
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    
+    # Patterns to skip
+    skip_patterns = [
+        r'^\d+\s+.*(?:street|st|avenue|ave|road|rd|boulevard|blvd)',
+        r'^\(\d{3}\)\s*\d{3}-\d{4}',
+        r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
+        r'^store\s*#?\d+',
+        r'^\d{1,2}:\d{2}',
+        r'^\$\d+\.?\d*',
+        r'^receipt\s*#?\d*',
+        r'^transaction\s*#?\d*',
+        r'^cashier:?\s*\w+',
+        r'^terminal:?\s*\d+',
+        r'^card\s*#?\*+\d+',
+        r'^\*+\d{4}$',
+        r'^auth\s*code:?\s*\d+',
+        r'^ref\s*#?\d+'
+    ]
+    
+    potential_companies = []
+    
+    for i, line in enumerate(lines[:12]):
+        line_clean = line.strip()
+        
+        if len(line_clean) < 3:
+            continue
+            
+        # Skip patterns
+        skip = False
+        for pattern in skip_patterns:
+            if re.match(pattern, line_clean, re.IGNORECASE):
+                skip = True
+                break
+        if skip:
+            continue
+        
+        # Skip numbers only or common words
+        if re.match(r'^[\d\s\.\-\(\)]+$', line_clean):
+            continue
+            
+        if line_clean.lower() in ['receipt', 'thank you', 'thanks', 'visit', 'again', 'customer', 'copy']:
+            continue
+        
+        # Good company name indicators
+        if (len(line_clean) >= 4 and 
+            not re.match(r'^\d+$', line_clean) and
+            not re.match(r'^\d+\.\d+$', line_clean) and
+            any(c.isalpha() for c in line_clean)):
+            
+            clean_name = re.sub(r'[^\w\s&\'-]', ' ', line_clean)
+            clean_name = ' '.join(clean_name.split())
+            
+            # Score the company name
+            score = 0
+            if i < 3:
+                score += 10
+            if len(clean_name.split()) <= 4:
+                score += 5
+            if clean_name.upper() == clean_name:
+                score += 3
+            if any(word in clean_name.upper() for word in ['STORE', 'MARKET', 'SHOP', 'FOODS', 'MART']):
+                score += 5
+                
+            potential_companies.append({
+                'name': clean_name.title(),
+                'score': score,
+                'position': i
+            })
+    
+    if potential_companies:
+        best = max(potential_companies, key=lambda x: x['score'])
+        return best['name']
+    
+    return "Unknown Store"
+
+def legacy_find_total_amount(text):
+    """The original find_total_amount"""
+    
+    # Total patterns
+    total_patterns = [
+        r'(?i)(?:total|amount\s*due|balance\s*due|grand\s*total)\s*:?\s*\$?(\d{1,4}\.\d{2})',
+        r'(?i)total\s*\$?(\d{1,4}\.\d{2})',
+        r'(?i)\$(\d{1,4}\.\d{2})\s*(?:total|due)',
+        r'(?i)(?:final|net)\s*(?:total|amount)\s*:?\s*\$?(\d{1,4}\.\d{2})',
+        r'(?i)amount\s*:?\s*\$?(\d{1,4}\.\d{2})'
+    ]
+    
+    found_amounts = []
+    
+    # Look for explicit patterns
+    for pattern in total_patterns:
+        matches = re.findall(pattern, text)
+        for match in matches:
+            try:
+                amount = float(match)
+                if 0.50 <= amount <= 9999.99:
+                    found_amounts.append(amount)
+            except:
+                continue
+    
+    if found_amounts:
+        return max(found_amounts)
+    
+    # Look near total-related words
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        if re.search(r'\b(?:total|amount|due|balance|grand)\b', line, re.IGNORECASE):
+            search_lines = lines[max(0, i-1):i+3]
+            for search_line in search_lines:
+                amounts = re.findall(r'\$(\d{1,4}\.\d{2})', search_line)
+                for amount in amounts:
+                    try:
+                        val = float(amount)
+                        if 1.00 <= val <= 9999.99:
+                            found_amounts.append(val)
+                    except:
+                        continue
+    
+    if found_amounts:
+        return max(found_amounts)
+    
+    # Last resort: largest reasonable amount
+    all_amounts = re.findall(r'\$(\d{1,4}\.\d{2})', text)
+    valid_amounts = []
+    
+    for amount in all_amounts:
+        try:
+            val = float(amount)
+            if 5.00 <= val <= 999.99:
+                valid_amounts.append(val)
+        except:
+            continue
+    
+    return max(valid_amounts) if valid_amounts else 0.0
+
+
+def noisy(line, rng):
+    """OCR-style damage: dropped characters and confusable substitutions"""
+    if rng.random() < 0.2:
+        line = line.replace('O', '0').replace('l', '1')
+    if rng.random() < 0.1 and len(line) > 4:
+        i = rng.randrange(len(line))
+        line = line[:i] + line[i + 1:]
+    return line
+
+
+def synthetic_receipt(rng):
+    lines = [rng.choice(STORES)] + rng.sample(HEADERS, rng.randint(1, 4))
+    subtotal = 0.0
+    for _ in range(rng.randint(2, 12)):
+        amount = round(rng.uniform(0.5, 40), 2)
+        subtotal += amount
+        lines.append(f"{rng.choice(ITEMS)}  {amount:.2f}")
+    tax = round(subtotal * 0.08, 2)
+    total = subtotal + tax
+    style = rng.randint(0, 4)
+    lines.append(f"SUBTOTAL ${subtotal:.2f}")
+    lines.append(f"TAX ${tax:.2f}")
+    if style == 0:
+        lines.append(f"TOTAL ${total:.2f}")
+    elif style == 1:
+        lines.extend(['TOTAL', f"${total:.2f}"])
+    elif style == 2:
+        lines.append(f"AMOUNT DUE: {total:.2f}")
+    elif style == 3:
+        lines.append(f"BALANCE ${total:.2f}")
+    lines.extend(rng.sample(FOOTERS, 2))
+    return '\n'.join(noisy(line, rng) for line in lines)
+
+
+def timed(fn, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            fn(text)
+    return (time.perf_counter() - start) / (repeat * len(corpus)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    corpus = [synthetic_receipt(rng) for _ in range(args.texts)]
+
+    mismatches = 0
+    for text in corpus:
+        parsed = parse_receipt(text)
+        expected = (legacy_find_company_name(text), legacy_find_total_amount(text))
+        if (parsed['company_name'], parsed['total_amount']) != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH: legacy={expected} parser={(parsed['company_name'], parsed['total_amount'])}\n{text}\n")
+    print(f"Corpus: {len(corpus)} texts, {mismatches} mismatches")
+
+    legacy_us = timed(lambda t: (legacy_find_company_name(t), legacy_find_total_amount(t)), corpus, args.repeat)
+    parser_us = timed(parse_receipt, corpus, args.repeat)
+    print(f"legacy company+total:  {legacy_us:8.1f} us/text")
+    print(f"parse_receipt (all):   {parser_us:8.1f} us/text  ({legacy_us / parser_us:.1f}x)")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full-frame preprocessing + OCR vs text-region crops
+Runs both pipelines on synthetic receipt photos the way scan_receipt_image does and reports
+latency, pixels sent through preprocessing/OCR, how often region OCR fell back to the full
+frame and, when Tesseract (binary or tesserocr) is installed, how often the total and store
+name come out right.
+
+Usage: python benchmarks/bench_regions.py [--receipts 20] [--mode stack|blocks] [--no-ocr]
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import receipt_scanner
+from synthetic_receipts import make_corpus
+from receipt_regions import detect_text_regions
+from receipt_scanner import (decode_receipt_image, find_company_name, find_total_amount, ocr_rank, ocr_regions,
+                             preprocess, receipt_text_accepted, region_text_trusted, to_grayscale)
+from ocr_engine import ocr_backend, ocr_engine
+
+
+def _frame_ocr(gray, run_ocr):
+    processed, _ = preprocess(gray)
+    result = ocr_engine.extract(processed, accept=receipt_text_accepted) if run_ocr else None
+    return result, processed.shape[0] * processed.shape[1]
+
+
+def full_frame(gray, run_ocr):
+    result, pixels = _frame_ocr(gray, run_ocr)
+    return (result['text'] if result else ''), pixels, False
+
+
+def regions(gray, run_ocr):
+    """Same decisions as scan_receipt_image with RECEIPT_REGIONS=on, including its full-frame fallback"""
+    found = detect_text_regions(gray)
+    if found is None:
+        return full_frame(gray, run_ocr)[:2] + (True,)
+    if not run_ocr:
+        processed, _ = preprocess(found['image'], target_height=None)
+        return '', processed.shape[0] * processed.shape[1], False
+    result, _ = ocr_regions(found)
+    pixels = sum(block.size for block in found['blocks']) if receipt_scanner.REGION_OCR_MODE == 'blocks' \
+        else found['image'].size
+    if region_text_trusted(result):
+        return result['text'], pixels, False
+    frame_result, frame_pixels = _frame_ocr(gray, run_ocr)
+    if result is None or (frame_result is not None and ocr_rank(frame_result) >= ocr_rank(result)):
+        result = frame_result
+    return (result['text'] if result else ''), pixels + frame_pixels, True
+
+
+def run(pipeline, corpus, run_ocr):
+    latencies, pixels, totals_read, totals_ok, stores_ok, fallbacks = [], [], 0, 0, 0, 0
+    for data, truth in corpus:
+        start = time.perf_counter()
+        gray = to_grayscale(decode_receipt_image(data))
+        text, processed_pixels, fell_back = pipeline(gray, run_ocr)
+        latencies.append(time.perf_counter() - start)
+        pixels.append(processed_pixels)
+        fallbacks += fell_back
+        if run_ocr:
+            # Read: the OCR text holds the true total; ok: the parser also picked it
+            totals_read += f"{truth['total']:.2f}" in text
+            totals_ok += abs(find_total_amount(text) - truth['total']) < 0.005
+            stores_ok += truth['store'].split()[0].lower() in find_company_name(text).lower()
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+        'megapixels': round(statistics.mean(pixels) / 1e6, 2),
+        'total_read': round(totals_read / len(corpus), 3) if run_ocr else None,
+        'total_accuracy': round(totals_ok / len(corpus), 3) if run_ocr else None,
+        'store_accuracy': round(stores_ok / len(corpus), 3) if run_ocr else None,
+        'full_frame_fallbacks': fallbacks
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=20)
+    parser.add_argument('--mode', choices=['stack', 'blocks'], default='stack')
+    parser.add_argument('--no-ocr', action='store_true', help='time preprocessing only')
+    args = parser.parse_args()
+
+    receipt_scanner.REGION_OCR_MODE = args.mode
+    run_ocr = not args.no_ocr
+    if run_ocr and ocr_backend.name == 'pytesseract' and shutil.which('tesseract') is None:
+        print("tesseract not found, timing preprocessing only")
+        run_ocr = False
+
+    corpus = make_corpus(args.receipts)
+    print(f"OCR backend: {ocr_backend.name if run_ocr else 'none'}, {len(corpus)} receipts, mode {args.mode}")
+    print(f"{'pipeline':<12} {'p50 ms':>8} {'p95 ms':>8} {'Mpx':>6} {'total read':>11} {'total ok':>9} {'store ok':>9} {'fallback':>9}")
+    for name, pipeline in (('full-frame', full_frame), ('regions', regions)):
+        r = run(pipeline, corpus, run_ocr)
+        print(f"{name:<12} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['megapixels']:>6} "
+              f"{str(r['total_read']):>11} {str(r['total_accuracy']):>9} {str(r['store_accuracy']):>9} {r['full_frame_fallbacks']:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the full receipt scan pipeline on a synthetic corpus with known merchant and total
+Renders receipts with varied fonts, noise, rotation and blur, runs scan_receipt_image on each and
+writes a JSON report: p50/p95 latency, per-stage time, CPU seconds and extraction accuracy.
+Compare two runs with --compare baseline.json.
+
+Without Tesseract (or with --no-ocr) OCR is replaced by the receipt's true text, so latency covers
+detection, preprocessing and parsing, and accuracy covers parsing and merchant matching only.
+
+Usage: python benchmarks/bench_scan.py [--receipts 30] [--seed 1] [--preprocess balanced]
+                                       [--no-ocr] [--output run.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_receipts import make_corpus
+import receipt_scanner
+from receipt_scanner import ReceiptScanError, scan_receipt_image
+from ocr_engine import ocr_backend, ocr_engine
+from receipt_regions import RECEIPT_REGIONS, REGION_OCR_MODE
+from preprocessing import resolve_stages
+
+
+class BenchDB:
+    """Receipt database stand-in that keeps the last saved metadata instead of writing"""
+
+    def __init__(self):
+        self.last_metadata = None
+
+    def find_scan_by_image_hash(self, user_id, image_sha256):
+        return None
+
+    def save_receipt_scan(self, user_id, company_name, total_amount, confidence, extracted_text,
+                          scan_metadata=None, duplicate_of=None):
+        self.last_metadata = scan_metadata
+        return None
+
+
+class StageTimer:
+    """Wraps pipeline functions in receipt_scanner's namespace and accumulates their wall time per scan"""
+
+    def __init__(self):
+        self.current = defaultdict(float)
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[name] += time.perf_counter() - start
+        return timed
+
+    def take(self):
+        stages, self.current = dict(self.current), defaultdict(float)
+        return stages
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def instrument(timer, truth_text):
+    """Time the scan stages; with truth_text set, OCR returns it instead of running Tesseract"""
+    if truth_text is not None:
+        def fake_ocr(image, accept=None):
+            return {'text': truth_text[0], 'oem': 0, 'psm': 0, 'confidence': 100.0, 'passes_run': 0}
+        ocr_engine.extract = fake_ocr
+        ocr_engine.extract_blocks = lambda blocks, oem=3, psm=6: fake_ocr(None)
+
+    receipt_scanner.detect_text_regions = timer.wrap('detect_regions', receipt_scanner.detect_text_regions)
+    receipt_scanner.ocr_engine = type('TimedOCR', (), {
+        'extract': staticmethod(timer.wrap('ocr', ocr_engine.extract)),
+        'extract_blocks': staticmethod(timer.wrap('ocr', ocr_engine.extract_blocks))
+    })
+    receipt_scanner.parse_receipt = timer.wrap('parse', receipt_scanner.parse_receipt)
+    receipt_scanner.detect_popular_company = timer.wrap('merchant_match', receipt_scanner.detect_popular_company)
+
+
+def run(corpus, preprocess_profile, use_ocr):
+    timer = StageTimer()
+    truth_text = None if use_ocr else ['']
+    instrument(timer, truth_text)
+    db = BenchDB()
+
+    receipts = []
+    cpu_start = time.process_time()
+    for index, (image_bytes, truth) in enumerate(corpus):
+        if truth_text is not None:
+            truth_text[0] = truth['text']
+        db.last_metadata = None
+        start, cpu = time.perf_counter(), time.process_time()
+        try:
+            result = scan_receipt_image(image_bytes, f'synthetic-{index}.jpg', 'bench', db, use_cache=False,
+                                        preprocess_profile=preprocess_profile)
+        except ReceiptScanError as e:
+            result = {'company_name': None, 'total_amount': 0.0, 'error': str(e)}
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+        stages = timer.take()
+
+        metadata = db.last_metadata or {}
+        for name, ms in (metadata.get('preprocess') or {}).get('timings_ms', {}).items():
+            stages[f'preprocess.{name}'] = ms / 1000
+        receipts.append({
+            'index': index,
+            'store': truth['store'],
+            'known_store': truth['known_store'],
+            'total': truth['total'],
+            'found_company': result.get('company_name'),
+            'found_total': result.get('total_amount'),
+            'total_correct': abs((result.get('total_amount') or 0) - truth['total']) < 0.005,
+            'company_correct': company_correct(result.get('company_name'), truth['store']),
+            'regions': bool(metadata.get('ocr_regions')),
+            'latency_ms': round(elapsed * 1000, 1),
+            'cpu_ms': round(cpu * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 2) for name, seconds in stages.items()},
+            'error': result.get('error')
+        })
+    main_cpu = time.process_time() - cpu_start
+
+    # OCR pool workers and tesseract subprocesses only show up in RUSAGE_CHILDREN once reaped
+    if ocr_engine._pool is not None:
+        ocr_engine._pool.shutdown()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return receipts, main_cpu, children.ru_utime + children.ru_stime
+
+
+def company_correct(found, store):
+    if not found:
+        return False
+    found, store = found.lower(), store.lower()
+    # Catalog names are the merchant's full name ("Walmart Inc", "Costco Wholesale Corporation")
+    return store.split()[0] in found or found.split()[0] in store
+
+
+def summarize(receipts, main_cpu, child_cpu, args, use_ocr):
+    latencies = [r['latency_ms'] for r in receipts]
+    stage_names = sorted({name for r in receipts for name in r['stages_ms']})
+    known = [r for r in receipts if r['known_store']]
+    unknown = [r for r in receipts if not r['known_store']]
+
+    def rate(rows, key):
+        return round(sum(r[key] for r in rows) / len(rows), 3) if rows else None
+
+    return {
+        'config': {
+            'receipts': len(receipts),
+            'seed': args.seed,
+            'preprocess': args.preprocess or resolve_stages(None)[0],
+            'ocr': ocr_backend.name if use_ocr else 'ground-truth',
+            'ocr_workers': ocr_engine.workers,
+            'regions': REGION_OCR_MODE if RECEIPT_REGIONS else 'off',
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        },
+        'latency_ms': {
+            'p50': round(statistics.median(latencies), 1),
+            'p95': round(percentile(latencies, 0.95), 1),
+            'mean': round(statistics.mean(latencies), 1),
+            'max': round(max(latencies), 1)
+        },
+        'stages_ms': {
+            name: {
+                'mean': round(statistics.mean(r['stages_ms'].get(name, 0.0) for r in receipts), 2),
+                'p95': round(percentile([r['stages_ms'].get(name, 0.0) for r in receipts], 0.95), 2)
+            }
+            for name in stage_names
+        },
+        'cpu_seconds': {
+            'main_process': round(main_cpu, 2),
+            'ocr_children': round(child_cpu, 2),
+            'per_receipt': round((main_cpu + child_cpu) / len(receipts), 3)
+        },
+        'accuracy': {
+            'total': rate(receipts, 'total_correct'),
+            'company': rate(receipts, 'company_correct'),
+            'company_known_merchants': rate(known, 'company_correct'),
+            'company_unknown_merchants': rate(unknown, 'company_correct'),
+            'regions_used': rate(receipts, 'regions'),
+            'errors': sum(1 for r in receipts if r['error'])
+        },
+        'receipts': receipts
+    }
+
+
+def compare(report, baseline):
+    """Print metric deltas against an earlier report"""
+    rows = [('latency p50 ms', ('latency_ms', 'p50')), ('latency p95 ms', ('latency_ms', 'p95')),
+            ('cpu s/receipt', ('cpu_seconds', 'per_receipt')), ('total accuracy', ('accuracy', 'total')),
+            ('company accuracy', ('accuracy', 'company'))]
+    stage_names = sorted(set(report['stages_ms']) | set(baseline.get('stages_ms', {})))
+    rows += [(f'stage {name} ms', ('stages_ms', name, 'mean')) for name in stage_names]
+    print(f"\n{'metric':<32} {'baseline':>10} {'this run':>10} {'change':>9}")
+    for label, path in rows:
+        old, new = baseline, report
+        for key in path:
+            old = old.get(key, {}) if isinstance(old, dict) else {}
+            new = new.get(key, {}) if isinstance(new, dict) else {}
+        old = old if isinstance(old, (int, float)) else None
+        new = new if isinstance(new, (int, float)) else None
+        if old is None and new is None:
+            continue
+        if old is None or new is None:
+            print(f"{label:<32} {str(old if old is not None else '-'):>10} {str(new if new is not None else '-'):>10}")
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+        print(f"{label:<32} {old:>10} {new:>10} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--preprocess', help='profile or comma-separated stage list (default: PREPROCESS_PROFILE)')
+    parser.add_argument('--no-ocr', action='store_true', help='use the true text instead of running Tesseract')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='JSON report of an earlier run to diff against')
+    args = parser.parse_args()
+
+    use_ocr = not args.no_ocr
+    if use_ocr and ocr_backend.name == 'pytesseract' and shutil.which('tesseract') is None:
+        print("tesseract not found, using ground-truth text for OCR", file=sys.stderr)
+        use_ocr = False
+
+    corpus = make_corpus(args.receipts, seed=args.seed, vary=True)
+    # The scanner's progress prints would drown the report
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        receipts, main_cpu, child_cpu = run(corpus, args.preprocess, use_ocr)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    report = summarize(receipts, main_cpu, child_cpu, args, use_ocr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}: p50 {report['latency_ms']['p50']}ms, p95 {report['latency_ms']['p95']}ms, "
+              f"total accuracy {report['accuracy']['total']}, company accuracy {report['accuracy']['company']}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: peak memory and time to decode a receipt photo and prepare it for OCR
+Compares the old decode (full-size RGB, NumPy copy, RGB->BGR->gray) with the draft-mode
+grayscale decode. Each measurement runs in a forked child so its peak RSS (from wait4) is
+its own; the RSS of an idle child is subtracted.
+
+Usage: python benchmarks/bench_upload_memory.py [--megapixels 12] [--runs 3] [--preprocess fast]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cv2
+import numpy as np
+from PIL import Image
+from synthetic_receipts import photograph, receipt_lines, render_paper
+from receipt_regions import detect_text_regions
+from receipt_scanner import decode_receipt_image, to_grayscale
+from preprocessing import preprocess
+
+
+def legacy_gray(image_bytes):
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    opencv_img = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(opencv_img, cv2.COLOR_BGR2GRAY)
+
+
+def bounded_gray(image_bytes):
+    return to_grayscale(decode_receipt_image(image_bytes))
+
+
+def prepare(decode, profile):
+    def run(image_bytes):
+        gray = decode(image_bytes)
+        regions = detect_text_regions(gray)
+        preprocess(regions['image'] if regions else gray, profile, target_height=None if regions else 1500)
+    return run
+
+
+def measure(fn, image_bytes):
+    """(peak RSS in KB, seconds) of fn(image_bytes) in a forked child"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        start = time.perf_counter()
+        fn(image_bytes)
+        os.write(write_fd, str(time.perf_counter() - start).encode())
+        os._exit(0)
+    os.close(write_fd)
+    elapsed = float(os.read(read_fd, 64) or 0)
+    os.close(read_fd)
+    _, status, usage = os.wait4(pid, 0)
+    if status != 0:
+        raise RuntimeError(f'benchmark child failed with status {status}')
+    return usage.ru_maxrss, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--preprocess', default='fast')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    height = int((args.megapixels * 1e6 * 4 / 3) ** 0.5)
+    frame = (height * 3 // 4, height)
+    lines, _ = receipt_lines(rng)
+    photo = photograph(render_paper(lines, font_size=60), rng, frame=frame)
+    buffer = io.BytesIO()
+    photo.save(buffer, 'JPEG', quality=92)
+    image_bytes = buffer.getvalue()
+    del photo
+    print(f"Photo: {frame[0]}x{frame[1]}, {len(image_bytes) / 1e6:.1f} MB JPEG")
+
+    idle_kb, _ = measure(lambda data: None, image_bytes)
+    cases = [
+        ('legacy decode', legacy_gray),
+        ('bounded decode', bounded_gray),
+        ('legacy decode + regions + preprocess', prepare(legacy_gray, args.preprocess)),
+        ('bounded decode + regions + preprocess', prepare(bounded_gray, args.preprocess))
+    ]
+    print(f"{'case':<40} {'peak RSS MB':>12} {'time ms':>9}")
+    for name, fn in cases:
+        results = [measure(fn, image_bytes) for _ in range(args.runs)]
+        peak_mb = (max(kb for kb, _ in results) - idle_kb) / 1024
+        elapsed = statistics.median(seconds for _, seconds in results)
+        print(f"{name:<40} {peak_mb:>12.1f} {elapsed * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Synthetic receipt photos with known ground truth, for pipeline benchmarks"""
+import io
+import random
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+KNOWN_STORES = ['STARBUCKS', 'TARGET', 'WALMART', 'CHIPOTLE', 'COSTCO WHOLESALE', 'CVS PHARMACY']
+OTHER_STORES = ['CORNER MARKET', 'BLUE DOOR CAFE', 'MAPLE HARDWARE', 'SUNRISE FOODS']
+# Receipt printers vary; any of these that are installed are used, else Pillow's built-in font
+FONT_NAMES = ['DejaVuSansMono.ttf', 'DejaVuSansMono-Bold.ttf', 'DejaVuSans.ttf', 'LiberationMono-Regular.ttf',
+              'FreeMono.ttf', 'cour.ttf']
+ITEMS = ['MILK', 'BREAD', 'EGGS', 'COFFEE', 'BANANAS', 'TOWELS', 'SOAP', 'RICE', 'APPLES', 'CHEESE']
+
+
+def receipt_lines(rng):
+    """Text lines and ground truth for one receipt"""
+    store = rng.choice(KNOWN_STORES + OTHER_STORES)
+    lines = [store, f'{rng.randint(10, 999)} MAIN STREET', f'{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2024']
+    subtotal = 0.0
+    for _ in range(rng.randint(3, 10)):
+        amount = round(rng.uniform(0.99, 25.0), 2)
+        subtotal += amount
+        lines.append(f'{rng.choice(ITEMS):<14}{amount:>8.2f}')
+    tax = round(subtotal * 0.08, 2)
+    total = round(subtotal + tax, 2)
+    lines += [f"{'SUBTOTAL':<14}{subtotal:>8.2f}", f"{'TAX':<14}{tax:>8.2f}", f"{'TOTAL':<14}${total:>7.2f}",
+              'THANK YOU']
+    return lines, {'store': store, 'total': total, 'known_store': store in KNOWN_STORES}
+
+
+def load_font(name, size):
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def available_fonts():
+    fonts = []
+    for name in FONT_NAMES:
+        try:
+            ImageFont.truetype(name, 12)
+            fonts.append(name)
+        except OSError:
+            continue
+    return fonts or [None]
+
+
+def render_paper(lines, font_size=22, font_name=None):
+    font = load_font(font_name, font_size) if font_name else ImageFont.load_default(size=font_size)
+    line_height = int(font_size * 1.5)
+    width = int(font_size * 16)
+    paper = Image.new('L', (width, line_height * (len(lines) + 2)), 245)
+    draw = ImageDraw.Draw(paper)
+    for i, line in enumerate(lines):
+        draw.text((font_size, line_height * (i + 1)), line, fill=20, font=font)
+    return paper
+
+
+def photograph(paper, rng, frame=(1200, 1600), skew=4.0, noise=0.0, blur=0.6):
+    """Place the paper on a textured background, rotated and slightly blurred, like a phone photo"""
+    background = np.clip(rng.gauss(90, 5) + np.random.default_rng(rng.randint(0, 10 ** 6)).normal(
+        0, 18, (frame[1], frame[0])), 0, 255).astype(np.uint8)
+    photo = Image.fromarray(background).filter(ImageFilter.GaussianBlur(2))
+
+    scale = min(frame[0] * 0.7 / paper.width, frame[1] * 0.85 / paper.height)
+    paper = paper.resize((int(paper.width * scale), int(paper.height * scale)), Image.BICUBIC)
+    mask = Image.new('L', paper.size, 255)
+    angle = rng.uniform(-skew, skew)
+    paper = paper.rotate(angle, expand=True, resample=Image.BICUBIC, fillcolor=0)
+    mask = mask.rotate(angle, expand=True, fillcolor=0)
+    offset = ((frame[0] - paper.width) // 2 + rng.randint(-40, 40), (frame[1] - paper.height) // 2 + rng.randint(-40, 40))
+    photo.paste(paper, offset, mask)
+    photo = photo.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        # Sensor noise over the whole frame, paper included
+        grain = np.random.default_rng(rng.randint(0, 10 ** 6)).normal(0, noise, (frame[1], frame[0]))
+        photo = Image.fromarray(np.clip(np.asarray(photo, dtype=np.float64) + grain, 0, 255).astype(np.uint8))
+    return photo.convert('RGB')
+
+
+def make_receipt(rng, vary=False, **kwargs):
+    """(JPEG bytes, ground truth) for one synthetic receipt photo; vary=True randomizes font, noise and blur"""
+    lines, truth = receipt_lines(rng)
+    paper_options = {}
+    if vary:
+        paper_options = {'font_size': rng.randint(18, 28), 'font_name': rng.choice(available_fonts())}
+        kwargs = dict({'skew': 6.0, 'noise': rng.uniform(0, 12), 'blur': rng.uniform(0.3, 1.4)}, **kwargs)
+        truth['variation'] = dict(paper_options, noise=round(kwargs['noise'], 1), blur=round(kwargs['blur'], 2))
+    photo = photograph(render_paper(lines, **paper_options), rng, **kwargs)
+    buffer = io.BytesIO()
+    photo.save(buffer, 'JPEG', quality=88)
+    truth['text'] = '\n'.join(lines)
+    return buffer.getvalue(), truth
+
+
+def make_corpus(count, seed=1, **kwargs):
+    rng = random.Random(seed)
+    return [make_receipt(rng, **kwargs) for _ in range(count)]
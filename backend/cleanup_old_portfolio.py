@@ -9,7 +9,7 @@ def cleanup_old_portfolio():
     """Remove portfolio and total_value from all users"""
     db = ReceiptDatabase()
     
-    if db.client is None:
+    if not db.is_connected:
         print("❌ Database not connected!")
         return
     
@@ -0,0 +1,131 @@
+"""Compiled merchant matcher: one Aho-Corasick pass for variations, a suffix index for partial words"""
+import re
+from bisect import bisect_left
+from collections import deque
+
+# Partial matches shorter than this are too ambiguous ('co', 'in', ...)
+MIN_PARTIAL_LENGTH = 3
+
+_WORD_RE = re.compile(r'\b\w+\b')
+_MAX_CHAR = '\U0010ffff'
+
+
+class CompanyMatcher:
+    """Finds the highest-priority merchant in OCR text, where priority is catalog order then variation order"""
+
+    def __init__(self, companies):
+        # Every variation gets an ordinal in priority order, so "first match wins" becomes "lowest ordinal"
+        self.variations = []  # ordinal -> (company_key, variation)
+        self.companies = companies
+        for company_key, company_data in companies.items():
+            for variation in company_data['variations']:
+                self.variations.append((company_key, variation))
+        self._patterns = [variation.lower() for _, variation in self.variations]
+        self._build_automaton()
+        self._build_suffix_index()
+
+    def _build_automaton(self):
+        """Aho-Corasick trie; each state keeps the lowest ordinal of any variation ending there"""
+        goto = [{}]
+        best = [None]
+        for ordinal, variation in enumerate(self._patterns):
+            state = 0
+            for char in variation:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    best.append(None)
+                state = next_state
+            if best[state] is None or ordinal < best[state]:
+                best[state] = ordinal
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                # Fold outputs along the failure link so the scan needs no output chain walk
+                inherited = best[fail[next_state]]
+                if inherited is not None and (best[next_state] is None or inherited < best[next_state]):
+                    best[next_state] = inherited
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+
+    def _build_suffix_index(self):
+        """Sorted suffixes of single-word variations: 'word in variation' becomes a prefix range lookup"""
+        entries = []
+        for ordinal, variation in enumerate(self._patterns):
+            if len(variation.split()) != 1:
+                continue
+            for start in range(len(variation) - MIN_PARTIAL_LENGTH + 1):
+                entries.append((variation[start:], ordinal))
+        entries.sort()
+        self._suffixes = [suffix for suffix, _ in entries]
+        self._suffix_ordinals = [ordinal for _, ordinal in entries]
+
+    def find_variation(self, text_lower):
+        """Lowest ordinal of any variation occurring in the text, in one pass; None if none occur"""
+        goto, fail, best = self._goto, self._fail, self._best
+        found = None
+        state = 0
+        for char in text_lower:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            ordinal = best[state]
+            if ordinal is not None and (found is None or ordinal < found):
+                found = ordinal
+                if found == 0:
+                    break
+        return found
+
+    def _partial_ordinal(self, word):
+        """Lowest ordinal of a single-word variation containing word"""
+        lo = bisect_left(self._suffixes, word)
+        hi = bisect_left(self._suffixes, word + _MAX_CHAR, lo)
+        return min(self._suffix_ordinals[lo:hi]) if hi > lo else None
+
+    def find_partial(self, text_lower):
+        """(ordinal, word) for the best word that is part of a single-word variation, or None"""
+        found = None
+        for match in _WORD_RE.finditer(text_lower):
+            word = match.group()
+            if len(word) < MIN_PARTIAL_LENGTH:
+                continue
+            ordinal = self._partial_ordinal(word)
+            # Strict '<' keeps the earliest word for equal ordinals
+            if ordinal is not None and (found is None or ordinal < found[0]):
+                found = (ordinal, word)
+        return found
+
+    def _result(self, ordinal, confidence, matched_text):
+        company_data = self.companies[self.variations[ordinal][0]]
+        return {
+            'name': company_data['name'],
+            'ticker': company_data['ticker'],
+            'logo': company_data['logo'],
+            'confidence': confidence,
+            'matched_text': matched_text
+        }
+
+    def match(self, text):
+        """Same result as the original variation/partial-match loops over the catalog"""
+        text_lower = text.lower()
+        ordinal = self.find_variation(text_lower)
+        if ordinal is not None:
+            return self._result(ordinal, 'high', self.variations[ordinal][1])
+
+        # A variation inside a word would already have matched above, so only 'word in variation' is left
+        partial = self.find_partial(text_lower)
+        if partial is not None:
+            return self._result(partial[0], 'medium', partial[1])
+        return None
@@ -1,233 +1,262 @@
-from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 from bson import ObjectId
-import os
-from dotenv import load_dotenv
+from mongo_registry import mongo_registry
+from exports import RECEIPT_EXPORT_FIELDS, date_range_filter, export_chunks
+from pagination import InvalidCursorError, keyset_page
+from receipt_texts import ReceiptTextStore, text_document
+from spending_rollups import SpendingRollups, version_tag
 
-load_dotenv()
+# Fields the receipt list returns by default; OCR text and scan metadata come from get_receipt()
+RECEIPT_SUMMARY_FIELDS = ['company_name', 'total_amount', 'confidence', 'scan_date', 'duplicate_of',
+                          'metadata.ticker', 'metadata.logo', 'metadata.receipt_date']
 
 class ReceiptDatabase:
-    def __init__(self):
-        self.mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
-        self.database_name = os.getenv('DATABASE_NAME', 'receipt_scanner')
-        
-        # Log environment check at startup
-        print("=" * 60)
-        print("DATABASE INITIALIZATION")
-        print("=" * 60)
-        print(f"MONGO_URI: {'✅ Set' if self.mongo_uri and self.mongo_uri != 'mongodb://localhost:27017/' else '❌ Missing or default'}")
-        if self.mongo_uri and self.mongo_uri != 'mongodb://localhost:27017/':
-            # Show preview (first 40 chars + last 20 chars for security)
-            preview = self.mongo_uri[:40] + "..." + self.mongo_uri[-20:] if len(self.mongo_uri) > 60 else self.mongo_uri
-            print(f"  Preview: {preview}")
-        print(f"DATABASE_NAME: {'✅ Set' if self.database_name else '❌ Missing'}")
-        if self.database_name:
-            print(f"  Value: {self.database_name}")
-        print("=" * 60)
+    def __init__(self, registry=None):
+        # Connection handling lives in the registry: every ReceiptDatabase in the process shares one client
+        self.registry = registry or mongo_registry
+        self.database_name = self.registry.database_name
         self.collection_name = 'scanned_receipts'
-        
-        # LAZY CONNECTION: Don't test during init (Render free tier cold starts are slow)
-        # Connection will be tested on first actual use
-        self.client = None
-        self.db = None
-        self._connection_attempted = False
-        
-        try:
-            # Check if using local or Atlas MongoDB
-            if 'localhost' in self.mongo_uri:
-                # Local MongoDB connection (no SSL)
-                print("Configuring local MongoDB connection...")
-                self._mongo_uri = self.mongo_uri
-                self._is_local = True
-            else:
-                # MongoDB Atlas connection with SSL
-                print("Configuring MongoDB Atlas connection...")
-                print(f"MongoDB URI: {self.mongo_uri[:50]}...")
-                
-                # Ensure URI has proper SSL parameters
-                mongo_uri = self.mongo_uri
-                if 'ssl=true' not in mongo_uri.lower() and 'tls=true' not in mongo_uri.lower():
-                    # Add SSL parameters if not present
-                    separator = '&' if '?' in mongo_uri else '?'
-                    mongo_uri = f"{mongo_uri}{separator}tls=true"
-                
-                self._mongo_uri = mongo_uri
-                self._is_local = False
-            
-            print("✅ MongoDB client configured (lazy connection - will connect on first use)")
-            print("   This helps with Render free tier cold starts")
-            
-        except Exception as e:
-            error_msg = str(e)
-            print("=" * 60)
-            print("❌ MONGODB CONFIGURATION FAILED")
-            print("=" * 60)
-            print(f"Error: {error_msg}")
-            print(f"MONGO_URI set: {'Yes' if self.mongo_uri and self.mongo_uri != 'mongodb://localhost:27017/' else 'No'}")
-            if self.mongo_uri:
-                print(f"MONGO_URI preview: {self.mongo_uri[:50]}...")
-            print(f"DATABASE_NAME: {self.database_name}")
-            print("=" * 60)
-            self.client = None
-            self.db = None
+        # Dashboard totals, kept up to date by save/update/delete so reads are one point lookup
+        self.rollups = SpendingRollups(self)
+        # OCR text lives in its own collection so listing receipts never reads it
+        self.texts = ReceiptTextStore(self)
+    
+    @property
+    def client(self):
+        """This process's MongoClient, or None before the first successful connection"""
+        return self.registry.current_client()
+    
+    @property
+    def db(self):
+        client = self.client
+        return client[self.database_name] if client is not None else None
+    
+    @property
+    def collection(self):
+        db = self.db
+        return db[self.collection_name] if db is not None else None
     
     def _ensure_connection(self):
         """Lazy connection - connect on first use (better for Render free tier)"""
-        if self.client is not None:
-            return True
-        
-        if self._connection_attempted:
-            return False
-        
-        self._connection_attempted = True
-        
-        try:
-            if self._is_local:
-                # Local MongoDB connection
-                print("Connecting to local MongoDB...")
-                self.client = MongoClient(
-                    self._mongo_uri,
-                    serverSelectionTimeoutMS=10000,
-                    connectTimeoutMS=10000,
-                    socketTimeoutMS=10000
-                )
-            else:
-                # MongoDB Atlas connection - try multiple methods
-                print("Attempting MongoDB Atlas connection (Render-friendly with long timeouts)...")
-                
-                # Method 1: Try with explicit TLS
-                try:
-                    import ssl
-                    import certifi
-                    print("Trying TLS with certifi...")
-                    self.client = MongoClient(
-                        self._mongo_uri,
-                        tls=True,
-                        tlsCAFile=certifi.where(),
-                        serverSelectionTimeoutMS=60000,  # 60s for Render cold starts
-                        connectTimeoutMS=60000,
-                        socketTimeoutMS=60000,
-                        retryWrites=True,
-                        retryReads=True,
-                        maxPoolSize=10
-                    )
-                    # Test connection (with timeout)
-                    self.client.admin.command('ping')
-                    print("✅ MongoDB Atlas connection successful (TLS with certifi)!")
-                except Exception as ssl_error:
-                    print(f"⚠️  TLS with certifi failed: {str(ssl_error)[:150]}...")
-                    # Method 2: Try URI-only (pymongo handles SSL automatically)
-                    try:
-                        print("Trying URI-only connection (pymongo auto-SSL)...")
-                        self.client = MongoClient(
-                            self._mongo_uri,
-                            serverSelectionTimeoutMS=60000,  # 60s for Render cold starts
-                            connectTimeoutMS=60000,
-                            socketTimeoutMS=60000,
-                            retryWrites=True,
-                            retryReads=True,
-                            maxPoolSize=10
-                        )
-                        # Test connection
-                        self.client.admin.command('ping')
-                        print("✅ MongoDB Atlas connection successful (URI-only)!")
-                    except Exception as fallback_error:
-                        print(f"❌ All connection attempts failed: {str(fallback_error)[:200]}...")
-                        print("⚠️  Will retry on next request")
-                        self.client = None
-                        self._connection_attempted = False  # Allow retry
-                        return False
-            
-            if self.client:
-                self.db = self.client[self.database_name]
-                self.collection = self.db[self.collection_name]
-                print(f"✅ Connected to database: {self.database_name}")
-                return True
-            else:
-                return False
-                
-        except Exception as e:
-            error_msg = str(e)
-            print("=" * 60)
-            print("❌ MONGODB CONNECTION ATTEMPT FAILED")
-            print("=" * 60)
-            print(f"Error: {error_msg}")
-            print(f"MONGO_URI set: {'Yes' if self.mongo_uri and self.mongo_uri != 'mongodb://localhost:27017/' else 'No'}")
-            if self.mongo_uri:
-                print(f"MONGO_URI preview: {self.mongo_uri[:50]}...")
-            print(f"DATABASE_NAME: {self.database_name}")
-            print("=" * 60)
-            print("⚠️  Will retry on next request (Render cold starts can be slow)")
-            print("=" * 60)
-            self.client = None
-            self.db = None
-            self._connection_attempted = False  # Allow retry
-            return False
+        return self.registry.get_client() is not None
     
     @property
     def is_connected(self):
         """Check if database is connected, attempting connection if needed"""
-        if self.client is not None:
-            return True
         return self._ensure_connection()
     
     def create_indexes(self):
-        """Create database indexes for better query performance"""
+        """Apply pending index migrations (same as `python migrations.py up`, which runs on each deploy)"""
+        from migrations import run_migrations
         try:
-            self.collection.create_index([("user_id", 1)])
-            self.collection.create_index([("scan_date", -1)])
-            self.collection.create_index([("company_name", 1)])
-            self.collection.create_index([("total_amount", 1)])
-            self.collection.create_index([("confidence", 1)])
-            print("Database indexes created")
+            applied = run_migrations(self.db)
+            print(f"Database indexes created ({len(applied)} migration(s) applied)")
         except Exception as e:
             print(f"Index creation failed: {e}")
     
-    def save_receipt_scan(self, user_id, company_name, total_amount, confidence, extracted_text, scan_metadata=None):
-        """Save a receipt scan to database"""
+    def new_receipt_document(self, user_id, company_name, total_amount, confidence, extracted_text,
+                             scan_metadata=None, duplicate_of=None):
+        """Receipt document as stored by save_receipt_scan (a slim one pointing at the original for duplicates)"""
+        receipt_document = {
+            'user_id': user_id,
+            'company_name': company_name,
+            'total_amount': float(total_amount),
+            'confidence': confidence,
+            'extracted_text': extracted_text,
+            'scan_date': datetime.now(timezone.utc),
+            'metadata': scan_metadata or {},
+            'created_at': datetime.now(timezone.utc),
+            'updated_at': datetime.now(timezone.utc)
+        }
+        if duplicate_of:
+            # The OCR text already lives on the original receipt
+            del receipt_document['extracted_text']
+            receipt_document['duplicate_of'] = duplicate_of
+        return receipt_document
+    
+    @staticmethod
+    def _split_texts(receipt_documents):
+        """Move extracted_text off receipt documents into receipt_texts documents (same _id)"""
+        text_documents = []
+        for document in receipt_documents:
+            document.setdefault('_id', ObjectId())
+            if 'extracted_text' in document:
+                text = document.pop('extracted_text')
+                text_documents.append(text_document(document['_id'], document['user_id'], text))
+                document['text_size'] = len(text or '')
+        return text_documents
+    
+    def save_receipt_scan(self, user_id, company_name, total_amount, confidence, extracted_text, scan_metadata=None,
+                          duplicate_of=None):
+        """Save a receipt scan to database (a slim document pointing at the original for duplicate uploads)"""
         if not self._ensure_connection():
             return None
         
         try:
-            receipt_document = {
-                'user_id': user_id,
-                'company_name': company_name,
-                'total_amount': float(total_amount),
-                'confidence': confidence,
-                'extracted_text': extracted_text,
-                'scan_date': datetime.now(timezone.utc),
-                'metadata': scan_metadata or {},
-                'created_at': datetime.now(timezone.utc),
-                'updated_at': datetime.now(timezone.utc)
-            }
-            
+            receipt_document = self.new_receipt_document(user_id, company_name, total_amount, confidence,
+                                                         extracted_text, scan_metadata, duplicate_of)
+            # Text first: an orphaned text is harmless, a receipt whose text never arrives is not
+            self.texts.save_many(self._split_texts([receipt_document]))
             result = self.collection.insert_one(receipt_document)
             print(f" Receipt saved with ID: {result.inserted_id}")
+            self.rollups.apply(user_id, added=[receipt_document])
             return str(result.inserted_id)
             
         except Exception as e:
             print(f" Failed to save receipt: {e}")
             return None
     
-    def get_user_receipts(self, user_id, limit=50, skip=0):
-        """Get all receipts for a user with pagination"""
-        if not self._ensure_connection():
+    def save_receipt_scans(self, receipt_documents):
+        """Insert many receipt documents in one round trip; returns the ids that were saved"""
+        if not receipt_documents or not self._ensure_connection():
+            return []
+        
+        try:
+            self.texts.save_many(self._split_texts(receipt_documents))
+            result = self.collection.insert_many(receipt_documents, ordered=False)
+            print(f" Saved {len(result.inserted_ids)} receipts")
+            self._apply_saved_to_rollups(receipt_documents)
+            return [str(receipt_id) for receipt_id in result.inserted_ids]
+        except BulkWriteError as e:
+            failed = {receipt_documents[error['index']]['_id'] for error in e.details.get('writeErrors', [])}
+            print(f" Failed to save {len(failed)} of {len(receipt_documents)} receipts")
+            self.texts.delete(failed)
+            saved = [doc for doc in receipt_documents if doc.get('_id') not in failed]
+            self._apply_saved_to_rollups(saved)
+            return [str(doc['_id']) for doc in saved]
+        except Exception as e:
+            print(f" Failed to save receipts: {e}")
             return []
+    
+    def _apply_saved_to_rollups(self, receipt_documents):
+        by_user = {}
+        for document in receipt_documents:
+            by_user.setdefault(document['user_id'], []).append(document)
+        for user_id, documents in by_user.items():
+            self.rollups.apply(user_id, added=documents)
+    
+    def find_scan_by_image_hash(self, user_id, image_sha256):
+        """Original (non-duplicate) scan of an identical image uploaded by this user, or None"""
+        if not self._ensure_connection():
+            return None
         
         try:
-            receipts = list(self.collection.find(
-                {'user_id': user_id}
-            ).sort('scan_date', -1).skip(skip).limit(limit))
+            receipt = self.collection.find_one({
+                'user_id': user_id,
+                'metadata.image_sha256': image_sha256,
+                'duplicate_of': {'$exists': False}
+            })
+            if receipt is not None and 'extracted_text' not in receipt:
+                receipt['extracted_text'] = self.texts.load(receipt['_id']) or ''
+            return receipt
+        except Exception as e:
+            print(f" Failed to look up receipt by image hash: {e}")
+            return None
+    
+    def get_receipt(self, receipt_id, user_id):
+        """One receipt in full, OCR text included (None if it does not exist or is not this user's)"""
+        if not self._ensure_connection() or not ObjectId.is_valid(receipt_id):
+            return None
+        
+        try:
+            receipt = self.collection.find_one({'_id': ObjectId(receipt_id), 'user_id': user_id})
+            if receipt is None:
+                return None
+            if 'extracted_text' not in receipt:
+                # Duplicates share the original receipt's text
+                text_id = ObjectId(receipt['duplicate_of']) if receipt.get('duplicate_of') else receipt['_id']
+                receipt['extracted_text'] = self.texts.load(text_id) or ''
+            receipt['_id'] = str(receipt['_id'])
+            return receipt
+        except Exception as e:
+            print(f" Failed to get receipt: {e}")
+            return None
+    
+    def get_user_receipts_page(self, user_id, limit=50, cursor=None, skip=0, fields=None):
+        """A page of a user's receipts, newest first; returns (receipts, next_cursor)
+        
+        Pass the previous page's next_cursor to continue; skip is the legacy page-number path.
+        Only RECEIPT_SUMMARY_FIELDS (or the given fields) are read. Raises InvalidCursorError for a bad cursor.
+        """
+        if not self._ensure_connection():
+            return [], None
+        
+        try:
+            # scan_date is always read: the next cursor is built from it
+            projection = dict.fromkeys(['scan_date'] + list(fields or RECEIPT_SUMMARY_FIELDS), 1)
+            receipts, next_cursor = keyset_page(self.collection, {'user_id': user_id}, 'scan_date', limit,
+                                                cursor=cursor, skip=skip, projection=projection)
             
             # Convert ObjectId to string for JSON serialization
             for receipt in receipts:
                 receipt['_id'] = str(receipt['_id'])
             
-            return receipts
+            return receipts, next_cursor
             
+        except InvalidCursorError:
+            raise
         except Exception as e:
             print(f"Failed to get user receipts: {e}")
-            return []
+            return [], None
+    
+    def _attach_texts(self, receipts):
+        # One lookup per export batch; duplicates share the original receipt's text
+        text_ids = {receipt['_id']: ObjectId(receipt['duplicate_of']) if receipt.get('duplicate_of') else receipt['_id']
+                    for receipt in receipts if 'extracted_text' not in receipt}
+        texts = self.texts.load_many(set(text_ids.values()))
+        for receipt in receipts:
+            if receipt['_id'] in text_ids:
+                receipt['extracted_text'] = texts.get(text_ids[receipt['_id']], '')
+    
+    def export_receipts(self, user_id, export_format, start=None, end=None, include_text=False):
+        """Chunks of a user's receipts as NDJSON/CSV, oldest first (raises ValueError for a bad date)"""
+        query = {'user_id': user_id, **date_range_filter('scan_date', start, end)}
+        fields = RECEIPT_EXPORT_FIELDS + (['extracted_text'] if include_text else [])
+        return export_chunks(self.collection, query, 'scan_date', fields, export_format,
+                             enrich=self._attach_texts if include_text else None)
+    
+    def get_user_receipts(self, user_id, limit=50, skip=0, fields=None):
+        """Get all receipts for a user with pagination"""
+        return self.get_user_receipts_page(user_id, limit=limit, skip=skip, fields=fields)[0]
+    
+    @staticmethod
+    def _stats_from_rollup(rollup):
+        total_receipts = rollup.get('total_receipts', 0)
+        return {
+            'total_receipts': total_receipts,
+            'total_spent': rollup.get('total_spent', 0.0),
+            'avg_amount': rollup['total_spent'] / total_receipts if total_receipts else 0.0,
+            'max_amount': rollup.get('max_amount', 0.0),
+            'min_amount': rollup.get('min_amount', 0.0),
+            'high_confidence_count': rollup.get('high_confidence_count', 0),
+            'medium_confidence_count': rollup.get('medium_confidence_count', 0),
+            'low_confidence_count': rollup.get('low_confidence_count', 0)
+        }
+    
+    @staticmethod
+    def _companies_from_rollup(rollup):
+        companies = rollup.get('companies', {}).values()
+        top = sorted(companies, key=lambda bucket: bucket['total_spent'], reverse=True)[:20]
+        return [{
+            'total_spent': bucket['total_spent'],
+            'receipt_count': bucket['receipt_count'],
+            'avg_amount': bucket['total_spent'] / bucket['receipt_count'],
+            'last_visit': bucket['last_visit'],
+            'company_name': bucket['company_name']
+        } for bucket in top]
+    
+    @staticmethod
+    def _months_from_rollup(rollup, months):
+        buckets = rollup.get('months', {}).values()
+        recent = sorted(buckets, key=lambda bucket: (bucket['year'], bucket['month']), reverse=True)[:months]
+        return [{
+            'year': bucket['year'],
+            'month': bucket['month'],
+            'total_spent': bucket['total_spent'],
+            'receipt_count': bucket['receipt_count'],
+            'avg_amount': bucket['total_spent'] / bucket['receipt_count']
+        } for bucket in recent]
     
     def get_user_stats(self, user_id):
         """Get dashboard statistics for a user"""
@@ -235,46 +264,7 @@ class ReceiptDatabase:
             return None
         
         try:
-            # Aggregation pipeline for user stats
-            pipeline = [
-                {'$match': {'user_id': user_id}},
-                {'$group': {
-                    '_id': None,
-                    'total_receipts': {'$sum': 1},
-                    'total_spent': {'$sum': '$total_amount'},
-                    'avg_amount': {'$avg': '$total_amount'},
-                    'max_amount': {'$max': '$total_amount'},
-                    'min_amount': {'$min': '$total_amount'},
-                    'high_confidence_count': {
-                        '$sum': {'$cond': [{'$eq': ['$confidence', 'high']}, 1, 0]}
-                    },
-                    'medium_confidence_count': {
-                        '$sum': {'$cond': [{'$eq': ['$confidence', 'medium']}, 1, 0]}
-                    },
-                    'low_confidence_count': {
-                        '$sum': {'$cond': [{'$eq': ['$confidence', 'low']}, 1, 0]}
-                    }
-                }}
-            ]
-            
-            result = list(self.collection.aggregate(pipeline))
-            
-            if result:
-                stats = result[0]
-                stats.pop('_id', None)  # Remove the _id field
-                return stats
-            else:
-                return {
-                    'total_receipts': 0,
-                    'total_spent': 0.0,
-                    'avg_amount': 0.0,
-                    'max_amount': 0.0,
-                    'min_amount': 0.0,
-                    'high_confidence_count': 0,
-                    'medium_confidence_count': 0,
-                    'low_confidence_count': 0
-                }
-                
+            return self._stats_from_rollup(self.rollups.get(user_id))
         except Exception as e:
             print(f" Failed to get user stats: {e}")
             return None
@@ -285,27 +275,7 @@ class ReceiptDatabase:
             return []
         
         try:
-            pipeline = [
-                {'$match': {'user_id': user_id}},
-                {'$group': {
-                    '_id': '$company_name',
-                    'total_spent': {'$sum': '$total_amount'},
-                    'receipt_count': {'$sum': 1},
-                    'avg_amount': {'$avg': '$total_amount'},
-                    'last_visit': {'$max': '$scan_date'}
-                }},
-                {'$sort': {'total_spent': -1}},
-                {'$limit': 20}
-            ]
-            
-            result = list(self.collection.aggregate(pipeline))
-            
-            # Rename _id to company_name for clarity
-            for item in result:
-                item['company_name'] = item.pop('_id')
-            
-            return result
-            
+            return self._companies_from_rollup(self.rollups.get(user_id))
         except Exception as e:
             print(f" Failed to get company breakdown: {e}")
             return []
@@ -316,52 +286,83 @@ class ReceiptDatabase:
             return []
         
         try:
-            pipeline = [
-                {'$match': {'user_id': user_id}},
-                {'$group': {
-                    '_id': {
-                        'year': {'$year': '$scan_date'},
-                        'month': {'$month': '$scan_date'}
-                    },
-                    'total_spent': {'$sum': '$total_amount'},
-                    'receipt_count': {'$sum': 1},
-                    'avg_amount': {'$avg': '$total_amount'}
-                }},
-                {'$sort': {'_id.year': -1, '_id.month': -1}},
-                {'$limit': months}
-            ]
-            
-            result = list(self.collection.aggregate(pipeline))
-            
-            # Format the results
-            formatted_results = []
-            for item in result:
-                formatted_results.append({
-                    'year': item['_id']['year'],
-                    'month': item['_id']['month'],
-                    'total_spent': item['total_spent'],
-                    'receipt_count': item['receipt_count'],
-                    'avg_amount': item['avg_amount']
-                })
-            
-            return formatted_results
-            
+            return self._months_from_rollup(self.rollups.get(user_id), months)
         except Exception as e:
             print(f" Failed to get monthly spending: {e}")
             return []
     
+    def get_dashboard_version(self, user_id):
+        """Token that changes whenever any dashboard section would (None if unavailable)"""
+        if not self._ensure_connection():
+            return None
+        
+        try:
+            return self.rollups.get_version(user_id)
+        except Exception as e:
+            print(f" Failed to get dashboard version: {e}")
+            return None
+    
+    def get_dashboard(self, user_id, sections, months=12, limit=20, skip=0, receipt_fields=None):
+        """Requested dashboard sections from one rollup read (plus the receipts page); returns (version, data)"""
+        if not self._ensure_connection():
+            return None, None
+        
+        try:
+            rollup = self.rollups.get(user_id)
+            data = {}
+            if 'stats' in sections:
+                data['stats'] = self._stats_from_rollup(rollup)
+            if 'companies' in sections:
+                data['companies'] = self._companies_from_rollup(rollup)
+            if 'monthly' in sections:
+                data['monthly'] = self._months_from_rollup(rollup, months)
+            if 'receipts' in sections:
+                data['receipts'] = self.get_user_receipts(user_id, limit=limit, skip=skip, fields=receipt_fields)
+            return version_tag(rollup), data
+        except Exception as e:
+            print(f" Failed to get dashboard: {e}")
+            return None, None
+    
+    def _promote_duplicate(self, original):
+        """Make the oldest duplicate of a deleted receipt the new original, so the rest keep their text"""
+        original_id = str(original['_id'])
+        successor = self.collection.find_one_and_update(
+            {'user_id': original['user_id'], 'duplicate_of': original_id},
+            {'$unset': {'duplicate_of': ''}, '$set': {'text_size': original.get('text_size', 0)}},
+            sort=[('scan_date', 1), ('_id', 1)]
+        )
+        if successor is None:
+            self.texts.delete([original['_id']])
+            return
+        
+        if 'extracted_text' in original:
+            # Saved before the text moved to receipt_texts
+            self.texts.save(successor['_id'], original['user_id'], original['extracted_text'])
+        else:
+            self.texts.move(original['_id'], successor['_id'])
+        self.collection.update_many(
+            {'user_id': original['user_id'], 'duplicate_of': original_id},
+            {'$set': {'duplicate_of': str(successor['_id'])}}
+        )
+        print(f" Receipt {successor['_id']} replaces deleted original {original_id}")
+    
     def delete_receipt(self, receipt_id, user_id):
         """Delete a specific receipt (with user verification)"""
         if not self._ensure_connection():
             return False
         
         try:
-            result = self.collection.delete_one({
+            deleted = self.collection.find_one_and_delete({
                 '_id': ObjectId(receipt_id),
                 'user_id': user_id
             })
+            if deleted is None:
+                return False
             
-            return result.deleted_count > 0
+            if not deleted.get('duplicate_of'):
+                self._promote_duplicate(deleted)
+            self.rollups.apply(user_id, removed=[deleted])
+            return True
             
         except Exception as e:
             print(f" Failed to delete receipt: {e}")
@@ -375,12 +376,16 @@ class ReceiptDatabase:
         try:
             updates['updated_at'] = datetime.now(timezone.utc)
             
-            result = self.collection.update_one(
+            # Before and after images let the rollup swap the old values for the new ones
+            before = self.collection.find_one_and_update(
                 {'_id': ObjectId(receipt_id), 'user_id': user_id},
                 {'$set': updates}
             )
+            if before is None:
+                return False
             
-            return result.modified_count > 0
+            self.rollups.apply(user_id, added=[dict(before, **updates)], removed=[before])
+            return True
             
         except Exception as e:
             print(f" Failed to update receipt: {e}")
@@ -1,8 +1,8 @@
 from flask import Blueprint, request, jsonify
 from database import ReceiptDatabase
 from datetime import datetime, timezone
-from bson import ObjectId
 from db_connection_helper import get_db_error_response, log_db_error
+from user_resolver import user_resolver
 
 education_bp = Blueprint('education', __name__)
 db = ReceiptDatabase()
@@ -19,21 +19,8 @@ def get_education_progress():
         if not user_id:
             return jsonify({'error': 'user_id is required'}), 400
         
-        users_collection = db.db['users']
-        
-        # Find user by ObjectId, email, or google_id
-        user = None
-        try:
-            if len(user_id) == 24 and all(c in '0123456789abcdefABCDEF' for c in user_id):
-                user = users_collection.find_one({'_id': ObjectId(user_id)})
-        except:
-            pass
-        
-        if not user:
-            user = users_collection.find_one({'email': user_id})
-        
-        if not user:
-            user = users_collection.find_one({'google_id': user_id})
+        # Find user by ObjectId, email, or google_id (only the progress is needed)
+        user = user_resolver.find_user(user_id, {'education_progress': 1})
         
         if not user:
             # Return default progress if user doesn't exist
@@ -121,26 +108,15 @@ def save_education_progress():
         
         users_collection = db.db['users']
         
-        # Find user by ObjectId, email, or google_id
-        user = None
-        try:
-            if len(user_id) == 24 and all(c in '0123456789abcdefABCDEF' for c in user_id):
-                user = users_collection.find_one({'_id': ObjectId(user_id)})
-        except:
-            pass
+        # Find user by ObjectId, email, or google_id (usually from cache, no query)
+        user_oid = user_resolver.resolve_id(user_id)
         
-        if not user:
-            user = users_collection.find_one({'email': user_id})
-        
-        if not user:
-            user = users_collection.find_one({'google_id': user_id})
-        
-        if not user:
+        if user_oid is None:
             # Auto-create user if they don't exist (similar to trading endpoints)
             print(f"⚠️ User not found for education progress: {user_id}, auto-creating user...")
             if '@' in user_id:  # If it's an email, create user
                 from trading import STARTING_CASH
-                new_user = {
+                new_user = user_resolver.create_user({
                     'email': user_id,
                     'name': user_id.split('@')[0],
                     'cash_balance': STARTING_CASH,
@@ -149,16 +125,15 @@ def save_education_progress():
                     'created_at': datetime.now(timezone.utc),
                     'updated_at': datetime.now(timezone.utc),
                     'last_login': datetime.now(timezone.utc)
-                }
-                result = users_collection.insert_one(new_user)
-                user = users_collection.find_one({'_id': result.inserted_id})
+                })
+                user_oid = new_user['_id']
                 print(f"✅ Auto-created user for education progress: {user_id}")
             else:
                 return jsonify({'error': 'User not found'}), 404
         
         # Update user's education progress
         result = users_collection.update_one(
-            {'_id': user['_id']},
+            {'_id': user_oid},
             {
                 '$set': {
                     'education_progress': progress_data,
@@ -0,0 +1,94 @@
+"""Streaming NDJSON/CSV exports of receipts and the trade ledger, one cursor batch in memory at a time"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+# Documents fetched per cursor round trip, and rows written per response chunk
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+RECEIPT_EXPORT_FIELDS = ['_id', 'scan_date', 'company_name', 'total_amount', 'confidence', 'duplicate_of',
+                         'metadata.ticker', 'metadata.receipt_date', 'metadata.tax', 'text_size']
+TRANSACTION_EXPORT_FIELDS = ['_id', 'timestamp', 'type', 'ticker', 'quantity', 'price', 'total']
+
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def date_range_filter(field, start=None, end=None):
+    """{field: {$gte, $lt}} from ISO dates/datetimes (a date-only end includes that whole day); raises ValueError"""
+    bounds = {}
+    if start:
+        bounds['$gte'] = datetime.fromisoformat(start)
+    if end:
+        bounds['$lt'] = datetime.fromisoformat(end) + (timedelta(days=1) if len(end) == 10 else timedelta(0))
+    return {field: bounds} if bounds else {}
+
+
+def _value(document, path):
+    for part in path.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _plain(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value):
+    # Spreadsheets run cells starting with these as formulas (CSV injection); a leading ' shows them as text
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _batches(cursor, size):
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_chunks(collection, query, sort_field, fields, export_format, batch_size=EXPORT_BATCH_SIZE,
+                  enrich=None):
+    """Yield the matching documents as NDJSON or CSV text chunks, oldest first, one batch per chunk
+
+    `enrich(batch)` may add fields to a batch of documents before it is written (e.g. OCR text).
+    """
+    projection = dict.fromkeys(fields, 1)
+    cursor = collection.find(query, projection).sort([(sort_field, 1), ('_id', 1)]).batch_size(batch_size)
+    try:
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(fields)
+            yield buffer.getvalue()
+
+        for batch in _batches(cursor, batch_size):
+            if enrich:
+                enrich(batch)
+            rows = [[_plain(_value(document, field)) for field in fields] for document in batch]
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows([_csv_cell(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(dict(zip(fields, row)), default=str) + '\n' for row in rows)
+    finally:
+        # Also runs when the client disconnects mid-export
+        cursor.close()
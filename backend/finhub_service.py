@@ -1,5 +1,9 @@
 import requests
 from datetime import datetime, timedelta
+from single_flight import get_flight
+
+# Identical Finnhub requests made at the same moment share one HTTP call
+finnhub_flight = get_flight('finnhub')
 
 class FinnhubService:
     def __init__(self, api_key):
@@ -10,15 +14,19 @@ class FinnhubService:
         """Make API request to Finnhub"""
         if params is None:
             params = {}
+        flight_key = (endpoint, tuple(sorted(params.items())))
         params['token'] = self.api_key
         
-        try:
-            response = requests.get(f"{self.base_url}/{endpoint}", params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Finnhub API error: {str(e)}")
-            return None
+        def fetch():
+            try:
+                response = requests.get(f"{self.base_url}/{endpoint}", params=params, timeout=10)
+                response.raise_for_status()
+                return response.json()
+            except requests.exceptions.RequestException as e:
+                print(f"Finnhub API error: {str(e)}")
+                return None
+        
+        return finnhub_flight.do(flight_key, fetch)
     
     def get_market_news(self, category='general', limit=20):
         """Get general market news"""
@@ -0,0 +1,155 @@
+"""Materialized per-user holdings, maintained alongside the transactions ledger"""
+from datetime import datetime, timezone
+from pymongo import ReturnDocument, UpdateOne
+
+HOLDINGS_COLLECTION = 'holdings'
+TRANSACTIONS_COLLECTION = 'transactions'
+
+# Flag on the user document once their holdings have been built from the ledger
+MATERIALIZED_FLAG = 'holdings_materialized'
+
+# Fields compared by verify(); quantities must match exactly, money to the cent
+_MONEY_TOLERANCE = 0.01
+
+
+def replay_transactions(transactions):
+    """Rebuild {ticker: {quantity, total_cost, realized_pnl}} by replaying a ledger in timestamp order"""
+    positions = {}
+    for tx in transactions:
+        ticker = tx['ticker']
+        if ticker not in positions:
+            positions[ticker] = {'quantity': 0, 'total_cost': 0.0, 'realized_pnl': 0.0}
+        position = positions[ticker]
+
+        if tx['type'] == 'buy':
+            position['quantity'] += tx['quantity']
+            position['total_cost'] += tx['total']
+        elif tx['type'] == 'sell':
+            # Average-cost basis, same as the original portfolio replay
+            sold_qty = tx['quantity']
+            remaining_qty = position['quantity']
+            if remaining_qty > 0:
+                avg_cost_per_share = position['total_cost'] / remaining_qty
+                position['quantity'] -= sold_qty
+                position['total_cost'] -= avg_cost_per_share * sold_qty
+                position['realized_pnl'] += tx['total'] - avg_cost_per_share * sold_qty
+                if position['quantity'] == 0:
+                    position['total_cost'] = 0.0
+    return positions
+
+
+class HoldingsStore:
+    """One document per (user_id, ticker) position with quantity, cost basis and realized P&L"""
+
+    def __init__(self, receipt_db):
+        self.receipt_db = receipt_db
+
+    @property
+    def collection(self):
+        return self.receipt_db.db[HOLDINGS_COLLECTION]
+
+    @property
+    def transactions(self):
+        return self.receipt_db.db[TRANSACTIONS_COLLECTION]
+
+    def ensure_materialized(self, user):
+        """Build holdings from the ledger for users who traded before the snapshot existed"""
+        if user.get(MATERIALIZED_FLAG):
+            return
+        self.rebuild(str(user['_id']))
+        self.receipt_db.db['users'].update_one(
+            {'_id': user['_id']},
+            {'$set': {MATERIALIZED_FLAG: True}}
+        )
+        user[MATERIALIZED_FLAG] = True
+
+    def get_positions(self, user_id):
+        """Open positions for a user: {ticker: {quantity, total_cost, realized_pnl}}"""
+        cursor = self.collection.find(
+            {'user_id': user_id, 'quantity': {'$gt': 0}},
+            {'_id': 0, 'ticker': 1, 'quantity': 1, 'total_cost': 1, 'realized_pnl': 1}
+        )
+        return {
+            doc['ticker']: {
+                'quantity': doc['quantity'],
+                'total_cost': doc.get('total_cost', 0.0),
+                'realized_pnl': doc.get('realized_pnl', 0.0)
+            }
+            for doc in cursor
+        }
+
+    def apply_buy(self, user_id, ticker, quantity, total, session=None):
+        """Add a buy to the position"""
+        self.collection.update_one(
+            {'user_id': user_id, 'ticker': ticker},
+            {
+                '$inc': {'quantity': quantity, 'total_cost': total},
+                '$setOnInsert': {'realized_pnl': 0.0},
+                '$set': {'updated_at': datetime.now(timezone.utc)}
+            },
+            upsert=True,
+            session=session
+        )
+
+    def apply_sell(self, user_id, ticker, quantity, proceeds, session=None):
+        """Remove shares at average cost; returns the updated position, or None if not enough shares"""
+        avg_cost = {'$divide': ['$total_cost', '$quantity']}
+        cost_sold = {'$multiply': [avg_cost, quantity]}
+        remaining = {'$subtract': ['$quantity', quantity]}
+        return self.collection.find_one_and_update(
+            # Only matches when the shares are still there, so two sells cannot both succeed
+            {'user_id': user_id, 'ticker': ticker, 'quantity': {'$gte': quantity}},
+            [{'$set': {
+                'quantity': remaining,
+                'total_cost': {'$cond': [{'$eq': [remaining, 0]}, 0.0, {'$subtract': ['$total_cost', cost_sold]}]},
+                'realized_pnl': {'$add': [{'$ifNull': ['$realized_pnl', 0.0]}, {'$subtract': [proceeds, cost_sold]}]},
+                'updated_at': datetime.now(timezone.utc)
+            }}],
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    def _replay_ledger(self, user_id):
+        ledger = self.transactions.find(
+            {'user_id': user_id},
+            {'_id': 0, 'ticker': 1, 'type': 1, 'quantity': 1, 'total': 1}
+        ).sort('timestamp', 1)
+        return replay_transactions(ledger)
+
+    def rebuild(self, user_id):
+        """Recompute a user's holdings from the ledger, replacing whatever is stored"""
+        positions = self._replay_ledger(user_id)
+        now = datetime.now(timezone.utc)
+        self.collection.delete_many({'user_id': user_id, 'ticker': {'$nin': list(positions)}})
+        if positions:
+            self.collection.bulk_write([
+                UpdateOne(
+                    {'user_id': user_id, 'ticker': ticker},
+                    {'$set': dict(position, updated_at=now)},
+                    upsert=True
+                )
+                for ticker, position in positions.items()
+            ], ordered=False)
+        return positions
+
+    def verify(self, user_id):
+        """Compare stored holdings with a ledger replay; returns a list of drifted positions"""
+        expected = self._replay_ledger(user_id)
+        stored = {
+            doc['ticker']: doc
+            for doc in self.collection.find({'user_id': user_id}, {'_id': 0})
+        }
+        drift = []
+        for ticker in sorted(set(expected) | set(stored)):
+            want = expected.get(ticker, {'quantity': 0, 'total_cost': 0.0, 'realized_pnl': 0.0})
+            have = stored.get(ticker, {})
+            if (have.get('quantity', 0) != want['quantity'] or
+                    abs(have.get('total_cost', 0.0) - want['total_cost']) > _MONEY_TOLERANCE or
+                    abs(have.get('realized_pnl', 0.0) - want['realized_pnl']) > _MONEY_TOLERANCE):
+                drift.append({
+                    'user_id': user_id,
+                    'ticker': ticker,
+                    'stored': {k: have.get(k) for k in ('quantity', 'total_cost', 'realized_pnl')},
+                    'expected': want
+                })
+        return drift
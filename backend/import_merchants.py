@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Bulk-load merchants into the catalog and bump its version so running workers hot-reload it
+Input is CSV (name,ticker,logo,variations with variations separated by '|'), JSON
+({"merchants": [...]} or a list) or JSON Lines. New merchants keep input order, which is
+their matching priority; a merge leaves existing merchants' priority unchanged.
+Usage:
+    python import_merchants.py merchants.csv                 # merge into the JSON catalog file
+    python import_merchants.py merchants.csv --replace       # replace the JSON catalog
+    python import_merchants.py merchants.jsonl --to mongo    # upsert into the merchants collection
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from pymongo import UpdateOne, DeleteMany, ReturnDocument
+from merchant_catalog import (
+    MERCHANT_CATALOG_PATH, MERCHANTS_COLLECTION, CATALOG_META_COLLECTION, clean_merchant
+)
+
+BATCH_SIZE = 1000
+
+def read_merchants(path):
+    """Yield raw merchant records from a CSV, JSON or JSON Lines file"""
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    elif path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        yield from (data['merchants'] if isinstance(data, dict) else data)
+
+def load_input(path):
+    """Validated merchants keyed by catalog key (later rows win), plus the rejected count"""
+    merchants = {}
+    rejected = 0
+    for row in read_merchants(path):
+        try:
+            merchant = clean_merchant(row)
+        except ValueError as e:
+            rejected += 1
+            print(f"⚠️  Skipping: {e}")
+            continue
+        merchants[merchant['key']] = merchant
+    return merchants, rejected
+
+def import_to_file(merchants, replace, path=MERCHANT_CATALOG_PATH):
+    """Merge into the JSON catalog and write it atomically with version + 1"""
+    catalog = {'version': 0, 'merchants': []}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            catalog = json.load(f)
+
+    existing = {} if replace else {m['key']: m for m in catalog['merchants']}
+    existing.update(merchants)
+    catalog = {'version': catalog.get('version', 0) + 1, 'merchants': list(existing.values())}
+
+    # Readers only ever see the old or the new file, never a partial write
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(tmp_path, path)
+    return catalog['version'], len(catalog['merchants'])
+
+def import_to_mongo(merchants, replace):
+    """Upsert merchants in unordered batches and bump the catalog version"""
+    from database import ReceiptDatabase
+    db = ReceiptDatabase()
+    if not db.is_connected:
+        print("❌ Database not connected!")
+        return None, 0
+
+    collection = db.db[MERCHANTS_COLLECTION]
+    collection.create_index('key', unique=True)
+
+    # Appended merchants go after the existing ones unless the catalog is replaced
+    last = None if replace else collection.find_one({}, {'priority': 1}, sort=[('priority', -1)])
+    start = (last['priority'] + 1) if last else 0
+
+    ops = []
+    for i, merchant in enumerate(merchants.values()):
+        if replace:
+            update = {'$set': dict(merchant, priority=start + i)}
+        else:
+            # A merge keeps existing merchants' priority; only new ones are ranked after them
+            update = {'$set': merchant, '$setOnInsert': {'priority': start + i}}
+        ops.append(UpdateOne({'key': merchant['key']}, update, upsert=True))
+        if len(ops) >= BATCH_SIZE:
+            collection.bulk_write(ops, ordered=False)
+            ops = []
+    if replace:
+        ops.append(DeleteMany({'key': {'$nin': list(merchants)}}))
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+    meta = db.db[CATALOG_META_COLLECTION].find_one_and_update(
+        {'_id': 'version'}, {'$inc': {'version': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return meta['version'], collection.count_documents({})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='CSV, JSON or JSON Lines file of merchants')
+    parser.add_argument('--to', choices=['file', 'mongo'], default='file', help='catalog to write (default: file)')
+    parser.add_argument('--replace', action='store_true', help='drop merchants that are not in the input')
+    args = parser.parse_args()
+
+    merchants, rejected = load_input(args.path)
+    if args.to == 'mongo':
+        version, total = import_to_mongo(merchants, args.replace)
+    else:
+        version, total = import_to_file(merchants, args.replace)
+
+    if version is None:
+        sys.exit(1)
+    print(f"✅ Imported {len(merchants)} merchants ({rejected} rejected); catalog version {version}, {total} merchants")
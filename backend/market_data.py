@@ -0,0 +1,126 @@
+"""Batch market data: one bulk yfinance download for many tickers"""
+import os
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from quote_cache import quote_cache
+from single_flight import get_flight
+
+# Upper bound on symbols per batch request (guards against abusive payloads)
+MAX_BATCH_SYMBOLS = int(os.getenv('MAX_BATCH_SYMBOLS', 500))
+
+batch_flight = get_flight('market_data_batch')
+
+
+def _unique(tickers):
+    """Upper-cased tickers with duplicates removed, order preserved"""
+    return list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+
+
+def _download_daily_bars(tickers):
+    """Recent daily closes and volumes for all tickers in a single yf.download call"""
+    data = yf.download(
+        tickers,
+        period='5d',
+        interval='1d',
+        group_by='column',
+        auto_adjust=True,
+        progress=False,
+        threads=True
+    )
+    if data is None or data.empty:
+        return None, None
+
+    closes = data['Close']
+    volumes = data['Volume']
+    # Older yfinance versions return flat columns for a single ticker
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(tickers[0])
+        volumes = volumes.to_frame(tickers[0])
+
+    closes = closes.reindex(columns=tickers).astype(float).ffill()
+    volumes = volumes.reindex(columns=tickers).astype(float)
+    return closes, volumes
+
+
+def _fetch_batch(tickers):
+    """Download bars for tickers and cache per-ticker prices and quote summaries"""
+    try:
+        closes, volumes = _download_daily_bars(tickers)
+    except Exception as e:
+        print(f"Batch price download failed for {len(tickers)} tickers: {e}")
+        return {}
+    if closes is None:
+        return {}
+
+    last = closes.iloc[-1]
+    previous = closes.iloc[-2] if len(closes) > 1 else pd.Series(np.nan, index=closes.columns)
+    last_volume = volumes.iloc[-1].fillna(0)
+    change = (last - previous).where(previous > 0, 0.0)
+    change_percent = (change / previous * 100).where(previous > 0, 0.0)
+
+    summaries = {}
+    for ticker in tickers:
+        price = last[ticker]
+        if np.isnan(price):
+            continue
+        prev_close = previous[ticker]
+        summaries[ticker] = {
+            'symbol': ticker,
+            'price': float(price),
+            'change': float(change[ticker]),
+            'changePercent': float(change_percent[ticker]),
+            'volume': int(last_volume[ticker]),
+            'previousClose': 0.0 if np.isnan(prev_close) else float(prev_close)
+        }
+        quote_cache.set(f'price:{ticker}', float(price))
+        quote_cache.set(f'quote_summary:{ticker}', summaries[ticker])
+    return summaries
+
+
+def _fetch_missing(tickers):
+    """Fetch uncached tickers, coalescing identical concurrent batches"""
+    if not tickers:
+        return {}
+    return batch_flight.do(tuple(sorted(tickers)), lambda: _fetch_batch(tickers))
+
+
+def get_stock_prices(tickers):
+    """Current prices as a float Series aligned to tickers (NaN where unavailable)"""
+    tickers = _unique(tickers)
+    prices = pd.Series(np.nan, index=tickers, dtype=float)
+    missing = []
+    for ticker in tickers:
+        cached = quote_cache.get(f'price:{ticker}')
+        if cached is None:
+            missing.append(ticker)
+        else:
+            prices[ticker] = cached
+
+    for ticker, summary in _fetch_missing(missing).items():
+        prices[ticker] = summary['price']
+
+    return prices
+
+
+def get_quote_summaries(symbols):
+    """Price/change summaries for many symbols, in request order, skipping unavailable ones"""
+    symbols = _unique(symbols)[:MAX_BATCH_SYMBOLS]
+    summaries = {}
+    missing = []
+    for symbol in symbols:
+        cached = quote_cache.get(f'quote_summary:{symbol}')
+        if cached is None:
+            missing.append(symbol)
+        else:
+            summaries[symbol] = cached
+
+    summaries.update(_fetch_missing(missing))
+    return [summaries[symbol] for symbol in symbols if symbol in summaries]
+
+
+def portfolio_value(quantities, prices):
+    """Market value of a set of positions: quantities · prices (missing prices count as 0)"""
+    quantities = np.asarray(quantities, dtype=float)
+    prices = np.nan_to_num(np.asarray(prices, dtype=float))
+    return float(np.dot(quantities, prices))
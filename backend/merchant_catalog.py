@@ -0,0 +1,186 @@
+"""Merchant catalog (name, ticker, logo, OCR variations) loaded from JSON or Mongo, hot-reloaded on change"""
+import json
+import os
+import re
+import threading
+import time
+from company_matcher import CompanyMatcher
+
+# 'file' reads MERCHANT_CATALOG_PATH, 'mongo' reads the merchants collection
+MERCHANT_CATALOG_SOURCE = os.getenv('MERCHANT_CATALOG_SOURCE', 'file').lower()
+MERCHANT_CATALOG_PATH = os.getenv(
+    'MERCHANT_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'merchants.json')
+)
+# Seconds between checks for a newer catalog version
+MERCHANT_CATALOG_RELOAD_INTERVAL = float(os.getenv('MERCHANT_CATALOG_RELOAD_INTERVAL', 30))
+
+MERCHANTS_COLLECTION = 'merchants'
+CATALOG_META_COLLECTION = 'merchant_catalog_meta'
+DEFAULT_LOGO = '🏪'
+
+
+def normalize_name(name):
+    """Lowercase alphanumerics only, so 'Wal-Mart, Inc.' and 'walmart inc' compare equal"""
+    return re.sub(r'[^a-z0-9]+', '', name.lower())
+
+
+def clean_merchant(merchant):
+    """Validate one merchant record and fill defaults; raises ValueError on bad input"""
+    name = (merchant.get('name') or '').strip()
+    if not name:
+        raise ValueError(f'merchant without a name: {merchant}')
+    variations = merchant.get('variations') or [name]
+    if isinstance(variations, str):
+        variations = variations.split('|')
+    variations = [v.strip().lower() for v in variations if v and v.strip()]
+    ticker = (merchant.get('ticker') or '').strip().upper() or None
+    return {
+        'key': merchant.get('key') or normalize_name(name),
+        'name': name,
+        'ticker': ticker,
+        # Only a missing logo gets the default; '' is kept and left to the frontend as before
+        'logo': merchant['logo'] if merchant.get('logo') is not None else DEFAULT_LOGO,
+        'variations': list(dict.fromkeys(variations))
+    }
+
+
+class CatalogSnapshot:
+    """Immutable indexes over one catalog version; swapped as a whole on reload"""
+
+    def __init__(self, merchants, version):
+        self.version = version
+        self.companies = {}
+        for merchant in merchants:
+            self.companies[merchant['key']] = merchant
+        self.matcher = CompanyMatcher(self.companies)
+        self.by_ticker = {}
+        self.by_name = {}
+        self.by_variation = {}
+        for key, merchant in self.companies.items():
+            if merchant['ticker']:
+                self.by_ticker.setdefault(merchant['ticker'], key)
+            self.by_name.setdefault(normalize_name(merchant['name']), key)
+            for variation in merchant['variations']:
+                self.by_variation.setdefault(variation, key)
+                self.by_name.setdefault(normalize_name(variation), key)
+
+    def __len__(self):
+        return len(self.companies)
+
+
+class FileCatalogSource:
+    """Versioned JSON file; a changed mtime triggers a reload"""
+
+    def __init__(self, path=MERCHANT_CATALOG_PATH):
+        self.path = path
+
+    def marker(self):
+        return os.stat(self.path).st_mtime_ns
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get('merchants', []), data.get('version', 0)
+
+
+class MongoCatalogSource:
+    """merchants collection plus a version document bumped by import_merchants.py"""
+
+    def __init__(self, receipt_db):
+        self.receipt_db = receipt_db
+
+    def marker(self):
+        meta = self.receipt_db.db[CATALOG_META_COLLECTION].find_one({'_id': 'version'})
+        return meta['version'] if meta else 0
+
+    def load(self):
+        version = self.marker()
+        cursor = self.receipt_db.db[MERCHANTS_COLLECTION].find({}, {'_id': 0}).sort('priority', 1)
+        return list(cursor), version
+
+
+class MerchantCatalog:
+    """Current catalog snapshot; callers always see a complete version, never a half-loaded one"""
+
+    def __init__(self, source, reload_interval=MERCHANT_CATALOG_RELOAD_INTERVAL):
+        self.source = source
+        self.reload_interval = reload_interval
+        self._snapshot = None
+        self._marker = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _load(self):
+        marker = self.source.marker()
+        merchants, version = self.source.load()
+        snapshot = CatalogSnapshot([clean_merchant(m) for m in merchants], version)
+        self._snapshot, self._marker = snapshot, marker
+        self.reloads += 1
+        print(f"Merchant catalog: loaded version {version} with {len(snapshot)} merchants")
+
+    def snapshot(self):
+        """Current snapshot, reloading first if the source changed since the last check"""
+        if self._snapshot is not None and time.time() - self._checked_at < self.reload_interval:
+            return self._snapshot
+        # Only one request pays for the check/rebuild; the others keep using the old snapshot
+        if not self._lock.acquire(blocking=self._snapshot is None):
+            return self._snapshot
+        try:
+            if self._snapshot is None or time.time() - self._checked_at >= self.reload_interval:
+                self._checked_at = time.time()
+                try:
+                    if self._snapshot is None or self.source.marker() != self._marker:
+                        self._load()
+                except Exception as e:
+                    print(f"⚠️ Merchant catalog reload failed, keeping current version: {e}")
+                    if self._snapshot is None:
+                        self._snapshot = CatalogSnapshot([], 0)
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Force a reload now, e.g. after an import in this process"""
+        with self._lock:
+            self._checked_at = time.time()
+            self._load()
+        return self._snapshot
+
+    def match(self, text):
+        """Best merchant mentioned in OCR text (see CompanyMatcher.match)"""
+        return self.snapshot().matcher.match(text)
+
+    def get_by_ticker(self, ticker):
+        snapshot = self.snapshot()
+        key = snapshot.by_ticker.get(ticker.upper())
+        return snapshot.companies[key] if key else None
+
+    def get_by_name(self, name):
+        """Merchant whose name or a variation normalizes to the same string"""
+        snapshot = self.snapshot()
+        key = snapshot.by_name.get(normalize_name(name))
+        return snapshot.companies[key] if key else None
+
+    def stats(self):
+        snapshot = self.snapshot()
+        return {
+            'source': type(self.source).__name__,
+            'version': snapshot.version,
+            'merchants': len(snapshot),
+            'tickers': len(snapshot.by_ticker),
+            'variations': len(snapshot.by_variation),
+            'reloads': self.reloads
+        }
+
+
+def _create_catalog():
+    if MERCHANT_CATALOG_SOURCE == 'mongo':
+        from database import ReceiptDatabase
+        return MerchantCatalog(MongoCatalogSource(ReceiptDatabase()))
+    return MerchantCatalog(FileCatalogSource())
+
+
+# Process-wide catalog used by the receipt scanner
+merchant_catalog = _create_catalog()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Versioned index/schema migrations, run once per deploy (release phase), not per worker.
+
+Applied versions are recorded in the schema_migrations collection, so `up` only runs what is new.
+`check` explains every hot query against the live database and fails if any would scan a collection.
+
+Usage: python migrations.py status|up|check
+"""
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from database import ReceiptDatabase
+from pagination import keyset_filter
+from receipt_texts import RECEIPT_TEXTS_COLLECTION, text_document
+
+MIGRATIONS_COLLECTION = 'schema_migrations'
+LOCK_ID = 'lock'
+# A lock older than this is from a release that died mid-run
+LOCK_TIMEOUT = timedelta(minutes=15)
+
+
+def _receipt_indexes(db):
+    receipts = db['scanned_receipts']
+    # get_user_receipts (match user, newest first) and the per-user stats/breakdown aggregations
+    receipts.create_index([('user_id', ASCENDING), ('scan_date', DESCENDING)])
+    # Duplicate-upload lookup by image hash
+    receipts.create_index([('user_id', ASCENDING), ('metadata.image_sha256', ASCENDING)])
+
+
+def _user_indexes(db):
+    users = db['users']
+    # Login, onboarding and the user resolver's {_id | email | google_id} $or lookup
+    users.create_index('email')
+    users.create_index('google_id', sparse=True)
+
+
+def _trading_indexes(db):
+    # Transaction history (newest first) and ledger replay (oldest first) per user
+    db['transactions'].create_index([('user_id', ASCENDING), ('timestamp', ASCENDING)])
+    # Positions are upserted by user and ticker; unique so concurrent upserts cannot duplicate one
+    db['holdings'].create_index([('user_id', ASCENDING), ('ticker', ASCENDING)], unique=True)
+
+
+def _ai_cache_indexes(db):
+    db['ai_stock_cache'].create_index([('ticker', ASCENDING), ('created_at', DESCENDING)])
+    db['ai_daily_briefs'].create_index([('date', DESCENDING)])
+
+
+def _drop_index_if_exists(collection, name):
+    try:
+        collection.drop_index(name)
+    except OperationFailure as e:
+        # IndexNotFound: already gone (or never created on this database)
+        if e.code != 27:
+            raise
+
+
+def _keyset_indexes(db):
+    # Cursor pagination sorts by (field, _id); these replace the (user_id, field) indexes, which are their prefixes
+    db['scanned_receipts'].create_index([('user_id', ASCENDING), ('scan_date', DESCENDING), ('_id', DESCENDING)])
+    _drop_index_if_exists(db['scanned_receipts'], 'user_id_1_scan_date_-1')
+    # Walked backwards for newest-first pages, forwards for ledger replay
+    db['transactions'].create_index([('user_id', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)])
+    _drop_index_if_exists(db['transactions'], 'user_id_1_timestamp_1')
+
+
+def _move_receipt_texts(db, batch_size=500):
+    # Receipts saved before the split still carry their OCR text inline; move it out in batches
+    receipts = db['scanned_receipts']
+    texts = db[RECEIPT_TEXTS_COLLECTION]
+    cursor = receipts.find({'extracted_text': {'$exists': True}}, {'user_id': 1, 'extracted_text': 1},
+                           batch_size=batch_size)
+    batch = []
+    for receipt in cursor:
+        batch.append(receipt)
+        if len(batch) >= batch_size:
+            _move_text_batch(receipts, texts, batch)
+            batch = []
+    if batch:
+        _move_text_batch(receipts, texts, batch)
+
+
+def _move_text_batch(receipts, texts, batch):
+    # Upserts, so a run interrupted between the two writes is safe to repeat
+    texts.bulk_write([
+        ReplaceOne({'_id': r['_id']}, text_document(r['_id'], r.get('user_id'), r['extracted_text']), upsert=True)
+        for r in batch
+    ], ordered=False)
+    receipts.bulk_write([
+        UpdateOne({'_id': r['_id']}, {'$unset': {'extracted_text': ''},
+                                      '$set': {'text_size': len(r['extracted_text'] or '')}})
+        for r in batch
+    ], ordered=False)
+    print(f"  moved OCR text of {len(batch)} receipts")
+
+
+# (version, description, apply(db)); append only, never renumber or edit an applied migration
+MIGRATIONS = [
+    (1, 'scanned_receipts: per-user and image-hash indexes', _receipt_indexes),
+    (2, 'users: email and google_id lookups', _user_indexes),
+    (3, 'transactions and holdings: per-user ledger and positions', _trading_indexes),
+    (4, 'ai caches: ticker/created_at and brief date', _ai_cache_indexes),
+    (5, 'scanned_receipts and transactions: (user_id, sort field, _id) for cursor pagination', _keyset_indexes),
+    (6, 'scanned_receipts: move OCR text to compressed receipt_texts', _move_receipt_texts),
+]
+
+
+# Explained queries only need the right shape; no document has to match
+SAMPLE_USER = 'explain-check'
+
+# (name, collection, run(collection) -> explain output) for each query the app runs per request
+HOT_QUERIES = [
+    ('receipts by user', 'scanned_receipts',
+     lambda c: c.find({'user_id': SAMPLE_USER}).sort([('scan_date', -1), ('_id', -1)]).limit(51).explain()),
+    ('receipts after cursor', 'scanned_receipts',
+     lambda c: c.find(keyset_filter({'user_id': SAMPLE_USER}, 'scan_date', datetime.now(), ObjectId()))
+     .sort([('scan_date', -1), ('_id', -1)]).limit(51).explain()),
+    ('receipt stats by user', 'scanned_receipts',
+     lambda c: c.database.command('explain', {
+         'aggregate': c.name,
+         'pipeline': [{'$match': {'user_id': SAMPLE_USER}},
+                      {'$group': {'_id': None, 'total': {'$sum': '$total_amount'}}}],
+         'cursor': {}
+     }, verbosity='queryPlanner')),
+    ('receipt by image hash', 'scanned_receipts',
+     lambda c: c.find({'user_id': SAMPLE_USER, 'metadata.image_sha256': '0' * 64,
+                       'duplicate_of': {'$exists': False}}).limit(1).explain()),
+    ('user by email', 'users', lambda c: c.find({'email': 'explain@example.com'}).limit(1).explain()),
+    ('user by google_id', 'users', lambda c: c.find({'google_id': 'explain'}).limit(1).explain()),
+    ('user by identifier', 'users',
+     lambda c: c.find({'$or': [{'_id': ObjectId()}, {'email': 'explain'}, {'google_id': 'explain'}]}).explain()),
+    ('transactions by user', 'transactions',
+     lambda c: c.find({'user_id': SAMPLE_USER}).sort([('timestamp', -1), ('_id', -1)]).limit(51).explain()),
+    ('ledger replay', 'transactions',
+     lambda c: c.find({'user_id': SAMPLE_USER}).sort('timestamp', 1).explain()),
+    ('open positions', 'holdings',
+     lambda c: c.find({'user_id': SAMPLE_USER, 'quantity': {'$gt': 0}}).explain()),
+    ('cached stock analysis', 'ai_stock_cache',
+     lambda c: c.find({'ticker': 'AAPL', 'created_at': {'$gte': datetime.now() - timedelta(hours=4)}})
+     .sort('created_at', -1).limit(1).explain()),
+    ('cached daily brief', 'ai_daily_briefs',
+     lambda c: c.find({'date': {'$gte': datetime.now()}}).sort('created_at', -1).limit(1).explain()),
+]
+
+
+def _plan_stages(explain):
+    """Every stage name in the winning plan(s) of an explain result (rejected plans ignored)"""
+    stages = []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == 'rejectedPlans':
+                    continue
+                if key == 'stage' and in_plan and isinstance(value, str):
+                    stages.append(value)
+                walk(value, in_plan or key in ('winningPlan', 'queryPlan'))
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+
+    walk(explain, False)
+    return stages
+
+
+def applied_versions(db):
+    return {doc['_id'] for doc in db[MIGRATIONS_COLLECTION].find({'_id': {'$type': 'int'}}, {'_id': 1})}
+
+
+def _acquire_lock(db):
+    collection = db[MIGRATIONS_COLLECTION]
+    now = datetime.now(timezone.utc)
+    collection.delete_one({'_id': LOCK_ID, 'locked_at': {'$lt': now - LOCK_TIMEOUT}})
+    try:
+        collection.insert_one({'_id': LOCK_ID, 'locked_at': now})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def run_migrations(db):
+    """Apply pending migrations in order; returns the versions applied (raises on the first failure)"""
+    if not _acquire_lock(db):
+        raise RuntimeError('Another migration run holds the lock; try again when it finishes')
+    applied = []
+    try:
+        done = applied_versions(db)
+        for version, description, apply in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"Applying migration {version}: {description}")
+            start = time.time()
+            apply(db)
+            db[MIGRATIONS_COLLECTION].insert_one({
+                '_id': version,
+                'description': description,
+                'applied_at': datetime.now(timezone.utc),
+                'duration_ms': round((time.time() - start) * 1000, 1)
+            })
+            applied.append(version)
+    finally:
+        db[MIGRATIONS_COLLECTION].delete_one({'_id': LOCK_ID})
+    return applied
+
+
+def check_query_plans(db):
+    """(name, collection, stages or None if the collection does not exist yet, ok) for each hot query"""
+    existing = set(db.list_collection_names())
+    results = []
+    for name, collection_name, explain in HOT_QUERIES:
+        if collection_name not in existing:
+            results.append((name, collection_name, None, True))
+            continue
+        stages = _plan_stages(explain(db[collection_name]))
+        results.append((name, collection_name, stages, 'COLLSCAN' not in stages))
+    return results
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command not in ('status', 'up', 'check'):
+        print(__doc__)
+        return False
+
+    receipt_db = ReceiptDatabase()
+    if not receipt_db.is_connected:
+        print("❌ Database not connected!")
+        return False
+    db = receipt_db.db
+
+    if command == 'status':
+        done = applied_versions(db)
+        for version, description, _ in MIGRATIONS:
+            print(f"{'✅' if version in done else '⏳'} {version:>3}  {description}")
+        return True
+
+    if command == 'up':
+        try:
+            applied = run_migrations(db)
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            return False
+        print(f"✅ Applied {len(applied)} migration(s)" if applied else "✅ Database is up to date")
+        return True
+
+    ok = True
+    for name, collection_name, stages, passed in check_query_plans(db):
+        if stages is None:
+            print(f"➖ {name} ({collection_name}): collection does not exist yet")
+            continue
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} {name} ({collection_name}): {' > '.join(stages)}")
+    if not ok:
+        print("❌ Some hot queries scan a whole collection; run `python migrations.py up` or add an index")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,227 @@
+"""One MongoClient per process, shared by every ReceiptDatabase, with connection-pool stats"""
+import os
+import threading
+import time
+from pymongo import MongoClient, monitoring
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Every blueprint shares this pool now, so size it for the whole worker (gunicorn threads + scan workers)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 20))
+# Fail a request after this long waiting for a free pooled connection instead of hanging
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+# After a failed connect, requests fail fast for this long instead of each waiting out the timeout
+MONGO_RETRY_INTERVAL = 10
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection-pool events folded into counters (checked out, wait time, creates)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        waited = getattr(event, 'duration', None) or 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections_open': self.created - self.closed,
+                'connections_created': self.created,
+                'connections_closed': self.closed,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': dict(self.checkout_failures),
+                'avg_wait_ms': round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 3),
+                'pools_cleared': self.pools_cleared
+            }
+
+
+class MongoRegistry:
+    """Owns the process's MongoClient: connects lazily, reconnects after fork, fails fast while the server is down"""
+
+    def __init__(self, mongo_uri=None, database_name=None, max_pool_size=MONGO_MAX_POOL_SIZE):
+        self.mongo_uri = mongo_uri or os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+        self.database_name = database_name or os.getenv('DATABASE_NAME', 'receipt_scanner')
+        self.max_pool_size = max_pool_size
+        self.is_local = 'localhost' in self.mongo_uri
+        self.pool_stats = PoolStats()
+        self._client = None
+        self._pid = None
+        self._last_failure = 0
+        self._connects = 0
+        self._lock = threading.Lock()
+        self._logged_config = False
+
+    def _log_config(self):
+        # Once per process rather than once per module that needs the database
+        if self._logged_config:
+            return
+        self._logged_config = True
+        print("=" * 60)
+        print("DATABASE INITIALIZATION")
+        print("=" * 60)
+        print(f"MONGO_URI: {'✅ Set' if not self.is_local else '❌ Missing or default'}")
+        if not self.is_local:
+            # Show preview (first 40 chars + last 20 chars for security)
+            uri = self.mongo_uri
+            print(f"  Preview: {uri[:40] + '...' + uri[-20:] if len(uri) > 60 else uri}")
+        print(f"DATABASE_NAME: {self.database_name}")
+        print(f"Pool: maxPoolSize={self.max_pool_size}, one client per process")
+        print("=" * 60)
+
+    def _atlas_uri(self):
+        # Ensure URI has proper SSL parameters
+        uri = self.mongo_uri
+        if 'ssl=true' not in uri.lower() and 'tls=true' not in uri.lower():
+            separator = '&' if '?' in uri else '?'
+            uri = f"{uri}{separator}tls=true"
+        return uri
+
+    def _connect(self):
+        options = {
+            'maxPoolSize': self.max_pool_size,
+            'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            'event_listeners': [self.pool_stats]
+        }
+        if self.is_local:
+            print("Connecting to local MongoDB...")
+            return MongoClient(self.mongo_uri, serverSelectionTimeoutMS=10000, connectTimeoutMS=10000,
+                               socketTimeoutMS=10000, **options)
+
+        print("Attempting MongoDB Atlas connection (Render-friendly with long timeouts)...")
+        options.update(
+            serverSelectionTimeoutMS=60000,  # 60s for Render cold starts
+            connectTimeoutMS=60000,
+            socketTimeoutMS=60000,
+            retryWrites=True,
+            retryReads=True
+        )
+        uri = self._atlas_uri()
+        try:
+            import certifi
+            print("Trying TLS with certifi...")
+            client = MongoClient(uri, tls=True, tlsCAFile=certifi.where(), **options)
+            client.admin.command('ping')
+            print("✅ MongoDB Atlas connection successful (TLS with certifi)!")
+            return client
+        except Exception as ssl_error:
+            print(f"⚠️  TLS with certifi failed: {str(ssl_error)[:150]}...")
+
+        # pymongo handles SSL from the URI
+        print("Trying URI-only connection (pymongo auto-SSL)...")
+        client = MongoClient(uri, **options)
+        client.admin.command('ping')
+        print("✅ MongoDB Atlas connection successful (URI-only)!")
+        return client
+
+    def current_client(self):
+        """This process's client if already connected, without attempting a connection"""
+        return self._client if self._pid == os.getpid() else None
+
+    def get_client(self):
+        """This process's client, connecting on first use; None while the server is unreachable"""
+        client = self.current_client()
+        if client is not None:
+            return client
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # A client inherited across fork (gunicorn --preload) shares sockets with the parent;
+                # never use or close it here, just start over
+                self._client = None
+                self._pid = os.getpid()
+                self._last_failure = 0
+                self.pool_stats.reset()
+            if self._client is not None:
+                return self._client
+            if time.time() - self._last_failure < MONGO_RETRY_INTERVAL:
+                return None
+
+            self._log_config()
+            try:
+                self._client = self._connect()
+                self._connects += 1
+                print(f"✅ Connected to database: {self.database_name}")
+            except Exception as e:
+                print(f"❌ MongoDB connection failed: {str(e)[:200]}")
+                print(f"⚠️  Will retry in {MONGO_RETRY_INTERVAL}s (Render cold starts can be slow)")
+                self._last_failure = time.time()
+            return self._client
+
+    def database(self):
+        client = self.get_client()
+        return client[self.database_name] if client is not None else None
+
+    def stats(self):
+        client = self.current_client()
+        return {
+            'connected': client is not None,
+            'pid': os.getpid(),
+            'database': self.database_name,
+            'max_pool_size': self.max_pool_size,
+            'wait_queue_timeout_ms': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            'connects': self._connects,
+            'pool': self.pool_stats.stats()
+        }
+
+
+# The process-wide registry; ReceiptDatabase instances all resolve their client through it
+mongo_registry = MongoRegistry()
@@ -0,0 +1,280 @@
+"""Multi-pass Tesseract OCR run on a bounded process pool, with early exit"""
+import os
+import threading
+from collections import Counter
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pytesseract
+
+# tesserocr keeps Tesseract loaded in-process (needs libtesseract headers to install)
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+# 'tesserocr', 'pytesseract' (one tesseract subprocess per pass) or 'auto' (tesserocr when installed)
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto').lower()
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Stop once a pass yields a usable total/company with at least this mean word confidence
+OCR_EARLY_EXIT_CONFIDENCE = float(os.getenv('OCR_EARLY_EXIT_CONFIDENCE', 60))
+
+OCR_CHAR_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$/():- '
+
+# (oem, psm) passes in the order they are tried; tune from the win counts at /api/ocr/stats
+DEFAULT_PASSES = [
+    (3, 6), (3, 4), (1, 6), (3, 11), (3, 3), (1, 4),
+    (2, 6), (3, 8), (3, 13), (1, 11), (1, 3), (2, 4),
+    (1, 8), (1, 13), (2, 11), (2, 3), (2, 8), (2, 13),
+]
+
+# Passes shorter than this are treated as failed reads
+MIN_TEXT_LENGTH = 20
+
+
+def parse_passes(spec):
+    """Parse 'oem:psm,oem:psm,...' (e.g. from OCR_PASSES) into a pass list"""
+    passes = []
+    for item in spec.split(','):
+        oem, psm = item.strip().split(':')
+        passes.append((int(oem), int(psm)))
+    return passes
+
+
+class PytesseractBackend:
+    """Shells out to the tesseract binary for every pass (temp image file, model reload)"""
+    name = 'pytesseract'
+
+    def image_to_data(self, image, oem, psm):
+        config = f'--oem {oem} --psm {psm} -c tessedit_char_whitelist={OCR_CHAR_WHITELIST}'
+        return pytesseract.image_to_data(image, lang=OCR_LANG, config=config,
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrBackend:
+    """Resident Tesseract engines, one per OEM per thread, fed raw NumPy pixels"""
+    name = 'tesserocr'
+    TSV_FIELDS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                  'left', 'top', 'width', 'height', 'conf', 'text')
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _api(self, oem):
+        # Pool workers are long-lived, so each loads the model once per OEM and reuses it;
+        # an engine copied across fork is rebuilt rather than shared
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.pid = os.getpid()
+            local.apis = {}
+        if oem not in local.apis:
+            try:
+                local.apis[oem] = tesserocr.PyTessBaseAPI(lang=OCR_LANG, oem=oem)
+            except RuntimeError as e:
+                # e.g. legacy OEMs without legacy traineddata; do not reload the model every pass
+                local.apis[oem] = e
+        api = local.apis[oem]
+        if isinstance(api, Exception):
+            raise api
+        return api
+
+    def image_to_data(self, image, oem, psm):
+        pixels = np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+        height, width = pixels.shape[:2]
+        channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+
+        api = self._api(oem)
+        api.SetPageSegMode(psm)
+        api.SetVariable('tessedit_char_whitelist', OCR_CHAR_WHITELIST)
+        api.SetImageBytes(pixels.tobytes(), width, height, channels, width * channels)
+        tsv = api.GetTSVText(0)
+        api.Clear()
+
+        data = {field: [] for field in self.TSV_FIELDS}
+        for row in tsv.splitlines():
+            values = row.split('\t', len(self.TSV_FIELDS) - 1)
+            if len(values) < len(self.TSV_FIELDS):
+                values.append('')
+            for field, value in zip(self.TSV_FIELDS, values):
+                data[field].append(value if field == 'text' else float(value) if field == 'conf' else int(value))
+        return data
+
+
+def _create_backend():
+    if OCR_BACKEND == 'pytesseract':
+        return PytesseractBackend()
+    if TESSEROCR_AVAILABLE:
+        return TesserocrBackend()
+    if OCR_BACKEND == 'tesserocr':
+        print("⚠️ OCR_BACKEND=tesserocr but tesserocr is not installed, using pytesseract")
+    return PytesseractBackend()
+
+
+# Backend used by run_pass in this process (pool workers build their own engines)
+ocr_backend = _create_backend()
+
+
+def run_pass(image, oem, psm):
+    """Run one Tesseract pass and return its text with mean per-word confidence (runs in a worker process)"""
+    data = ocr_backend.image_to_data(image, oem, psm)
+
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        word = word.strip()
+        conf = float(data['conf'][i])
+        if not word or conf < 0:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(conf)
+
+    text = '\n'.join(' '.join(words) for _, words in sorted(lines.items()))
+    return {
+        'oem': oem,
+        'psm': psm,
+        'text': text,
+        'confidence': sum(confidences) / len(confidences) if confidences else 0.0,
+        'words': len(confidences)
+    }
+
+
+class OCREngine:
+    """Runs OCR passes across cores and keeps the most confident read"""
+
+    def __init__(self, workers=OCR_WORKERS, passes=None):
+        self.workers = max(1, workers)
+        self.passes = passes or DEFAULT_PASSES
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.early_exits = 0
+        self.passes_run = 0
+        self.wins = Counter()
+
+    def _get_pool(self):
+        # A pool inherited across fork (gunicorn --preload) is unusable; build one per process
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _iter_results(self, image, passes):
+        """Yield pass results as they finish (in pass order when running serially)"""
+        if self.workers == 1:
+            for oem, psm in passes:
+                try:
+                    yield run_pass(image, oem, psm)
+                except Exception:
+                    continue
+            return
+
+        futures = [self._get_pool().submit(run_pass, image, oem, psm) for oem, psm in passes]
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception:
+                    continue
+        finally:
+            # Early exit: drop passes that have not started yet
+            for future in futures:
+                future.cancel()
+
+    def extract(self, image, accept=None):
+        """OCR image with every pass until accept(text) is satisfied; returns the best pass result"""
+        results = []
+        accepted = None
+        completed = 0
+
+        with closing(self._iter_results(image, self.passes)) as pass_results:
+            for result in pass_results:
+                completed += 1
+                if len(result['text'].strip()) <= MIN_TEXT_LENGTH:
+                    continue
+                results.append(result)
+                if (accept is not None and result['confidence'] >= OCR_EARLY_EXIT_CONFIDENCE
+                        and accept(result['text'])):
+                    accepted = result
+                    break
+
+        with self._lock:
+            self.scans += 1
+            self.passes_run += completed
+            if accepted is not None:
+                self.early_exits += 1
+
+        if not results:
+            return None
+
+        # Rank by Tesseract's per-word confidence, not by how much text came out
+        best = accepted or max(results, key=lambda r: (r['confidence'], len(r['text'])))
+        best = dict(best, passes_run=completed, early_exit=accepted is not None)
+        with self._lock:
+            self.wins[f"oem{best['oem']}/psm{best['psm']}"] += 1
+        print(f"Best OCR: OEM {best['oem']}, PSM {best['psm']}, confidence {best['confidence']:.1f}, "
+              f"{completed} passes, early exit: {best['early_exit']}")
+        return best
+
+    def extract_blocks(self, blocks, oem=3, psm=6):
+        """One pass over each text block in parallel; returns the joined text in block order
+
+        None if any block fails: text with a block missing could lose the total, so the caller
+        falls back to full-frame OCR instead.
+        """
+        try:
+            if self.workers == 1:
+                results = [run_pass(block, oem, psm) for block in blocks]
+            else:
+                pool = self._get_pool()
+                futures = [pool.submit(run_pass, block, oem, psm) for block in blocks]
+                try:
+                    results = [future.result() for future in futures]
+                finally:
+                    for future in futures:
+                        future.cancel()
+        except Exception as e:
+            print(f"Block OCR failed, falling back to the full frame: {e}")
+            return None
+
+        words = sum(r['words'] for r in results)
+        with self._lock:
+            self.scans += 1
+            self.passes_run += len(blocks)
+        return {
+            'oem': oem,
+            'psm': psm,
+            'text': '\n'.join(r['text'] for r in results if r['text']),
+            # Weighted by words so a near-empty block does not drag the mean down
+            'confidence': sum(r['confidence'] * r['words'] for r in results) / words if words else 0.0,
+            'words': words,
+            'passes_run': len(blocks),
+            'early_exit': False
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': ocr_backend.name,
+                'workers': self.workers,
+                'scans': self.scans,
+                'early_exits': self.early_exits,
+                'avg_passes_per_scan': round(self.passes_run / self.scans, 2) if self.scans else 0,
+                'pass_order': [f'oem{oem}/psm{psm}' for oem, psm in self.passes],
+                'wins': dict(self.wins.most_common())
+            }
+
+
+def _create_engine():
+    passes = parse_passes(os.getenv('OCR_PASSES')) if os.getenv('OCR_PASSES') else None
+    return OCREngine(passes=passes)
+
+
+# Process-wide engine used by the receipt scanner
+ocr_engine = _create_engine()
@@ -0,0 +1,143 @@
+"""Atomic buy/sell execution built on conditional Mongo updates"""
+import os
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+
+# 'auto' uses multi-document transactions when the server supports them (replica set / Atlas),
+# 'on' requires them, 'off' never uses them
+ORDER_TRANSACTIONS = os.getenv('ORDER_TRANSACTIONS', 'auto').lower()
+
+
+class OrderExecutor:
+    """Executes orders so concurrent submissions can never overdraw cash or oversell shares"""
+
+    def __init__(self, receipt_db, holdings_store, starting_cash):
+        self.receipt_db = receipt_db
+        self.holdings_store = holdings_store
+        self.starting_cash = starting_cash
+        self._supports_transactions = None
+
+    @property
+    def users(self):
+        return self.receipt_db.db['users']
+
+    @property
+    def transactions(self):
+        return self.receipt_db.db['transactions']
+
+    def _use_transactions(self):
+        if ORDER_TRANSACTIONS == 'off':
+            return False
+        if ORDER_TRANSACTIONS == 'on':
+            return True
+        if self._supports_transactions is None:
+            try:
+                topology = self.receipt_db.client.topology_description.topology_type_name
+                self._supports_transactions = topology in ('ReplicaSetWithPrimary', 'Sharded')
+            except Exception:
+                self._supports_transactions = False
+            print(f"Order execution: multi-document transactions {'enabled' if self._supports_transactions else 'unavailable'}")
+        return self._supports_transactions
+
+    def _run(self, steps):
+        """Run steps(session) inside a transaction when available, else directly"""
+        if not self._use_transactions():
+            return steps(None)
+        with self.receipt_db.client.start_session() as session:
+            return session.with_transaction(steps)
+
+    def _ledger_entry(self, user_id, side, ticker, quantity, price, total):
+        return {
+            'user_id': user_id,
+            'type': side,
+            'ticker': ticker,
+            'quantity': quantity,
+            'price': price,
+            'total': total,
+            'timestamp': datetime.now(timezone.utc)
+        }
+
+    def buy(self, user_oid, ticker, quantity, price):
+        """Debit cash and record a buy; returns the new cash balance, or None if funds are insufficient"""
+        total = price * quantity
+        user_id = str(user_oid)
+
+        def steps(session):
+            # The funds check is part of the update filter, so two concurrent buys cannot both pass it
+            user = self.users.find_one_and_update(
+                {'_id': user_oid, 'cash_balance': {'$gte': total}},
+                {
+                    '$inc': {'cash_balance': -total},
+                    '$set': {'updated_at': datetime.now(timezone.utc)}
+                },
+                projection={'cash_balance': 1},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if user is None:
+                return None
+
+            try:
+                self.transactions.insert_one(
+                    self._ledger_entry(user_id, 'buy', ticker, quantity, price, total),
+                    session=session
+                )
+            except Exception:
+                if session is None:
+                    # No transaction to roll back: refund the debit so cash matches the ledger
+                    self.users.update_one({'_id': user_oid}, {'$inc': {'cash_balance': total}})
+                raise
+
+            try:
+                self.holdings_store.apply_buy(user_id, ticker, quantity, total, session=session)
+            except Exception as e:
+                if session is not None:
+                    raise
+                # The ledger is authoritative; rebuild_holdings.py repairs the snapshot
+                print(f"⚠️ Holdings update failed after buy for {user_id} {ticker}: {e}")
+            return user['cash_balance']
+
+        return self._run(steps)
+
+    def sell(self, user_oid, ticker, quantity, price):
+        """Remove shares and credit cash; returns (new cash balance, position after), or None if shares are insufficient"""
+        proceeds = price * quantity
+        user_id = str(user_oid)
+
+        def steps(session):
+            # Conditional on quantity >= requested, so concurrent sells cannot oversell
+            position = self.holdings_store.apply_sell(user_id, ticker, quantity, proceeds, session=session)
+            if position is None:
+                return None
+
+            entry = self._ledger_entry(user_id, 'sell', ticker, quantity, price, proceeds)
+            try:
+                self.transactions.insert_one(entry, session=session)
+            except Exception:
+                if session is None:
+                    # Restore the position from the ledger, which does not contain this sale
+                    self.holdings_store.rebuild(user_id)
+                raise
+
+            try:
+                user = self.users.find_one_and_update(
+                    {'_id': user_oid},
+                    [{'$set': {
+                        'cash_balance': {'$add': [{'$ifNull': ['$cash_balance', self.starting_cash]}, proceeds]},
+                        'updated_at': datetime.now(timezone.utc)
+                    }}],
+                    projection={'cash_balance': 1},
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                if user is None:
+                    raise RuntimeError(f'User {user_id} disappeared before the sale was credited')
+            except Exception:
+                if session is None:
+                    # Undo the sale: drop its ledger entry, then restore the position from the ledger
+                    self.transactions.delete_one({'_id': entry['_id']})
+                    self.holdings_store.rebuild(user_id)
+                raise
+            return user['cash_balance'], position
+
+        return self._run(steps)
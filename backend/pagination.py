@@ -0,0 +1,61 @@
+"""Keyset (cursor) pagination over (sort field, _id), newest first"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+class InvalidCursorError(ValueError):
+    """The cursor was not issued for this listing or has been tampered with"""
+
+
+def encode_cursor(field, document):
+    """Opaque cursor pointing just after `document` in a listing sorted by (field, _id) descending"""
+    value = document[field]
+    payload = {'k': field, 'v': value.isoformat() if isinstance(value, datetime) else value, 'id': str(document['_id'])}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(field, cursor):
+    """(value, ObjectId) position from encode_cursor(); raises InvalidCursorError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['k'] != field:
+            raise InvalidCursorError(f"Cursor is not for a listing sorted by {field}")
+        value = payload['v']
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value, ObjectId(payload['id'])
+    except InvalidCursorError:
+        raise
+    except (binascii.Error, ValueError, TypeError, KeyError, InvalidId) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+
+
+def keyset_filter(query, field, value, last_id):
+    """`query` narrowed to documents after (value, last_id) in (field, _id) descending order"""
+    # The $lte bound keeps the index scan tight; the $or breaks ties on _id within equal values
+    return {'$and': [query, {field: {'$lte': value}}, {'$or': [
+        {field: {'$lt': value}},
+        {field: value, '_id': {'$lt': last_id}}
+    ]}]}
+
+
+def keyset_page(collection, query, field, limit, cursor=None, skip=0, projection=None):
+    """One page of `query` sorted by (field, _id) descending; returns (documents, next cursor or None)
+
+    With a cursor the page starts right after it, using the (user_id, field, _id) index instead of
+    skipping; `skip` is the old page-number path and is only applied when no cursor is given.
+    """
+    limit = max(int(limit), 1)
+    if cursor:
+        query = keyset_filter(query, field, *decode_cursor(field, cursor))
+    find = collection.find(query, projection).sort([(field, -1), ('_id', -1)])
+    if skip and not cursor:
+        find = find.skip(skip)
+    # One extra document tells us whether there is a next page
+    documents = list(find.limit(limit + 1))
+    next_cursor = encode_cursor(field, documents[limit - 1]) if len(documents) > limit else None
+    return documents[:limit], next_cursor
@@ -0,0 +1,139 @@
+"""Receipt image preprocessing as named, timed stages chosen per profile or per request"""
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+# Profile used when a request does not pick one
+PREPROCESS_PROFILE = os.getenv('PREPROCESS_PROFILE', 'accurate').lower()
+
+# Photos taller than this are shrunk before any filtering ('downscale' stage)
+DOWNSCALE_MAX_HEIGHT = 2000
+
+
+def _downscale(gray, target_height):
+    height = gray.shape[0]
+    if height <= DOWNSCALE_MAX_HEIGHT:
+        return gray
+    scale = DOWNSCALE_MAX_HEIGHT / height
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _upscale(gray, target_height):
+    height, width = gray.shape
+    if not target_height or height >= target_height:
+        return gray
+    return cv2.resize(gray, (int(width * target_height / height), target_height), interpolation=cv2.INTER_CUBIC)
+
+
+def _nlm(gray, target_height):
+    return cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+
+
+def _bilateral(gray, target_height):
+    return cv2.bilateralFilter(gray, 5, 40, 40)
+
+
+def _median(gray, target_height):
+    return cv2.medianBlur(gray, 3)
+
+
+def _clahe(gray, target_height):
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+
+
+def _threshold(gray, target_height):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 4)
+
+
+def _open(gray, target_height):
+    return cv2.morphologyEx(gray, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+
+
+# Stage name -> fn(gray, target_height) returning the new grayscale image
+STAGES = {
+    'downscale': _downscale,
+    'upscale': _upscale,
+    'nlm': _nlm,
+    'bilateral': _bilateral,
+    'median': _median,
+    'clahe': _clahe,
+    'threshold': _threshold,
+    'open': _open
+}
+
+PROFILES = {
+    # The original chain (without its no-op 1x1 blur and close): NLM on the upscaled image
+    'accurate': ['upscale', 'nlm', 'clahe', 'threshold', 'open'],
+    # Edge-preserving bilateral filter at capture size, before upscaling
+    'balanced': ['downscale', 'bilateral', 'upscale', 'clahe', 'threshold', 'open'],
+    # 3x3 median at capture size, no contrast equalization
+    'fast': ['downscale', 'median', 'upscale', 'threshold', 'open']
+}
+
+
+def resolve_stages(spec=None):
+    """Stage list for a profile name or a comma-separated list of distinct stages; raises ValueError if invalid"""
+    spec = (spec or PREPROCESS_PROFILE).strip().lower()
+    if spec in PROFILES:
+        return spec, PROFILES[spec]
+    stages = [name.strip() for name in spec.split(',') if name.strip()]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown or not stages:
+        raise ValueError(f"Unknown preprocessing profile or stage: {', '.join(unknown) or spec}. "
+                         f"Profiles: {', '.join(PROFILES)}; stages: {', '.join(STAGES)}")
+    # The list can come from a request: each stage runs at most once, so at most len(STAGES) run
+    repeated = sorted({name for name in stages if stages.count(name) > 1})
+    if repeated:
+        raise ValueError(f"Preprocessing stages may not repeat: {', '.join(repeated)}")
+    return 'custom', stages
+
+
+class PreprocessStats:
+    """Per-stage call counts and time, so slow stages show up under load"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._profiles = {}
+
+    def record(self, profile, timings):
+        with self._lock:
+            self._profiles[profile] = self._profiles.get(profile, 0) + 1
+            for name, seconds in timings.items():
+                stage = self._stages.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                stage['calls'] += 1
+                stage['total_ms'] += seconds * 1000
+                stage['max_ms'] = max(stage['max_ms'], seconds * 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'default_profile': PREPROCESS_PROFILE,
+                'profiles': dict(self._profiles),
+                'stages': {
+                    name: {
+                        'calls': s['calls'],
+                        'avg_ms': round(s['total_ms'] / s['calls'], 2),
+                        'max_ms': round(s['max_ms'], 2),
+                        'total_ms': round(s['total_ms'], 1)
+                    }
+                    for name, s in self._stages.items()
+                }
+            }
+
+
+preprocess_stats = PreprocessStats()
+
+
+def preprocess(gray, profile=None, target_height=1500):
+    """Run a profile's stages on a grayscale image; returns (image, {stage: seconds})"""
+    profile, stages = resolve_stages(profile)
+    timings = {}
+    for name in stages:
+        start = time.perf_counter()
+        gray = STAGES[name](gray, target_height)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+    preprocess_stats.record(profile, timings)
+    return gray, timings
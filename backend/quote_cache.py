@@ -0,0 +1,241 @@
+"""Shared, TTL-bounded cache for stock prices and quotes"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from single_flight import get_flight
+
+# 'memory' keeps quotes per worker only, 'mongo' also shares them between gunicorn workers
+QUOTE_CACHE_BACKEND = os.getenv('QUOTE_CACHE_BACKEND', 'memory').lower()
+QUOTE_CACHE_MAX_ENTRIES = int(os.getenv('QUOTE_CACHE_MAX_ENTRIES', 2048))
+QUOTE_CACHE_COLLECTION = 'quote_cache'
+
+# Default TTLs in seconds, per kind of cached value (key prefix before ':')
+DEFAULT_TTLS = {
+    'price': int(os.getenv('QUOTE_CACHE_TTL_PRICE', 30)),
+    'quote': int(os.getenv('QUOTE_CACHE_TTL_QUOTE', 30)),
+    'quote_summary': int(os.getenv('QUOTE_CACHE_TTL_QUOTE', 30)),
+}
+FALLBACK_TTL = 30
+
+
+class MemoryQuoteBackend:
+    """In-process LRU store (one per worker process)"""
+
+    def __init__(self, max_entries=QUOTE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, stored_at, expires_at)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at, expires_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def ages(self):
+        """Age in seconds of every live entry, most recently used last"""
+        now = time.time()
+        with self._lock:
+            return {key: round(now - entry[1], 1) for key, entry in self._entries.items() if entry[2] > now}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoQuoteBackend:
+    """Mongo-backed store shared by every worker connected to the same database"""
+
+    def __init__(self, collection_name=QUOTE_CACHE_COLLECTION):
+        from database import ReceiptDatabase
+        self.collection_name = collection_name
+        self.receipt_db = ReceiptDatabase()
+        self._ttl_index_created = False
+
+    def _collection(self):
+        if not self.receipt_db.is_connected:
+            return None
+        collection = self.receipt_db.db[self.collection_name]
+        if not self._ttl_index_created:
+            try:
+                # Let Mongo drop expired quotes on its own
+                collection.create_index('expires_at', expireAfterSeconds=0)
+            except Exception as e:
+                print(f"Quote cache TTL index creation failed: {e}")
+            self._ttl_index_created = True
+        return collection
+
+    def get(self, key):
+        try:
+            collection = self._collection()
+            if collection is None:
+                return None
+            doc = collection.find_one({'_id': key})
+            if not doc:
+                return None
+            stored_at = doc['stored_at'].replace(tzinfo=timezone.utc).timestamp()
+            expires_at = doc['expires_at'].replace(tzinfo=timezone.utc).timestamp()
+            if expires_at <= time.time():
+                return None
+            return (doc['value'], stored_at, expires_at)
+        except Exception as e:
+            print(f"Quote cache read failed for {key}: {e}")
+            return None
+
+    def set(self, key, value, stored_at, expires_at):
+        try:
+            collection = self._collection()
+            if collection is None:
+                return
+            collection.update_one(
+                {'_id': key},
+                {'$set': {
+                    'value': value,
+                    'stored_at': datetime.fromtimestamp(stored_at, timezone.utc),
+                    'expires_at': datetime.fromtimestamp(expires_at, timezone.utc)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Quote cache write failed for {key}: {e}")
+
+    def delete(self, key):
+        try:
+            collection = self._collection()
+            if collection is not None:
+                collection.delete_one({'_id': key})
+        except Exception as e:
+            print(f"Quote cache delete failed for {key}: {e}")
+
+
+class QuoteCache:
+    """Per-key TTL cache with an in-process LRU and an optional shared backend"""
+
+    def __init__(self, shared_backend=None, max_entries=QUOTE_CACHE_MAX_ENTRIES, ttls=None):
+        self.local = MemoryQuoteBackend(max_entries)
+        self.shared = shared_backend
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        # Concurrent misses for the same key wait on one upstream fetch
+        self.flight = get_flight('quote_cache')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def ttl_for(self, key):
+        """TTL in seconds for a key such as 'price:AAPL'"""
+        return self.ttls.get(key.split(':', 1)[0], FALLBACK_TTL)
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing/expired"""
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count('hits')
+            return entry[0]
+
+        if self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                # Keep the remaining TTL so workers expire the quote together
+                self.local.set(key, *entry)
+                self._count('shared_hits')
+                return entry[0]
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds (defaults to the key's kind TTL)"""
+        if value is None:
+            return
+        ttl = self.ttl_for(key) if ttl is None else ttl
+        stored_at = time.time()
+        expires_at = stored_at + ttl
+        self.local.set(key, value, stored_at, expires_at)
+        if self.shared is not None:
+            self.shared.set(key, value, stored_at, expires_at)
+
+    def get_or_fetch(self, key, fetch, ttl=None):
+        """Return the cached value for key, calling fetch() and caching its result on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def fetch_and_store():
+            # A flight that finished just before this one may already have stored it
+            entry = self.local.get(key)
+            if entry is not None:
+                return entry[0]
+            fetched = fetch()
+            self.set(key, fetched, ttl)
+            return fetched
+
+        return self.flight.do(key, fetch_and_store)
+
+    def invalidate(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def stats(self, include_entries=False):
+        """Hit/miss counters plus entry ages for the stats endpoint"""
+        ages = self.local.ages()
+        lookups = self.hits + self.shared_hits + self.misses
+        stats = {
+            'backend': 'mongo' if self.shared is not None else 'memory',
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            'entries': len(ages),
+            'max_entries': self.local.max_entries,
+            'evictions': self.local.evictions,
+            'oldest_age_seconds': max(ages.values()) if ages else 0,
+            'ttls': self.ttls,
+            'single_flight': self.flight.stats()
+        }
+        if include_entries:
+            stats['entry_ages'] = ages
+        return stats
+
+
+def _create_quote_cache():
+    shared = None
+    if QUOTE_CACHE_BACKEND == 'mongo':
+        try:
+            shared = MongoQuoteBackend()
+        except Exception as e:
+            print(f"⚠️  Mongo quote cache unavailable, using in-process cache only: {e}")
+    print(f"Quote cache: backend={'mongo' if shared else 'memory'}, max_entries={QUOTE_CACHE_MAX_ENTRIES}")
+    return QuoteCache(shared_backend=shared)
+
+
+# Process-wide cache shared by the trading and auth blueprints
+quote_cache = _create_quote_cache()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Rebuild or verify the materialized holdings collection from the transactions ledger
+Usage:
+    python rebuild_holdings.py --verify            # report drift for every user
+    python rebuild_holdings.py                     # rebuild every user's holdings
+    python rebuild_holdings.py --user <user_id>    # limit to one user (string _id)
+"""
+import argparse
+import sys
+from database import ReceiptDatabase
+from holdings import HoldingsStore, MATERIALIZED_FLAG
+from bson import ObjectId
+
+def rebuild_holdings(user_ids, verify_only=False):
+    """Rebuild (or just verify) holdings for the given users; returns the number of drifted positions"""
+    db = ReceiptDatabase()
+    
+    if not db.is_connected:
+        print("❌ Database not connected!")
+        return -1
+    
+    store = HoldingsStore(db)
+    if not user_ids:
+        user_ids = db.db['transactions'].distinct('user_id')
+    
+    total_drift = 0
+    for user_id in user_ids:
+        drift = store.verify(user_id)
+        total_drift += len(drift)
+        for item in drift:
+            print(f"⚠️  Drift {item['user_id']} {item['ticker']}: stored={item['stored']} expected={item['expected']}")
+        
+        if not verify_only and drift:
+            store.rebuild(user_id)
+            if ObjectId.is_valid(user_id):
+                db.db['users'].update_one({'_id': ObjectId(user_id)}, {'$set': {MATERIALIZED_FLAG: True}})
+            print(f"✅ Rebuilt holdings for {user_id}")
+    
+    action = "Verified" if verify_only else "Checked and repaired"
+    print(f"{action} {len(user_ids)} users, {total_drift} drifted positions")
+    return total_drift
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verify', action='store_true', help='only report drift, do not rewrite holdings')
+    parser.add_argument('--user', action='append', default=[], help='user _id to process (repeatable)')
+    args = parser.parse_args()
+    
+    drift = rebuild_holdings(args.user, verify_only=args.verify)
+    # Non-zero exit when verification finds drift so it can gate deploys/cron alerts
+    sys.exit(1 if drift < 0 or (drift and args.verify) else 0)
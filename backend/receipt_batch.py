@@ -0,0 +1,164 @@
+"""Batch receipt uploads: many images (or a zip of them) scanned concurrently, saved with an insert_many per chunk
+
+A batch keeps one request thread busy for minutes, so the web server must run threaded workers
+(gunicorn --worker-class gthread, see Procfile); with sync workers a 50-receipt batch outlives --timeout.
+"""
+import functools
+import io
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bson import ObjectId
+from receipt_dedupe import dedupe_cache
+from receipt_scanner import ReceiptScanError, scan_receipt_image
+from uploads import MAX_REQUEST_BYTES, MAX_UPLOAD_BYTES, UploadTooLargeError
+
+SCAN_BATCH_MAX_FILES = int(os.getenv('SCAN_BATCH_MAX_FILES', 50))
+# Total uncompressed image bytes in one batch, so zips cannot expand past what a plain upload may carry
+SCAN_BATCH_MAX_BYTES = int(os.getenv('SCAN_BATCH_MAX_MB', MAX_REQUEST_BYTES // (1024 * 1024))) * 1024 * 1024
+# Receipts scanned at once; their OCR passes share the OCR process pool
+SCAN_BATCH_CONCURRENCY = int(os.getenv('SCAN_BATCH_CONCURRENCY', min(4, os.cpu_count() or 1)))
+# Finished receipts are saved (and only then streamed) in groups of this many
+SCAN_BATCH_SAVE_EVERY = int(os.getenv('SCAN_BATCH_SAVE_EVERY', SCAN_BATCH_CONCURRENCY))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.gif')
+
+
+class BatchError(Exception):
+    """The batch as a whole was rejected; the message is shown to the user"""
+
+
+def _read_member(data, member):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        # zipfile stops at the member's declared size, so the size checked up front is the most read
+        return archive.read(member)
+
+
+def _zip_images(file_name, data):
+    """(name, uncompressed size, loader) for each image in a zip; nothing is decompressed here"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or '__MACOSX' in name or os.path.basename(name).startswith('.'):
+                continue
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if member.file_size > MAX_UPLOAD_BYTES:
+                raise UploadTooLargeError(f'{name} in {file_name}')
+            yield os.path.basename(name), member.file_size, functools.partial(_read_member, data, member)
+
+
+def collect_batch_images(uploads, max_files=SCAN_BATCH_MAX_FILES, max_bytes=SCAN_BATCH_MAX_BYTES):
+    """(file_name, loader) pairs from uploaded (file_name, bytes) pairs; loader() returns the image bytes
+
+    Zip members are only listed here and decompressed one at a time by the scan that needs them.
+    """
+    images = []
+    total_bytes = 0
+    for file_name, data in uploads:
+        if file_name.lower().endswith('.zip') or zipfile.is_zipfile(io.BytesIO(data)):
+            members = _zip_images(file_name, data)
+        elif len(data) > MAX_UPLOAD_BYTES:
+            raise UploadTooLargeError(file_name)
+        else:
+            members = [(file_name, len(data), functools.partial(bytes, data))]
+        try:
+            for name, size, load in members:
+                images.append((name, load))
+                total_bytes += size
+                if len(images) > max_files:
+                    raise BatchError(f'Too many receipts in one batch (limit {max_files})')
+                if total_bytes > max_bytes:
+                    raise UploadTooLargeError('Batch (uncompressed)', max_bytes)
+        except zipfile.BadZipFile:
+            raise BatchError(f'{file_name} is not a valid zip archive')
+    if not images:
+        raise BatchError('No receipt images found in upload')
+    return images
+
+
+class BatchReceiptWriter:
+    """Stands in for the database during a batch: ids are assigned up front, documents are inserted on flush"""
+
+    def __init__(self, receipt_db):
+        self.receipt_db = receipt_db
+        self.documents = []
+        self._lock = threading.Lock()
+
+    def find_scan_by_image_hash(self, user_id, image_sha256):
+        return self.receipt_db.find_scan_by_image_hash(user_id, image_sha256)
+
+    def save_receipt_scan(self, user_id, company_name, total_amount, confidence, extracted_text, scan_metadata=None,
+                          duplicate_of=None):
+        document = self.receipt_db.new_receipt_document(user_id, company_name, total_amount, confidence,
+                                                        extracted_text, scan_metadata, duplicate_of)
+        document['_id'] = ObjectId()
+        with self._lock:
+            self.documents.append(document)
+        return str(document['_id'])
+
+    def flush(self):
+        """Insert everything collected since the last flush; returns the ids that were saved"""
+        with self._lock:
+            documents, self.documents = self.documents, []
+        saved = set(self.receipt_db.save_receipt_scans(documents))
+        for document in documents:
+            receipt_id = str(document['_id'])
+            if receipt_id not in saved:
+                # Later uploads must not be deduplicated against a receipt that was never stored
+                dedupe_cache.forget_receipt(receipt_id)
+        return saved
+
+
+def scan_receipt_batch(images, user_id, receipt_db, use_cache=True, preprocess_profile=None,
+                       concurrency=SCAN_BATCH_CONCURRENCY):
+    """Scan images concurrently, yielding one result per receipt as it finishes, then a summary"""
+    writer = BatchReceiptWriter(receipt_db)
+
+    def scan(index, file_name, load):
+        try:
+            result = scan_receipt_image(load(), file_name, user_id, writer,
+                                        use_cache=use_cache, preprocess_profile=preprocess_profile)
+        except ReceiptScanError as e:
+            result = {'success': False, 'error': str(e), 'extracted_text': e.extracted_text}
+        except Exception as e:
+            print(f"Batch scan of {file_name} failed: {e}")
+            result = {'success': False, 'error': f'Processing error: {str(e)}'}
+        return dict(result, index=index, file_name=file_name)
+
+    succeeded = 0
+    saved = set()
+
+    def saved_results(results):
+        # A receipt_id is only streamed once its document is in the database
+        saved.update(writer.flush())
+        for result in results:
+            if result.get('receipt_id') and result['receipt_id'] not in saved:
+                result = dict(result, saved=False)
+                result.pop('receipt_id')
+            yield result
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch-scan')
+    futures = [pool.submit(scan, index, file_name, load) for index, (file_name, load) in enumerate(images)]
+    try:
+        pending = []
+        for future in as_completed(futures):
+            result = future.result()
+            succeeded += result['success']
+            pending.append(result)
+            if len(pending) >= max(1, SCAN_BATCH_SAVE_EVERY):
+                yield from saved_results(pending)
+                pending = []
+        yield from saved_results(pending)
+    finally:
+        # On a client disconnect (GeneratorExit) scans not yet started are cancelled;
+        # only the ones already running finish and get saved
+        pool.shutdown(wait=True, cancel_futures=True)
+        saved.update(writer.flush())
+    yield {
+        'summary': True,
+        'total': len(images),
+        'succeeded': succeeded,
+        'failed': len(images) - succeeded,
+        'saved': len(saved)
+    }
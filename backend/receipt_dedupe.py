@@ -0,0 +1,79 @@
+"""Duplicate-upload detection by exact SHA-256 of the uploaded bytes, scoped per user"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+RECEIPT_DEDUPE_MAX_ENTRIES = int(os.getenv('RECEIPT_DEDUPE_MAX_ENTRIES', 5000))
+
+
+def image_sha256(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class ReceiptDedupeCache:
+    """Bounded LRU of recent scan results keyed by (user_id, image SHA-256)"""
+
+    def __init__(self, max_entries=RECEIPT_DEDUPE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, sha256) -> {'receipt_id', 'result'}
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, user_id, sha256, load_exact=None):
+        """Entry for this user's identical image, or None"""
+        # On a miss, load_exact() finds an identical upload scanned by another worker
+        # and returns {'receipt_id', 'result'} or None
+        with self._lock:
+            entry = self._entries.get((user_id, sha256))
+            if entry is not None:
+                self._entries.move_to_end((user_id, sha256))
+                self.cache_hits += 1
+                return dict(entry)
+
+        stored = load_exact() if load_exact is not None else None
+        if stored is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self.remember(user_id, sha256, stored['receipt_id'], stored['result'])
+        with self._lock:
+            self.db_hits += 1
+        return dict(stored)
+
+    def remember(self, user_id, sha256, receipt_id, result):
+        with self._lock:
+            self._entries[(user_id, sha256)] = {'receipt_id': receipt_id, 'result': result}
+            self._entries.move_to_end((user_id, sha256))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def forget_receipt(self, receipt_id):
+        """Drop entries pointing at a deleted or corrected receipt"""
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry['receipt_id'] == receipt_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            hits = self.cache_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'users': len({user_id for user_id, _ in self._entries}),
+                'max_entries': self.max_entries,
+                'cache_hits': self.cache_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# Process-wide cache used by the receipt scanner
+dedupe_cache = ReceiptDedupeCache()
@@ -0,0 +1,200 @@
+"""Receipt text parser: every pattern compiled once, company/total/tax/date/items extracted together"""
+import re
+from datetime import datetime
+
+# How many non-empty lines from the top can hold the store name
+HEADER_LINES = 12
+
+# The five explicit total patterns as one scan. Each alternative sits in a lookahead so matches may
+# overlap (e.g. 'net total 12.00' matches both the 'net total' and the 'total' forms). The leading
+# character class rejects most positions before any alternative is tried.
+_TOTAL_RE = re.compile(
+    r'(?=[tabgfn$])(?=(?:'
+    r'(?:total|amount\s*due|balance\s*due|grand\s*total)\s*:?\s*\$?(?P<t1>\d{1,4}\.\d{2})'
+    r'|total\s*\$?(?P<t2>\d{1,4}\.\d{2})'
+    r'|\$(?P<t3>\d{1,4}\.\d{2})\s*(?:total|due)'
+    r'|(?:final|net)\s*(?:total|amount)\s*:?\s*\$?(?P<t4>\d{1,4}\.\d{2})'
+    r'|amount\s*:?\s*\$?(?P<t5>\d{1,4}\.\d{2})'
+    r'))',
+    re.IGNORECASE
+)
+_TOTAL_GROUPS = ('t1', 't2', 't3', 't4', 't5')
+
+_TOTAL_KEYWORDS = ('total', 'amount', 'due', 'balance', 'grand')
+_TOTAL_KEYWORD_RE = re.compile(r'\b(?:total|amount|due|balance|grand)\b', re.IGNORECASE)
+_DOLLAR_RE = re.compile(r'\$(\d{1,4}\.\d{2})')
+
+# Header lines that are addresses, phone numbers, dates, card numbers, ... rather than a store name
+_SKIP_LINE_RE = re.compile(
+    r'(?:\d+\s+.*(?:street|st|avenue|ave|road|rd|boulevard|blvd)'
+    r'|\(\d{3}\)\s*\d{3}-\d{4}'
+    r'|\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'
+    r'|store\s*#?\d+'
+    r'|\d{1,2}:\d{2}'
+    r'|\$\d+\.?\d*'
+    r'|receipt\s*#?\d*'
+    r'|transaction\s*#?\d*'
+    r'|cashier:?\s*\w+'
+    r'|terminal:?\s*\d+'
+    r'|card\s*#?\*+\d+'
+    r'|\*+\d{4}$'
+    r'|auth\s*code:?\s*\d+'
+    r'|ref\s*#?\d+)',
+    re.IGNORECASE
+)
+_NUMERIC_LINE_RE = re.compile(r'^[\d\s\.\-\(\)]+$')
+_NAME_CHARS_RE = re.compile(r'[^\w\s&\'-]')
+_GENERIC_WORDS = frozenset(['receipt', 'thank you', 'thanks', 'visit', 'again', 'customer', 'copy'])
+_STORE_WORD_RE = re.compile(r'STORE|MARKET|SHOP|FOODS|MART')
+_ALPHA_RE = re.compile(r'[^\W\d_]')
+
+_TAX_RE = re.compile(r'\b(?:sales\s*)?tax\b[^\d\n]*?\$?(\d{1,4}\.\d{2})', re.IGNORECASE)
+_SUBTOTAL_RE = re.compile(r'\bsub\s*-?\s*total\b[^\d\n]*?\$?(\d{1,4}\.\d{2})', re.IGNORECASE)
+_DATE_RE = re.compile(r'\b(?:(\d{4})-(\d{1,2})-(\d{1,2})|(\d{1,2})[/-](\d{1,2})[/-](\d{2,4}))\b')
+
+# 'DESCRIPTION [qty @ unit] 12.34' at the end of a line
+_ITEM_RE = re.compile(
+    r'^(?P<desc>[A-Za-z][\w\s&\'\-\.\/%#]*?)\s+(?:(?P<qty>\d+)\s*[@xX]\s*\$?\d{1,4}\.\d{2}\s+)?\$?(?P<amount>\d{1,4}\.\d{2})\s*[A-Z]?$'
+)
+_NOT_ITEM_RE = re.compile(
+    r'\b(?:total|subtotal|sub\s*total|tax|amount|due|balance|change|cash|visa|mastercard|amex|'
+    r'debit|credit|tender|payment|savings|discount)\b',
+    re.IGNORECASE
+)
+
+
+def _parse_date(match):
+    if match.group(1):
+        year, month, day = match.group(1), match.group(2), match.group(3)
+    else:
+        month, day, year = match.group(4), match.group(5), match.group(6)
+    year = int(year)
+    if year < 100:
+        year += 2000
+    try:
+        return datetime(year, int(month), int(day)).date().isoformat()
+    except ValueError:
+        return None
+
+
+def _company_candidate(line, position):
+    """Scored store-name candidate for a header line, or None if the line cannot be a name"""
+    if len(line) < 3 or _SKIP_LINE_RE.match(line) or _NUMERIC_LINE_RE.match(line):
+        return None
+    if line.lower() in _GENERIC_WORDS:
+        return None
+    if len(line) < 4 or not _ALPHA_RE.search(line):
+        return None
+
+    words = _NAME_CHARS_RE.sub(' ', line).split()
+    clean_name = ' '.join(words)
+    upper_name = clean_name.upper()
+    score = 0
+    if position < 3:
+        score += 10
+    if len(words) <= 4:
+        score += 5
+    if upper_name == clean_name:
+        score += 3
+    if _STORE_WORD_RE.search(upper_name):
+        score += 5
+    return {'name': clean_name.title(), 'score': score, 'position': position}
+
+
+def _find_total(text, dollar_amounts, keyword_lines):
+    """Same three tiers as the original find_total_amount"""
+    # 1. Explicit total patterns anywhere in the text
+    explicit = []
+    for match in _TOTAL_RE.finditer(text):
+        for group in _TOTAL_GROUPS:
+            value = match.group(group)
+            if value is not None:
+                amount = float(value)
+                if 0.50 <= amount <= 9999.99:
+                    explicit.append(amount)
+                break
+    if explicit:
+        return max(explicit)
+
+    # 2. Dollar amounts from the line before to two lines after a total keyword
+    nearby = [
+        amount
+        for i in keyword_lines
+        for line_amounts in dollar_amounts[max(0, i - 1):i + 3]
+        for amount in line_amounts
+        if 1.00 <= amount <= 9999.99
+    ]
+    if nearby:
+        return max(nearby)
+
+    # 3. Largest reasonable dollar amount
+    valid = [amount for line_amounts in dollar_amounts for amount in line_amounts if 5.00 <= amount <= 999.99]
+    return max(valid) if valid else 0.0
+
+
+def parse_receipt(text):
+    """Company candidates (best first), total, subtotal, tax, date and line items from OCR text"""
+    lines = text.split('\n')
+    dollar_amounts = []
+    keyword_lines = []
+    candidates = []
+    line_items = []
+    tax = None
+    subtotal = None
+    receipt_date = None
+    header_position = 0
+
+    for i, raw_line in enumerate(lines):
+        dollar_amounts.append([float(value) for value in _DOLLAR_RE.findall(raw_line)] if '$' in raw_line else [])
+
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        # Substring checks are much cheaper than a regex miss on most lines
+        lower = line.lower()
+        if any(word in lower for word in _TOTAL_KEYWORDS) and _TOTAL_KEYWORD_RE.search(line):
+            keyword_lines.append(i)
+
+        if header_position < HEADER_LINES:
+            candidate = _company_candidate(line, header_position)
+            if candidate:
+                candidates.append(candidate)
+            header_position += 1
+
+        if receipt_date is None and ('/' in line or '-' in line):
+            for match in _DATE_RE.finditer(line):
+                receipt_date = _parse_date(match)
+                if receipt_date:
+                    break
+
+        if 'sub' in lower:
+            subtotal_match = _SUBTOTAL_RE.search(line)
+            if subtotal_match:
+                subtotal = float(subtotal_match.group(1))
+                continue
+        if 'tax' in lower:
+            tax_match = _TAX_RE.search(line)
+            if tax_match:
+                tax = float(tax_match.group(1))
+                continue
+
+        item_match = _ITEM_RE.match(line)
+        if item_match and not _NOT_ITEM_RE.search(line):
+            line_items.append({
+                'description': ' '.join(item_match.group('desc').split()),
+                'quantity': int(item_match.group('qty') or 1),
+                'amount': float(item_match.group('amount'))
+            })
+
+    # Stable sort keeps the earliest line first among equal scores, like max() did
+    candidates.sort(key=lambda c: -c['score'])
+    return {
+        'company_candidates': candidates,
+        'company_name': candidates[0]['name'] if candidates else "Unknown Store",
+        'total_amount': _find_total(text, dollar_amounts, keyword_lines),
+        'subtotal': subtotal,
+        'tax': tax,
+        'date': receipt_date,
+        'line_items': line_items
+    }
@@ -0,0 +1,191 @@
+"""Find the receipt and its text lines so preprocessing and OCR only see text pixels"""
+import os
+import cv2
+import numpy as np
+
+# 'off' sends the whole frame to OCR as before. With Tesseract, benchmarks/bench_regions.py finds
+# regions as accurate at under a third of the pixels; untrusted region reads still get a full-frame pass
+RECEIPT_REGIONS = os.getenv('RECEIPT_REGIONS', 'on').lower() == 'on'
+# 'stack' runs the multi-pass OCR on all lines stacked into one image,
+# 'blocks' runs one pass per group of lines in parallel on the OCR pool
+REGION_OCR_MODE = os.getenv('REGION_OCR_MODE', 'stack').lower()
+
+# Detection runs on a copy no taller than this; crops are cut from the full-resolution image
+DETECT_HEIGHT = 1000
+# Line crops are scaled so the median text line is about this tall (Tesseract prefers 30-40px glyphs)
+LINE_TARGET_HEIGHT = 40
+# A contour must cover this share of the frame to be taken as the receipt
+MIN_RECEIPT_AREA = 0.2
+# Skew search range and step in degrees
+MAX_SKEW = 8.0
+SKEW_STEP = 0.5
+LINE_GAP = 12
+LINES_PER_BLOCK = 8
+
+
+def _order_corners(points):
+    """Top-left, top-right, bottom-right, bottom-left"""
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)], points[np.argmin(diffs)],
+        points[np.argmax(sums)], points[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+
+def find_receipt_quad(small):
+    """Corners of the receipt in a downscaled grayscale image, or None when it fills the frame"""
+    frame_area = small.shape[0] * small.shape[1]
+    edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < MIN_RECEIPT_AREA * frame_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4:
+            return _order_corners(approx.reshape(4, 2).astype(np.float32))
+
+    # No clean quadrilateral (torn edge, fingers): bright paper on a darker background
+    _, bright = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(bright, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        area = cv2.contourArea(largest)
+        if MIN_RECEIPT_AREA * frame_area <= area <= 0.95 * frame_area:
+            return _order_corners(cv2.boxPoints(cv2.minAreaRect(largest)).astype(np.float32))
+    return None
+
+
+def warp_to_quad(gray, quad):
+    """Top-down view of the quadrilateral"""
+    tl, tr, br, bl = quad
+    width = int(max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl)))
+    height = int(max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr)))
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(quad, target)
+    return cv2.warpPerspective(gray, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+
+
+def _rotate(image, angle, border=255):
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+
+
+def _ink(small):
+    """Text pixels as 255 on 0"""
+    ink = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    # Slivers of background left along the edges by the warp would frame (and hide) every line
+    margin = max(2, min(ink.shape) // 100)
+    ink[:margin, :] = ink[-margin:, :] = 0
+    ink[:, :margin] = ink[:, -margin:] = 0
+    return ink
+
+
+def estimate_skew(small):
+    """Rotation (degrees) that makes text rows sharpest, by row-projection variance"""
+    ink = _ink(small)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP):
+        rows = _rotate(ink, angle, border=0).sum(axis=1, dtype=np.float64)
+        score = rows.var()
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def find_text_lines(small):
+    """Bounding boxes (x, y, w, h) of text lines, top to bottom"""
+    height, width = small.shape
+    ink = _ink(small)
+    # Smear characters horizontally into one blob per line
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, width // 40), 3))
+    blobs = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < 4 or w < 8 or h > height / 6 or (w > 0.98 * width and h < 6):
+            continue
+        boxes.append([x, y, x + w, y + h])
+    boxes.sort(key=lambda b: (b[1], b[0]))
+
+    # Blobs that share most of their height (item and price columns) are one line
+    lines = []
+    for box in boxes:
+        if lines:
+            last = lines[-1]
+            overlap = min(last[3], box[3]) - max(last[1], box[1])
+            if overlap > 0.5 * min(last[3] - last[1], box[3] - box[1]):
+                last[:] = [min(last[0], box[0]), min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3])]
+                continue
+        lines.append(box)
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in lines]
+
+
+def _stack(crops, width):
+    """Crops one under another on white, left-aligned"""
+    height = sum(crop.shape[0] for crop in crops) + LINE_GAP * (len(crops) + 1)
+    canvas = np.full((height, width + 2 * LINE_GAP), 255, dtype=np.uint8)
+    y = LINE_GAP
+    for crop in crops:
+        canvas[y:y + crop.shape[0], LINE_GAP:LINE_GAP + crop.shape[1]] = crop
+        y += crop.shape[0] + LINE_GAP
+    return canvas
+
+
+def detect_text_regions(gray):
+    """Receipt crop, deskew and stacked line crops for a full-resolution grayscale image; None if no lines"""
+    pixels_in = gray.shape[0] * gray.shape[1]
+
+    scale = min(1.0, DETECT_HEIGHT / gray.shape[0])
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    quad = find_receipt_quad(small)
+    if quad is not None:
+        gray = warp_to_quad(gray, quad / scale)
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    # Row projections are just as sharp at half the detection size
+    skew = estimate_skew(cv2.resize(small, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA))
+    if skew:
+        gray = _rotate(gray, skew, border=int(np.median(gray)))
+        small = _rotate(small, skew, border=int(np.median(small)))
+
+    lines = find_text_lines(small)
+    if not lines:
+        return None
+
+    # One zoom for every line keeps relative glyph sizes; upscale small text, never shrink it
+    median_height = float(np.median([h for _, _, _, h in lines])) / scale
+    zoom = max(1.0, LINE_TARGET_HEIGHT / median_height)
+
+    crops = []
+    for x, y, w, h in lines:
+        pad = max(2, int(h * 0.25))
+        x0, y0 = max(0, int((x - pad) / scale)), max(0, int((y - pad) / scale))
+        x1 = min(gray.shape[1], int((x + w + pad) / scale))
+        y1 = min(gray.shape[0], int((y + h + pad) / scale))
+        crop = gray[y0:y1, x0:x1]
+        if zoom > 1.0:
+            crop = cv2.resize(crop, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_CUBIC)
+        crops.append(crop)
+
+    width = max(crop.shape[1] for crop in crops)
+    stacked = _stack(crops, width)
+    blocks = [_stack(crops[i:i + LINES_PER_BLOCK], max(c.shape[1] for c in crops[i:i + LINES_PER_BLOCK]))
+              for i in range(0, len(crops), LINES_PER_BLOCK)]
+    # 'blocks' are groups of lines for OCR in parallel
+    return {
+        'image': stacked,
+        'blocks': blocks,
+        'lines': len(lines),
+        'receipt_found': quad is not None,
+        'skew': skew,
+        'pixels_in': pixels_in,
+        'pixels_out': stacked.shape[0] * stacked.shape[1]
+    }
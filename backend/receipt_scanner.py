@@ -0,0 +1,339 @@
+"""Receipt scan pipeline: preprocessing, OCR, company/total parsing and persistence"""
+import io
+import os
+from datetime import datetime
+from merchant_catalog import merchant_catalog
+from receipt_parser import parse_receipt
+from receipt_dedupe import dedupe_cache, image_sha256
+
+# Optional imports for OCR functionality
+try:
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from ocr_engine import OCR_EARLY_EXIT_CONFIDENCE, ocr_engine
+    from receipt_regions import RECEIPT_REGIONS, REGION_OCR_MODE, detect_text_regions
+    from preprocessing import preprocess, resolve_stages
+    OCR_AVAILABLE = True
+except ImportError as e:
+    print(f"OCR packages not available: {e}")
+    OCR_AVAILABLE = False
+
+
+class ReceiptScanError(Exception):
+    """Scan finished but the receipt could not be read; the message is shown to the user"""
+
+    def __init__(self, message, extracted_text=''):
+        super().__init__(message)
+        self.extracted_text = extracted_text
+
+# Photos are decoded so their shorter side is about this long; OCR crops are upscaled to glyph size anyway
+RECEIPT_DECODE_MIN_SIDE = int(os.getenv('RECEIPT_DECODE_MIN_SIDE', 1500))
+# Refuse images that would decode to more pixels than this (decompression bombs)
+RECEIPT_MAX_PIXELS = 64 * 1000 * 1000
+
+class ReceiptImageError(ReceiptScanError):
+    """The upload is not a usable image"""
+
+def decode_receipt_image(image_bytes, min_side=RECEIPT_DECODE_MIN_SIDE):
+    """Grayscale PIL image, decoded at reduced scale when the photo is much larger than OCR needs"""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+    except Exception:
+        raise ReceiptImageError('Uploaded file is not a supported image')
+    width, height = image.size
+    if width * height > RECEIPT_MAX_PIXELS:
+        raise ReceiptImageError(f'Image is too large ({width}x{height})')
+
+    scale = min_side / min(width, height)
+    if scale < 1:
+        # JPEG: the decoder itself skips 1/2, 1/4 or 1/8 of the DCT work and decodes straight to luma
+        image.draft('L', (int(width * scale), int(height * scale)))
+    image = image.convert('L')
+    # Formats without draft support (PNG, WebP) arrive at full size; shrink by whole factors
+    factor = int(min(image.size) / min_side)
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+def to_grayscale(image):
+    """Grayscale uint8 array from a PIL image or an array"""
+    if isinstance(image, np.ndarray):
+        return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    if image.mode != 'L':
+        image = image.convert('L')
+    return np.asarray(image)
+
+def enhance_receipt_image(image, target_height=1500, profile=None):
+    """Enhanced preprocessing for better OCR (target_height=None keeps the input size)"""
+    processed, _ = preprocess(to_grayscale(image), profile, target_height)
+    return processed
+
+def add_timings(total, timings):
+    for name, seconds in timings.items():
+        total[name] = total.get(name, 0.0) + seconds
+    return total
+
+def ocr_regions(regions, profile=None):
+    """OCR the detected text lines, as one stacked image or as parallel blocks; returns (result, timings)"""
+    timings = {}
+    if REGION_OCR_MODE == 'blocks':
+        blocks = []
+        for block in regions['blocks']:
+            processed, block_timings = preprocess(block, profile, target_height=None)
+            blocks.append(processed)
+            add_timings(timings, block_timings)
+        return ocr_engine.extract_blocks(blocks), timings
+    processed_image, timings = preprocess(regions['image'], profile, target_height=None)
+    return ocr_engine.extract(processed_image, accept=receipt_text_accepted), timings
+
+def ocr_rank(result):
+    """Order OCR results by Tesseract's word confidence, then by amount of text"""
+    return (result['confidence'], len(result['text'].strip()))
+
+def region_text_trusted(result):
+    """Region OCR is used without a full-frame pass only when it is confident and has a total and company"""
+    return (result is not None and len(result['text'].strip()) >= 10
+            and result['confidence'] >= OCR_EARLY_EXIT_CONFIDENCE and receipt_text_accepted(result['text']))
+
+def receipt_text_accepted(text):
+    """Early-exit check for OCR passes: a total and a recognizable company were found"""
+    parsed = parse_receipt(text)
+    if parsed['total_amount'] <= 0:
+        return False
+    return merchant_catalog.match(text) is not None or parsed['company_name'] != "Unknown Store"
+
+def extract_text_robust(processed_img):
+    """Multi-pass OCR extraction on the OCR process pool"""
+    result = ocr_engine.extract(processed_img, accept=receipt_text_accepted)
+    return result['text'] if result else ""
+
+def detect_popular_company(text):
+    """Detect popular companies from OCR text using fuzzy matching"""
+    match = merchant_catalog.match(text)
+    if match is None:
+        return None
+    if match['confidence'] == 'high':
+        print(f"Found company variation '{match['matched_text']}' for {match['name']}")
+    else:
+        print(f"Found partial match '{match['matched_text']}' for {match['name']}")
+    return match
+
+def find_company_name(text, parsed=None):
+    """Find company name with enhanced popular company detection"""
+    
+    # First, try to detect popular companies
+    popular_company = detect_popular_company(text)
+    if popular_company:
+        return popular_company['name']
+    
+    # Fallback to the best-scoring header line for unknown companies
+    parsed = parsed or parse_receipt(text)
+    company_name = parsed['company_name']
+    if company_name != "Unknown Store":
+        # Prefer the catalog's spelling when the header line is a known merchant name
+        merchant = merchant_catalog.get_by_name(company_name)
+        if merchant:
+            return merchant['name']
+    return company_name
+
+def find_total_amount(text):
+    """Find total amount with better patterns"""
+    return parse_receipt(text)['total_amount']
+
+def stored_scan_result(receipt):
+    """Scan response payload rebuilt from a saved receipt document"""
+    metadata = receipt.get('metadata', {})
+    return {
+        'success': True,
+        'company_name': receipt['company_name'],
+        'total_amount': receipt['total_amount'],
+        'confidence': receipt['confidence'],
+        'extracted_text': receipt.get('extracted_text', ''),
+        'ticker': metadata.get('ticker'),
+        'logo': metadata.get('logo', '🏪'),
+        'is_popular_company': metadata.get('detected_company', False),
+        'tax': metadata.get('tax'),
+        'receipt_date': metadata.get('receipt_date'),
+        'line_items': metadata.get('line_items', [])
+    }
+
+def save_duplicate_scan(duplicate, file_name, image_bytes, sha256, user_id, receipt_db):
+    """Record a re-upload as a slim receipt pointing at the original and return the original's result"""
+    result = duplicate['result']
+    print(f"Duplicate upload for user {user_id}, reusing receipt {duplicate['receipt_id']}")
+    scan_metadata = {
+        'file_name': file_name,
+        'file_size': len(image_bytes),
+        'processing_time': datetime.now().isoformat(),
+        'detected_company': result['is_popular_company'],
+        'ticker': result['ticker'],
+        'logo': result['logo'],
+        'image_sha256': sha256
+    }
+    receipt_id = receipt_db.save_receipt_scan(
+        user_id=user_id,
+        company_name=result['company_name'],
+        total_amount=result['total_amount'],
+        confidence=result['confidence'],
+        extracted_text=result['extracted_text'],
+        scan_metadata=scan_metadata,
+        duplicate_of=duplicate['receipt_id']
+    )
+
+    response_data = dict(result, duplicate_of=duplicate['receipt_id'])
+    response_data.pop('receipt_id', None)
+    if receipt_id:
+        response_data['receipt_id'] = receipt_id
+    return response_data
+
+# Uploads without a user_id all share this id, so they are never deduplicated against each other
+ANONYMOUS_USER_ID = 'anonymous_user'
+
+def scan_receipt_image(image_bytes, file_name, user_id, receipt_db, use_cache=True, preprocess_profile=None):
+    """Run the full scan on an uploaded image and save it; returns the API response payload"""
+    # Fail before any work on a bad profile name
+    profile_name, _ = resolve_stages(preprocess_profile)
+    
+    image = decode_receipt_image(image_bytes)
+    
+    # Re-uploads of the same photo skip preprocessing and OCR entirely
+    sha256 = image_sha256(image_bytes)
+    if use_cache and user_id and user_id != ANONYMOUS_USER_ID:
+        def load_exact():
+            receipt = receipt_db.find_scan_by_image_hash(user_id, sha256)
+            if receipt is None:
+                return None
+            return {'receipt_id': str(receipt['_id']), 'result': stored_scan_result(receipt)}
+
+        duplicate = dedupe_cache.lookup(user_id, sha256, load_exact=load_exact)
+        if duplicate is not None:
+            return save_duplicate_scan(duplicate, file_name, image_bytes, sha256, user_id, receipt_db)
+    
+    print(f"Processing receipt for user: {user_id}")
+    
+    # Only the receipt's text lines go through preprocessing and OCR when they can be found
+    gray = to_grayscale(image)
+    del image
+    regions = detect_text_regions(gray) if RECEIPT_REGIONS else None
+    ocr_result, preprocess_timings = ocr_regions(regions, preprocess_profile) if regions else (None, {})
+    if not region_text_trusted(ocr_result):
+        # Enhanced preprocessing of the whole frame
+        processed_image, frame_timings = preprocess(gray, preprocess_profile)
+        add_timings(preprocess_timings, frame_timings)
+        
+        # Extract text (parallel passes, stops early once total and company are found)
+        frame_result = ocr_engine.extract(processed_image, accept=receipt_text_accepted)
+        # A partial region read is kept only if it beats the full frame
+        if ocr_result is None or (frame_result is not None and ocr_rank(frame_result) >= ocr_rank(ocr_result)):
+            ocr_result = frame_result
+            regions = None
+    extracted_text = ocr_result['text'] if ocr_result else ""
+    
+    print("=== EXTRACTED TEXT ===")
+    print(extracted_text)
+    print("=== END TEXT ===")
+    
+    if not extracted_text or len(extracted_text.strip()) < 10:
+        raise ReceiptScanError('Could not extract readable text. Please try a clearer image.', extracted_text)
+    
+    # One parse for company candidates, total, tax, date and line items
+    parsed = parse_receipt(extracted_text)
+    
+    # Detect popular company first
+    popular_company = detect_popular_company(extracted_text)
+    
+    if popular_company:
+        company_name = popular_company['name']
+        ticker = popular_company['ticker']
+        logo = popular_company['logo']
+        confidence_boost = 30  # Boost confidence for known companies
+        print(f"Detected popular company: {company_name} ({ticker})")
+    else:
+        company_name = find_company_name(extracted_text, parsed)
+        ticker = None
+        logo = '🏪'
+        confidence_boost = 0
+    
+    total_amount = parsed['total_amount']
+    
+    # Calculate confidence with boost for popular companies
+    confidence_score = 100 + confidence_boost
+    
+    if company_name == "Unknown Store":
+        confidence_score -= 40
+    if total_amount == 0.0:
+        confidence_score -= 50
+    if len(extracted_text.strip()) < 100:
+        confidence_score -= 20
+        
+    # Cap confidence at 100
+    confidence_score = min(confidence_score, 100)
+        
+    if confidence_score >= 80:
+        confidence = "high"
+    elif confidence_score >= 50:
+        confidence = "medium"
+    else:
+        confidence = "low"
+    
+    print(f"Results: Company='{company_name}', Amount=${total_amount}, Confidence={confidence}, Ticker={ticker}")
+    
+    # Save to database
+    scan_metadata = {
+        'file_name': file_name,
+        'file_size': len(image_bytes),
+        'processing_time': datetime.now().isoformat(),
+        'detected_company': popular_company is not None,
+        'ticker': ticker,
+        'logo': logo,
+        'ocr_pass': f"oem{ocr_result['oem']}/psm{ocr_result['psm']}",
+        'ocr_confidence': round(ocr_result['confidence'], 1),
+        'ocr_passes_run': ocr_result['passes_run'],
+        'ocr_regions': {
+            'lines': regions['lines'],
+            'receipt_found': regions['receipt_found'],
+            'skew': regions['skew'],
+            'pixel_ratio': round(regions['pixels_out'] / regions['pixels_in'], 3)
+        } if regions else None,
+        'preprocess': {
+            'profile': profile_name,
+            'timings_ms': {name: round(seconds * 1000, 1) for name, seconds in preprocess_timings.items()}
+        },
+        'tax': parsed['tax'],
+        'subtotal': parsed['subtotal'],
+        'receipt_date': parsed['date'],
+        'line_items': parsed['line_items'],
+        'image_sha256': sha256
+    }
+    
+    receipt_id = receipt_db.save_receipt_scan(
+        user_id=user_id,
+        company_name=company_name,
+        total_amount=total_amount,
+        confidence=confidence,
+        extracted_text=extracted_text,
+        scan_metadata=scan_metadata
+    )
+    
+    response_data = {
+        'success': True,
+        'company_name': company_name,
+        'total_amount': total_amount,
+        'confidence': confidence,
+        'extracted_text': extracted_text,
+        'ticker': ticker,
+        'logo': logo,
+        'is_popular_company': popular_company is not None,
+        'tax': parsed['tax'],
+        'receipt_date': parsed['date'],
+        'line_items': parsed['line_items']
+    }
+    
+    if receipt_id:
+        response_data['receipt_id'] = receipt_id
+    
+    # Only receipts that were saved and can be looked up again are worth caching
+    if use_cache and user_id and user_id != ANONYMOUS_USER_ID and receipt_id:
+        dedupe_cache.remember(user_id, sha256, receipt_id, response_data)
+    return response_data
@@ -0,0 +1,67 @@
+"""OCR text of saved receipts, kept zlib-compressed outside scanned_receipts so listings never read it"""
+import zlib
+from bson import Binary
+
+RECEIPT_TEXTS_COLLECTION = 'receipt_texts'
+
+# OCR output is repetitive plain text; level 6 gets most of the gain for little CPU
+COMPRESSION_LEVEL = 6
+
+
+def compress_text(text):
+    return Binary(zlib.compress((text or '').encode('utf-8'), COMPRESSION_LEVEL))
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def text_document(receipt_id, user_id, text):
+    """receipt_texts document for a receipt (same _id as the receipt)"""
+    return {
+        '_id': receipt_id,
+        'user_id': user_id,
+        'text': compress_text(text),
+        'size': len(text or '')
+    }
+
+
+class ReceiptTextStore:
+    """One compressed-text document per receipt, keyed by the receipt's _id"""
+
+    def __init__(self, receipt_db):
+        self.receipt_db = receipt_db
+
+    @property
+    def collection(self):
+        return self.receipt_db.db[RECEIPT_TEXTS_COLLECTION]
+
+    def save(self, receipt_id, user_id, text):
+        self.collection.replace_one({'_id': receipt_id}, text_document(receipt_id, user_id, text), upsert=True)
+
+    def save_many(self, documents):
+        """Insert text documents built with text_document()"""
+        if documents:
+            self.collection.insert_many(documents, ordered=False)
+
+    def load(self, receipt_id):
+        """A receipt's OCR text, or None if it has none stored"""
+        document = self.collection.find_one({'_id': receipt_id}, {'text': 1})
+        return decompress_text(document['text']) if document else None
+
+    def load_many(self, receipt_ids):
+        """{receipt_id: OCR text} for those of the given receipts that have text stored"""
+        cursor = self.collection.find({'_id': {'$in': list(receipt_ids)}}, {'text': 1})
+        return {document['_id']: decompress_text(document['text']) for document in cursor}
+
+    def move(self, old_receipt_id, new_receipt_id):
+        """Re-key a receipt's text to another receipt (a duplicate taking over from a deleted original)"""
+        document = self.collection.find_one({'_id': old_receipt_id})
+        if document is None:
+            return
+        document['_id'] = new_receipt_id
+        self.collection.replace_one({'_id': new_receipt_id}, document, upsert=True)
+        self.collection.delete_one({'_id': old_receipt_id})
+
+    def delete(self, receipt_ids):
+        self.collection.delete_many({'_id': {'$in': list(receipt_ids)}})
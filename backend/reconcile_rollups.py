@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Verify or repair the per-user spending rollups against the raw scanned_receipts aggregation
+Usage:
+    python reconcile_rollups.py --verify            # report drift for every user
+    python reconcile_rollups.py                     # rebuild every drifted rollup
+    python reconcile_rollups.py --user <user_id>    # limit to one user
+"""
+import argparse
+import sys
+from database import ReceiptDatabase
+from spending_rollups import ROLLUPS_COLLECTION
+
+def reconcile_rollups(user_ids, verify_only=False):
+    """Rebuild (or just verify) spending rollups for the given users; returns the number of drifted fields"""
+    db = ReceiptDatabase()
+
+    if not db.is_connected:
+        print("❌ Database not connected!")
+        return -1
+
+    if not user_ids:
+        user_ids = db.db[ROLLUPS_COLLECTION].distinct('_id')
+
+    total_drift = 0
+    for user_id in user_ids:
+        drift = db.rollups.verify(user_id)
+        total_drift += len(drift)
+        for item in drift:
+            print(f"⚠️  Drift {item['user_id']} {item['field']}: stored={item['stored']} expected={item['expected']}")
+
+        if not verify_only and drift:
+            db.rollups.rebuild(user_id)
+            print(f"✅ Rebuilt spending rollup for {user_id}")
+
+    action = "Verified" if verify_only else "Checked and repaired"
+    print(f"{action} {len(user_ids)} users, {total_drift} drifted fields")
+    return total_drift
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verify', action='store_true', help='only report drift, do not rewrite rollups')
+    parser.add_argument('--user', action='append', default=[], help='user_id to process (repeatable)')
+    args = parser.parse_args()
+
+    drift = reconcile_rollups(args.user, verify_only=args.verify)
+    # Non-zero exit when verification finds drift so it can gate deploys/cron alerts
+    sys.exit(1 if drift < 0 or (drift and args.verify) else 0)
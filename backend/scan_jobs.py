@@ -0,0 +1,427 @@
+"""Asynchronous receipt-scan jobs: uploads are queued and OCR'd by a pool of worker threads"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from bson import Binary
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# 'mongo' survives restarts and is shared by every gunicorn worker, 'memory' is per process
+SCAN_QUEUE_BACKEND = os.getenv('SCAN_QUEUE_BACKEND', 'mongo').lower()
+SCAN_JOB_WORKERS = int(os.getenv('SCAN_JOB_WORKERS', 2))
+SCAN_QUEUE_MAX_DEPTH = int(os.getenv('SCAN_QUEUE_MAX_DEPTH', 100))
+SCAN_JOBS_PER_USER = int(os.getenv('SCAN_JOBS_PER_USER', 3))
+
+# A running job renews its lease every third of this; one not renewed for this many seconds is
+# assumed orphaned (worker died) and requeued
+SCAN_JOB_TIMEOUT = int(os.getenv('SCAN_JOB_TIMEOUT', 300))
+SCAN_JOB_MAX_ATTEMPTS = 3
+
+# Finished jobs are kept this long for polling, then expire
+SCAN_JOB_RETENTION = int(os.getenv('SCAN_JOB_RETENTION', 24 * 3600))
+
+SCAN_JOBS_COLLECTION = 'scan_jobs'
+# One document for the whole queue and one per user, each listing its active job ids; a job is
+# admitted by a single conditional $push, so concurrent submits cannot overshoot either limit
+SCAN_JOB_SLOTS_COLLECTION = 'scan_job_slots'
+QUEUE_SLOT = 'queue'
+POLL_INTERVAL = 1.0
+
+QUEUED = 'queued'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATUSES = [QUEUED, PROCESSING]
+
+
+class QueueFullError(Exception):
+    """A job was refused for backpressure; retry_after is a hint in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def public_job(job):
+    """Job fields returned to clients (never the image)"""
+    if job is None:
+        return None
+    fields = ('status', 'user_id', 'file_name', 'attempts', 'result', 'error',
+              'created_at', 'started_at', 'finished_at')
+    data = {'job_id': str(job['_id'])}
+    for field in fields:
+        value = job.get(field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        if value is not None:
+            data[field] = value
+    return data
+
+
+class MongoJobStore:
+    """Jobs in the scan_jobs collection, claimed atomically so each runs on exactly one worker"""
+
+    def __init__(self, receipt_db):
+        self.receipt_db = receipt_db
+        self._indexes_created = False
+
+    @property
+    def collection(self):
+        collection = self.receipt_db.db[SCAN_JOBS_COLLECTION]
+        if not self._indexes_created:
+            collection.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+            collection.create_index([('user_id', ASCENDING), ('status', ASCENDING)])
+            collection.create_index('expires_at', expireAfterSeconds=0)
+            self._indexes_created = True
+        return collection
+
+    @property
+    def slots(self):
+        return self.receipt_db.db[SCAN_JOB_SLOTS_COLLECTION]
+
+    def _reserve(self, slot_id, limit, job_id):
+        """Add job_id to a slot unless it already holds limit jobs; False when full"""
+        if limit <= 0:
+            return False
+        try:
+            self.slots.update_one(
+                {'_id': slot_id, f'jobs.{limit - 1}': {'$exists': False}},
+                {'$push': {'jobs': {'job_id': job_id, 'at': _now()}}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The slot exists but is full, so the upsert tried to create a second one
+            return False
+
+    def _release(self, slot_ids, job_ids):
+        self.slots.update_many({'_id': {'$in': slot_ids}}, {'$pull': {'jobs': {'job_id': {'$in': job_ids}}}})
+        self.slots.delete_many({'_id': {'$in': slot_ids}, 'jobs': {'$size': 0}})
+
+    def admit(self, job, max_depth, per_user_limit):
+        """Insert job if the queue and its user have room; returns None, or 'queue'/'user' when full"""
+        user_slot = f"user:{job['user_id']}"
+        if not self._reserve(QUEUE_SLOT, max_depth, job['_id']):
+            return 'queue'
+        if not self._reserve(user_slot, per_user_limit, job['_id']):
+            self._release([QUEUE_SLOT], [job['_id']])
+            return 'user'
+        try:
+            self.collection.insert_one(dict(job, image=Binary(job['image'])))
+        except Exception:
+            self._release([QUEUE_SLOT, user_slot], [job['_id']])
+            raise
+        return None
+
+    def _release_job(self, job):
+        self._release([QUEUE_SLOT, f"user:{job['user_id']}"], [job['_id']])
+
+    def release_orphaned_slots(self, cutoff):
+        """Free slots held by jobs that are no longer active (a worker died between reserving and releasing)"""
+        for slot in self.slots.find({'jobs.at': {'$lt': cutoff}}):
+            # Stored datetimes come back naive (UTC)
+            old_ids = [entry['job_id'] for entry in slot['jobs'] if entry['at'].replace(tzinfo=timezone.utc) < cutoff]
+            active = {job['_id'] for job in self.collection.find(
+                {'_id': {'$in': old_ids}, 'status': {'$in': ACTIVE_STATUSES}}, {'_id': 1})}
+            gone = [job_id for job_id in old_ids if job_id not in active]
+            if gone:
+                self._release([slot['_id']], gone)
+
+    def count_active(self, user_id=None):
+        query = {'status': {'$in': ACTIVE_STATUSES}}
+        if user_id is not None:
+            query['user_id'] = user_id
+        return self.collection.count_documents(query)
+
+    def claim(self, worker_id):
+        """Oldest queued job, atomically marked processing under a new lease; None when the queue is empty"""
+        job = self.collection.find_one_and_update(
+            {'status': QUEUED},
+            {
+                '$set': {'status': PROCESSING, 'started_at': _now(), 'heartbeat_at': _now(), 'worker': worker_id,
+                         'lease': uuid.uuid4().hex},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            job['image'] = bytes(job['image'])
+        return job
+
+    def renew(self, job):
+        """Extend a running job's lease; False once it was requeued and may run elsewhere"""
+        result = self.collection.update_one({'_id': job['_id'], 'lease': job.get('lease')},
+                                            {'$set': {'heartbeat_at': _now()}})
+        return result.matched_count > 0
+
+    def finish(self, job, status, fields):
+        """Record the outcome if job still holds its lease; False if it was requeued meanwhile"""
+        # The image is only needed while the job can still run
+        result = self.collection.update_one(
+            {'_id': job['_id'], 'lease': job.get('lease'), 'status': {'$in': ACTIVE_STATUSES}},
+            {
+                '$set': dict(fields, status=status, finished_at=_now(),
+                             expires_at=_now() + timedelta(seconds=SCAN_JOB_RETENTION)),
+                '$unset': {'image': ''}
+            }
+        )
+        if not result.modified_count:
+            return False
+        self._release_job(job)
+        return True
+
+    def get(self, job_id):
+        return self.collection.find_one({'_id': job_id}, {'image': 0})
+
+    def requeue_stale(self, cutoff):
+        """Put jobs orphaned by a dead worker back on the queue, failing those out of attempts"""
+        stale = {'status': PROCESSING, '$or': [
+            {'heartbeat_at': {'$lt': cutoff}},
+            {'heartbeat_at': {'$exists': False}, 'started_at': {'$lt': cutoff}}
+        ]}
+        for job in self.collection.find(dict(stale, attempts={'$gte': SCAN_JOB_MAX_ATTEMPTS}),
+                                        {'user_id': 1, 'lease': 1}):
+            self.finish(job, FAILED, {'error': 'Scan did not finish, please try again'})
+        result = self.collection.update_many(stale, {'$set': {'status': QUEUED}, '$unset': {'worker': '', 'lease': ''}})
+        self.release_orphaned_slots(cutoff)
+        return result.modified_count
+
+
+class MemoryJobStore:
+    """In-process job table, used when Mongo is not available (jobs are lost on restart)"""
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = _now()
+        for job_id in [k for k, job in self._jobs.items() if job.get('expires_at') and job['expires_at'] <= now]:
+            del self._jobs[job_id]
+
+    def admit(self, job, max_depth, per_user_limit):
+        """Insert job if the queue and its user have room; returns None, or 'queue'/'user' when full"""
+        with self._lock:
+            self._expire()
+            active = [other for other in self._jobs.values() if other['status'] in ACTIVE_STATUSES]
+            if len(active) >= max_depth:
+                return 'queue'
+            if sum(1 for other in active if other['user_id'] == job['user_id']) >= per_user_limit:
+                return 'user'
+            self._jobs[job['_id']] = dict(job)
+            return None
+
+    def count_active(self, user_id=None):
+        with self._lock:
+            return sum(1 for job in self._jobs.values()
+                       if job['status'] in ACTIVE_STATUSES and (user_id is None or job['user_id'] == user_id))
+
+    def claim(self, worker_id):
+        with self._lock:
+            for job in self._jobs.values():
+                if job['status'] == QUEUED:
+                    job.update(status=PROCESSING, started_at=_now(), worker=worker_id, lease=uuid.uuid4().hex,
+                               attempts=job.get('attempts', 0) + 1)
+                    return dict(job)
+            return None
+
+    def renew(self, job):
+        with self._lock:
+            stored = self._jobs.get(job['_id'])
+            return stored is not None and stored.get('lease') == job.get('lease')
+
+    def finish(self, job, status, fields):
+        with self._lock:
+            stored = self._jobs.get(job['_id'])
+            if stored is None or stored.get('lease') != job.get('lease') or stored['status'] not in ACTIVE_STATUSES:
+                return False
+            stored.update(fields, status=status, finished_at=_now(),
+                          expires_at=_now() + timedelta(seconds=SCAN_JOB_RETENTION))
+            stored.pop('image', None)
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return {k: v for k, v in job.items() if k != 'image'} if job else None
+
+    def requeue_stale(self, cutoff):
+        # Workers live in this process, so nothing can be orphaned
+        return 0
+
+
+class ScanJobQueue:
+    """Bounded queue of scan jobs with per-user limits, processed by handler(job) on worker threads"""
+
+    def __init__(self, receipt_db, handler, workers=SCAN_JOB_WORKERS, max_depth=SCAN_QUEUE_MAX_DEPTH,
+                 per_user_limit=SCAN_JOBS_PER_USER, backend=SCAN_QUEUE_BACKEND):
+        self.receipt_db = receipt_db
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.per_user_limit = per_user_limit
+        self.backend = backend
+        self._mongo_store = None
+        # Used when configured, and for 'mongo' only while the database is unreachable
+        self._memory_store = MemoryJobStore()
+        self._warned_fallback = False
+        self._threads = []
+        self._threads_pid = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def store(self):
+        """The Mongo store whenever the database is connected, so every gunicorn worker sees every job"""
+        if self.backend == 'mongo':
+            if self._mongo_store is None and self.receipt_db.is_connected:
+                self._mongo_store = MongoJobStore(self.receipt_db)
+            if self._mongo_store is not None:
+                return self._mongo_store
+            if not self._warned_fallback:
+                self._warned_fallback = True
+                print("⚠️ Scan queue: database not connected, using in-memory queue until it is")
+        return self._memory_store
+
+    def _stores(self):
+        # Jobs queued in memory while the database was down still have to run and be pollable
+        store = self.store
+        return [store] if store is self._memory_store else [store, self._memory_store]
+
+    def _ensure_workers(self):
+        # Threads do not survive fork (gunicorn --preload), so start them in the serving process
+        with self._lock:
+            if self._threads_pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._threads = [
+                threading.Thread(target=self._work, args=(f'{os.getpid()}-{i}',), daemon=True,
+                                 name=f'scan-worker-{i}')
+                for i in range(self.workers)
+            ]
+            self._threads_pid = os.getpid()
+            for thread in self._threads:
+                thread.start()
+
+    def submit(self, user_id, file_name, image_bytes, options=None):
+        """Queue a scan and return its job id; raises QueueFullError when over capacity"""
+        self._ensure_workers()
+        job_id = uuid.uuid4().hex
+        full = self.store.admit({
+            '_id': job_id,
+            'user_id': user_id,
+            'file_name': file_name,
+            'image': image_bytes,
+            'options': options or {},
+            'status': QUEUED,
+            'attempts': 0,
+            'created_at': _now()
+        }, self.max_depth, self.per_user_limit)
+        if full:
+            with self._lock:
+                self.rejected += 1
+            if full == 'queue':
+                raise QueueFullError('Scan queue is full, please try again shortly', retry_after=10)
+            raise QueueFullError(
+                f'Too many scans in progress (limit {self.per_user_limit}), wait for one to finish',
+                retry_after=5
+            )
+        with self._lock:
+            self.submitted += 1
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Current state of a job for polling, or None if unknown/expired"""
+        self._ensure_workers()
+        for store in self._stores():
+            job = store.get(job_id)
+            if job is not None:
+                return public_job(job)
+        return None
+
+    def _work(self, worker_id):
+        last_recovery = 0
+        while True:
+            try:
+                stores = self._stores()
+                if time.time() - last_recovery > SCAN_JOB_TIMEOUT / 2:
+                    last_recovery = time.time()
+                    for store in stores:
+                        requeued = store.requeue_stale(_now() - timedelta(seconds=SCAN_JOB_TIMEOUT))
+                        if requeued:
+                            print(f"Scan queue: requeued {requeued} orphaned job(s)")
+
+                for store in stores:
+                    job = store.claim(worker_id)
+                    if job is not None:
+                        self._run(job, store)
+                        break
+                else:
+                    self._wakeup.wait(POLL_INTERVAL)
+                    self._wakeup.clear()
+            except Exception as e:
+                print(f"❌ Scan worker {worker_id} error: {e}")
+                time.sleep(POLL_INTERVAL)
+
+    def _run(self, job, store):
+        # Renew the lease while the handler runs, so a slow scan is not requeued and run twice
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(SCAN_JOB_TIMEOUT / 3):
+                if not store.renew(job):
+                    return
+
+        threading.Thread(target=heartbeat, daemon=True, name=f"scan-lease-{job['_id'][:8]}").start()
+        try:
+            result = self.handler(job)
+            status, fields = DONE, {'result': result}
+        except Exception as e:
+            print(f"Scan job {job['_id']} failed: {e}")
+            status, fields = FAILED, {'error': str(e)}
+            extracted_text = getattr(e, 'extracted_text', None)
+            if extracted_text is not None:
+                fields['result'] = {'extracted_text': extracted_text}
+        finally:
+            done.set()
+
+        if not store.finish(job, status, fields):
+            print(f"⚠️ Scan job {job['_id']} lost its lease (requeued after {SCAN_JOB_TIMEOUT}s), result discarded")
+            return
+        with self._lock:
+            if status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def stats(self):
+        try:
+            store = self.store
+            active = store.count_active()
+        except Exception:
+            store, active = None, None
+        with self._lock:
+            return {
+                'backend': type(store).__name__ if store else None,
+                'workers': self.workers,
+                'alive_workers': sum(1 for t in self._threads if t.is_alive()),
+                'active_jobs': active,
+                'max_depth': self.max_depth,
+                'per_user_limit': self.per_user_limit,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed
+            }
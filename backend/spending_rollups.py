@@ -0,0 +1,274 @@
+"""Materialized per-user spending rollups, maintained alongside scanned_receipts"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+ROLLUPS_COLLECTION = 'spending_rollups'
+RECEIPTS_COLLECTION = 'scanned_receipts'
+
+CONFIDENCE_LEVELS = ('high', 'medium', 'low')
+
+# Rollup totals are kept with $inc, so compare money to the cent in verify()
+_MONEY_TOLERANCE = 0.01
+
+# A rebuild re-aggregates when receipts change underneath it; this bounds the retries
+REBUILD_ATTEMPTS = 5
+
+
+def company_key(company_name):
+    """Field-safe key for a company bucket (names can contain '.' and '$', or be missing)"""
+    return hashlib.sha1(json.dumps(company_name).encode('utf-8')).hexdigest()[:16]
+
+
+def month_key(scan_date):
+    return f"{scan_date.year:04d}-{scan_date.month:02d}"
+
+
+def version_tag(rollup):
+    """Opaque token that changes whenever the rollup does (the version alone restarts after a rebuild)"""
+    updated_at = rollup.get('updated_at')
+    return f"{rollup.get('version', 0)}-{updated_at.timestamp() if updated_at else 0}"
+
+
+def _amount(receipt):
+    return float(receipt.get('total_amount') or 0.0)
+
+
+def _add(target, key, value):
+    target[key] = target.get(key, 0) + value
+
+
+class SpendingRollups:
+    """One document per user with totals, confidence counts and per-company / per-month buckets"""
+
+    def __init__(self, receipt_db):
+        self.receipt_db = receipt_db
+
+    @property
+    def collection(self):
+        return self.receipt_db.db[ROLLUPS_COLLECTION]
+
+    @property
+    def receipts(self):
+        return self.receipt_db.db[RECEIPTS_COLLECTION]
+
+    def get(self, user_id):
+        """A user's rollup, built from their receipts on first use (point lookup afterwards)"""
+        rollup = self.collection.find_one({'_id': user_id})
+        if rollup is None or rollup.get('rebuild_needed'):
+            rollup = self.rebuild(user_id)
+        return rollup
+
+    def get_version(self, user_id):
+        """version_tag() of a user's rollup without reading its buckets"""
+        rollup = self.collection.find_one({'_id': user_id}, {'version': 1, 'updated_at': 1, 'rebuild_needed': 1})
+        if rollup is None or rollup.get('rebuild_needed'):
+            rollup = self.rebuild(user_id)
+        return version_tag(rollup)
+
+    def _delta(self, added, removed):
+        """$inc/$set/$max/$min update for receipts entering and leaving a rollup"""
+        inc, set_fields, max_fields, min_fields = {'version': 1}, {}, {}, {}
+        for receipt, sign in [(r, 1) for r in added] + [(r, -1) for r in removed]:
+            amount = _amount(receipt)
+            _add(inc, 'total_receipts', sign)
+            _add(inc, 'total_spent', sign * amount)
+            if receipt.get('confidence') in CONFIDENCE_LEVELS:
+                _add(inc, f"{receipt['confidence']}_confidence_count", sign)
+
+            company = f"companies.{company_key(receipt.get('company_name'))}"
+            _add(inc, f'{company}.receipt_count', sign)
+            _add(inc, f'{company}.total_spent', sign * amount)
+
+            scan_date = receipt['scan_date']
+            month = f"months.{month_key(scan_date)}"
+            _add(inc, f'{month}.receipt_count', sign)
+            _add(inc, f'{month}.total_spent', sign * amount)
+
+            if sign > 0:
+                set_fields[f'{company}.company_name'] = receipt.get('company_name')
+                set_fields[f'{month}.year'] = scan_date.year
+                set_fields[f'{month}.month'] = scan_date.month
+                max_fields[f'{company}.last_visit'] = max(scan_date, max_fields.get(f'{company}.last_visit', scan_date))
+                max_fields['max_amount'] = max(amount, max_fields.get('max_amount', amount))
+                min_fields['min_amount'] = min(amount, min_fields.get('min_amount', amount))
+
+        set_fields['updated_at'] = datetime.now(timezone.utc)
+        update = {'$inc': inc, '$set': set_fields}
+        if max_fields:
+            update['$max'] = max_fields
+        if min_fields:
+            update['$min'] = min_fields
+        return update
+
+    def _extremes_stale(self, rollup, added, removed):
+        """True if a removed receipt may have been the only one holding max/min amount or a last_visit"""
+        if rollup.get('total_receipts', 0) <= 0:
+            return bool(removed)
+        for receipt in removed:
+            amount = _amount(receipt)
+            if amount >= rollup.get('max_amount', amount) and not any(
+                    _amount(r) >= rollup['max_amount'] for r in added):
+                return True
+            if amount <= rollup.get('min_amount', amount) and not any(
+                    _amount(r) <= rollup['min_amount'] for r in added):
+                return True
+            key = company_key(receipt.get('company_name'))
+            bucket = rollup.get('companies', {}).get(key)
+            if bucket and bucket.get('receipt_count', 0) > 0 and receipt['scan_date'] >= bucket['last_visit'] and not any(
+                    company_key(r.get('company_name')) == key and r['scan_date'] >= bucket['last_visit'] for r in added):
+                return True
+        return False
+
+    def apply(self, user_id, added=(), removed=()):
+        """Fold receipts saved (added), deleted (removed) or edited (both) into the user's rollup"""
+        added, removed = list(added), list(removed)
+        if not added and not removed:
+            return
+        try:
+            rollup = self.collection.find_one_and_update(
+                {'_id': user_id, 'rebuild_needed': {'$exists': False}}, self._delta(added, removed),
+                return_document=ReturnDocument.AFTER
+            )
+            if rollup is None:
+                # No complete rollup to fold into. Leave a marker (or bump the version of one being built)
+                # so a rebuild that aggregated before this receipt cannot be stored as current
+                self.collection.update_one({'_id': user_id}, {'$set': {'rebuild_needed': True}, '$inc': {'version': 1}},
+                                           upsert=True)
+                return
+            if self._extremes_stale(rollup, added, removed):
+                self.rebuild(user_id)
+                return
+            empty = {f'{kind}.{key}': '' for kind in ('companies', 'months')
+                     for key, bucket in rollup.get(kind, {}).items() if bucket.get('receipt_count', 0) <= 0}
+            if empty:
+                self.collection.update_one({'_id': user_id, 'version': rollup['version']}, {'$unset': empty})
+        except Exception as e:
+            print(f" Failed to update spending rollup for {user_id}: {e}")
+            self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        """Drop a rollup that may have missed an update; the next read rebuilds it"""
+        try:
+            self.collection.delete_one({'_id': user_id})
+        except Exception as e:
+            print(f" Failed to invalidate spending rollup for {user_id}: {e}")
+
+    def aggregate(self, user_id):
+        """The rollup computed straight from the user's receipts (one pass over them)"""
+        pipeline = [
+            {'$match': {'user_id': user_id}},
+            {'$facet': {
+                'totals': [{'$group': {
+                    '_id': None,
+                    'total_receipts': {'$sum': 1},
+                    'total_spent': {'$sum': '$total_amount'},
+                    'max_amount': {'$max': '$total_amount'},
+                    'min_amount': {'$min': '$total_amount'},
+                    **{f'{level}_confidence_count': {'$sum': {'$cond': [{'$eq': ['$confidence', level]}, 1, 0]}}
+                       for level in CONFIDENCE_LEVELS}
+                }}],
+                'companies': [{'$group': {
+                    '_id': '$company_name',
+                    'total_spent': {'$sum': '$total_amount'},
+                    'receipt_count': {'$sum': 1},
+                    'last_visit': {'$max': '$scan_date'}
+                }}],
+                'months': [{'$group': {
+                    '_id': {'year': {'$year': '$scan_date'}, 'month': {'$month': '$scan_date'}},
+                    'total_spent': {'$sum': '$total_amount'},
+                    'receipt_count': {'$sum': 1}
+                }}]
+            }}
+        ]
+        result = list(self.receipts.aggregate(pipeline))[0]
+
+        rollup = {
+            'total_receipts': 0,
+            'total_spent': 0.0,
+            **{f'{level}_confidence_count': 0 for level in CONFIDENCE_LEVELS},
+            'companies': {},
+            'months': {}
+        }
+        if result['totals']:
+            totals = result['totals'][0]
+            totals.pop('_id')
+            rollup.update(totals)
+        for item in result['companies']:
+            rollup['companies'][company_key(item['_id'])] = {
+                'company_name': item['_id'],
+                'total_spent': item['total_spent'],
+                'receipt_count': item['receipt_count'],
+                'last_visit': item['last_visit']
+            }
+        for item in result['months']:
+            year, month = item['_id']['year'], item['_id']['month']
+            rollup['months'][f"{year:04d}-{month:02d}"] = {
+                'year': year,
+                'month': month,
+                'total_spent': item['total_spent'],
+                'receipt_count': item['receipt_count']
+            }
+        return rollup
+
+    def rebuild(self, user_id):
+        """Recompute a user's rollup from their receipts, replacing whatever is stored"""
+        for _ in range(REBUILD_ATTEMPTS):
+            # Stored only if no apply() changed the version while aggregating, else aggregated again
+            current = self.collection.find_one({'_id': user_id}, {'version': 1})
+            rollup = dict(self.aggregate(user_id), updated_at=datetime.now(timezone.utc))
+            if current is None:
+                try:
+                    rollup.update(_id=user_id, version=1)
+                    if not rollup['total_receipts']:
+                        rollup.pop('max_amount', None)
+                        rollup.pop('min_amount', None)
+                    self.collection.insert_one(rollup)
+                    return rollup
+                except DuplicateKeyError:
+                    continue
+
+            update = {'$set': rollup, '$inc': {'version': 1}, '$unset': {'rebuild_needed': ''}}
+            if not rollup['total_receipts']:
+                # Left unset so the first $max/$min after this starts from that receipt's amount
+                update['$unset'].update(max_amount='', min_amount='')
+            stored = self.collection.find_one_and_update(
+                {'_id': user_id, 'version': current.get('version')}, update, return_document=ReturnDocument.AFTER
+            )
+            if stored is not None:
+                return stored
+        print(f" Spending rollup for {user_id} kept changing during rebuild; rebuilding on next read")
+        self.collection.update_one({'_id': user_id}, {'$set': {'rebuild_needed': True}, '$inc': {'version': 1}},
+                                   upsert=True)
+        return dict(rollup, _id=user_id, version=0)
+
+    def verify(self, user_id):
+        """Compare a stored rollup with the raw aggregation; returns a list of drifted fields"""
+        stored = self.collection.find_one({'_id': user_id})
+        if stored is None:
+            # Nothing to drift from; it is built from the receipts on first read
+            return []
+        expected = self.aggregate(user_id)
+
+        fields = [('total_receipts',), ('total_spent',), ('max_amount',), ('min_amount',)]
+        fields += [(f'{level}_confidence_count',) for level in CONFIDENCE_LEVELS]
+        for kind, bucket_fields in (('companies', ('company_name', 'receipt_count', 'total_spent', 'last_visit')),
+                                    ('months', ('year', 'month', 'receipt_count', 'total_spent'))):
+            for key in sorted(set(expected[kind]) | set(stored.get(kind, {}))):
+                fields += [(kind, key, field) for field in bucket_fields]
+
+        drift = []
+        for path in fields:
+            have, want = stored, expected
+            for part in path:
+                have = have.get(part) if isinstance(have, dict) else None
+                want = want.get(part) if isinstance(want, dict) else None
+            if isinstance(have, (int, float)) and isinstance(want, (int, float)):
+                matches = abs(have - want) <= _MONEY_TOLERANCE
+            else:
+                matches = have == want
+            if not matches:
+                drift.append({'user_id': user_id, 'field': '.'.join(path), 'stored': have, 'expected': want})
+        return drift
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for order execution against a local mongod
+Fires many simultaneous buys and sells at one user and checks that cash never
+goes negative, shares are never oversold and holdings match the ledger. Also fails
+a sale's cash credit on purpose and checks the sale is undone.
+
+Usage: python test_order_concurrency.py   (needs mongod on MONGO_URI, default localhost)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Use a throwaway database so the stress run never touches real data
+os.environ['DATABASE_NAME'] = os.getenv('STRESS_DATABASE_NAME', 'receipt_scanner_order_stress')
+
+from database import ReceiptDatabase
+from holdings import HoldingsStore
+from orders import OrderExecutor
+
+STARTING_CASH = 1000.00
+PRICE = 100.00
+THREADS = 32
+ORDERS = 200
+
+class FailingCreditUsers:
+    """users collection whose find_one_and_update fails, as if the connection dropped mid-sell"""
+
+    def __init__(self, users):
+        self._users = users
+
+    def __getattr__(self, name):
+        return getattr(self._users, name)
+
+    def find_one_and_update(self, *args, **kwargs):
+        raise RuntimeError('injected cash credit failure')
+
+class CreditFailingExecutor(OrderExecutor):
+    """Fails the cash credit of every sell, after the shares were removed and the ledger written"""
+
+    @property
+    def users(self):
+        return FailingCreditUsers(super().users)
+
+def print_section(title):
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+def setup():
+    db = ReceiptDatabase()
+    if not db.is_connected:
+        print(" Database not connected, start mongod or set MONGO_URI")
+        return None, None
+
+    db.client.drop_database(db.database_name)
+    store = HoldingsStore(db)
+    executor = OrderExecutor(db, store, STARTING_CASH)
+    user_id = db.db['users'].insert_one({
+        'email': 'stress-test@example.com',
+        'cash_balance': STARTING_CASH,
+        'holdings_materialized': True
+    }).inserted_id
+    return executor, user_id
+
+def test_concurrent_buys(executor, user_id):
+    """Only floor(cash / price) of many simultaneous one-share buys may succeed"""
+    print_section("CONCURRENT BUYS")
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = list(pool.map(lambda _: executor.buy(user_id, 'AAPL', 1, PRICE), range(ORDERS)))
+
+    filled = sum(1 for r in results if r is not None)
+    cash = executor.users.find_one({'_id': user_id})['cash_balance']
+    expected_fills = int(STARTING_CASH // PRICE)
+    print(f"   Filled: {filled}/{ORDERS} (expected {expected_fills})")
+    print(f"   Cash left: ${cash:.2f}")
+
+    ok = filled == expected_fills and cash >= 0 and abs(cash - (STARTING_CASH - filled * PRICE)) < 0.01
+    print(" No overdraft" if ok else " OVERDRAFT OR LOST UPDATE DETECTED")
+    return ok
+
+def test_concurrent_sells(executor, user_id):
+    """Simultaneous sells may not sell more shares than were bought"""
+    print_section("CONCURRENT SELLS")
+    owned = executor.holdings_store.get_positions(str(user_id)).get('AAPL', {}).get('quantity', 0)
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = list(pool.map(lambda _: executor.sell(user_id, 'AAPL', 1, PRICE), range(ORDERS)))
+
+    filled = sum(1 for r in results if r is not None)
+    remaining = executor.holdings_store.get_positions(str(user_id)).get('AAPL', {}).get('quantity', 0)
+    cash = executor.users.find_one({'_id': user_id})['cash_balance']
+    print(f"   Shares owned before: {owned}, sells filled: {filled}, remaining: {remaining}")
+    print(f"   Cash after sells: ${cash:.2f}")
+
+    ok = filled == owned and remaining == 0 and abs(cash - STARTING_CASH) < 0.01
+    print(" No oversell" if ok else " OVERSELL OR LOST UPDATE DETECTED")
+    return ok
+
+def test_sell_credit_failure(executor, user_id):
+    """A sale whose cash credit fails must leave shares, ledger and cash as they were"""
+    print_section("FAILED SALE CREDIT")
+    executor.buy(user_id, 'MSFT', 2, PRICE)
+    def state():
+        return (executor.users.find_one({'_id': user_id})['cash_balance'],
+                executor.holdings_store.get_positions(str(user_id)).get('MSFT', {}).get('quantity', 0),
+                executor.transactions.count_documents({'user_id': str(user_id)}))
+    before = state()
+
+    failing = CreditFailingExecutor(executor.receipt_db, executor.holdings_store, STARTING_CASH)
+    try:
+        failing.sell(user_id, 'MSFT', 1, PRICE)
+        raised = False
+    except RuntimeError:
+        raised = True
+    after = state()
+    print(f"   Before (cash, shares, ledger entries): {before}")
+    print(f"   After failed sale:                     {after}")
+
+    ok = raised and after == before
+    print(" Sale undone" if ok else " SHARES OR LEDGER LOST WITHOUT PROCEEDS")
+    return ok
+
+def test_ledger_consistency(executor, user_id):
+    """Holdings snapshot must match a replay of the ledger"""
+    print_section("LEDGER CONSISTENCY")
+    drift = executor.holdings_store.verify(str(user_id))
+    for item in drift:
+        print(f"   Drift: {item}")
+    print(" Holdings match ledger" if not drift else " Holdings drifted from ledger")
+    return not drift
+
+def main():
+    executor, user_id = setup()
+    if executor is None:
+        return False
+
+    results = {
+        'concurrent_buys': test_concurrent_buys(executor, user_id),
+        'concurrent_sells': test_concurrent_sells(executor, user_id),
+        'sell_credit_failure': test_sell_credit_failure(executor, user_id),
+        'ledger_consistency': test_ledger_consistency(executor, user_id),
+    }
+
+    print_section("TEST SUMMARY")
+    for test_name, result in results.items():
+        status = "✅ PASS" if result else "❌ FAIL"
+        print(f"  {test_name.upper():20} {status}")
+
+    executor.receipt_db.client.drop_database(executor.receipt_db.database_name)
+    return all(results.values())
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if main() else 1)
@@ -1,23 +1,44 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from database import ReceiptDatabase
 from datetime import datetime, timezone
 import yfinance as yf
-from bson import ObjectId
+import numpy as np
 import os
 from db_connection_helper import get_db_error_response, log_db_error
+from quote_cache import quote_cache
+from market_data import get_stock_prices, portfolio_value as value_positions
+from holdings import HoldingsStore
+from orders import OrderExecutor
+from user_resolver import user_resolver
+from holdings import MATERIALIZED_FLAG
+from pagination import InvalidCursorError, keyset_page
+from exports import EXPORT_FORMATS, TRANSACTION_EXPORT_FIELDS, date_range_filter, export_chunks
 
 trading_bp = Blueprint('trading', __name__)
 db = ReceiptDatabase()
+holdings_store = HoldingsStore(db)
 
 STARTING_CASH = 10000.00  # Default starting cash for new users
 
+order_executor = OrderExecutor(db, holdings_store, STARTING_CASH)
+
 def get_user_collection():
     return db.db['users']
 
 def get_transactions_collection():
     return db.db['transactions']
 
+def find_or_create_trader(user_id, projection):
+    """Resolve a trading user, auto-creating email users (for frontend-only auth users)"""
+    # New users have no trades, so their (empty) holdings are already materialized
+    new_user_fields = {'cash_balance': STARTING_CASH, MATERIALIZED_FLAG: True}
+    return user_resolver.find_or_create_user(user_id, new_user_fields, projection)
+
 def get_real_stock_price(ticker):
+    """Get current stock price, served from the shared quote cache when fresh"""
+    return quote_cache.get_or_fetch(f'price:{ticker}', lambda: _fetch_stock_price(ticker))
+
+def _fetch_stock_price(ticker):
     """Fetch current stock price from Yahoo Finance"""
     try:
         stock = yf.Ticker(ticker)
@@ -44,43 +65,10 @@ def get_balance():
         
         users = get_user_collection()
         
-        # Try to find user by ObjectId, email, or google_id
-        user = None
-        try:
-            # Try as ObjectId if it looks like one (24 hex characters)
-            if len(user_id) == 24 and all(c in '0123456789abcdefABCDEF' for c in user_id):
-                try:
-                    user = users.find_one({'_id': ObjectId(user_id)})
-                except:
-                    pass
-        except:
-            pass
-        
-        # If not found, try as email
-        if not user:
-            user = users.find_one({'email': user_id})
-        
-        # If still not found, try as google_id
+        user = find_or_create_trader(user_id, {'cash_balance': 1})
         if not user:
-            user = users.find_one({'google_id': user_id})
-        
-        if not user:
-            # Auto-create user if they don't exist (for frontend-only auth users)
-            print(f"⚠️ User not found for user_id: {user_id}, auto-creating user...")
-            if '@' in user_id:  # If it's an email, create user
-                new_user = {
-                    'email': user_id,
-                    'cash_balance': STARTING_CASH,
-                    'created_at': datetime.now(timezone.utc),
-                    'updated_at': datetime.now(timezone.utc),
-                    'onboarding_completed': False
-                }
-                result = users.insert_one(new_user)
-                user = users.find_one({'_id': result.inserted_id})
-                print(f" Auto-created user: {user_id}")
-            else:
-                print(f" User not found for user_id: {user_id}")
-                return jsonify({'error': 'User not found', 'user_id_received': str(user_id)}), 404
+            print(f" User not found for user_id: {user_id}")
+            return jsonify({'error': 'User not found', 'user_id_received': str(user_id)}), 404
         
         # Initialize cash balance if not exists
         if 'cash_balance' not in user:
@@ -120,54 +108,11 @@ def buy_stock():
             return jsonify({'error': 'Invalid request data'}), 400
         
         users = get_user_collection()
-        transactions = get_transactions_collection()
-        
-        # Find user (try ObjectId, email, or google_id)
-        user = None
-        try:
-            # Try as ObjectId if it looks like one (24 hex characters)
-            if len(user_id) == 24 and all(c in '0123456789abcdefABCDEF' for c in user_id):
-                try:
-                    user = users.find_one({'_id': ObjectId(user_id)})
-                    if user:
-                        print(f" Found user by ObjectId: {user_id}")
-                except:
-                    pass
-        except:
-            pass
-        
-        # If not found, try as email
-        if not user:
-            user = users.find_one({'email': user_id})
-            if user:
-                print(f" Found user by email: {user_id}")
-        
-        # If still not found, try as google_id
-        if not user:
-            user = users.find_one({'google_id': user_id})
-            if user:
-                print(f" Found user by google_id: {user_id}")
         
+        user = find_or_create_trader(user_id, {'cash_balance': 1, MATERIALIZED_FLAG: 1})
         if not user:
-            # Auto-create user if they don't exist (for frontend-only auth users)
-            if '@' in user_id:  # If it's an email, create user
-                print(f" User not found for user_id: {user_id}, auto-creating user...")
-                new_user = {
-                    'email': user_id,
-                    'cash_balance': STARTING_CASH,
-                    'created_at': datetime.now(timezone.utc),
-                    'updated_at': datetime.now(timezone.utc),
-                    'onboarding_completed': False
-                }
-                result = users.insert_one(new_user)
-                user = users.find_one({'_id': result.inserted_id})
-                print(f" Auto-created user: {user_id}")
-            else:
-                print(f" User not found for user_id: {user_id} (type: {type(user_id).__name__})")
-                # Debug: List all users in database
-                all_users = list(users.find({}, {'email': 1, 'google_id': 1, '_id': 1}).limit(5))
-                print(f" Sample users in database: {[{'email': u.get('email'), 'google_id': u.get('google_id'), '_id': str(u.get('_id'))} for u in all_users]}")
-                return jsonify({'error': 'User not found', 'user_id_received': str(user_id)}), 404
+            print(f" User not found for user_id: {user_id} (type: {type(user_id).__name__})")
+            return jsonify({'error': 'User not found', 'user_id_received': str(user_id)}), 404
         
         # Initialize cash balance if needed
         if 'cash_balance' not in user:
@@ -177,6 +122,8 @@ def buy_stock():
             )
             user['cash_balance'] = STARTING_CASH
         
+        holdings_store.ensure_materialized(user)
+        
         # Get real-time stock price
         current_price = get_real_stock_price(ticker)
         if current_price is None:
@@ -193,52 +140,24 @@ def buy_stock():
                 'available': user['cash_balance']
             }), 400
         
-        # Calculate new cash balance
-        new_cash_balance = user['cash_balance'] - total_cost
-        
-        # Update user cash balance (portfolio is calculated from transactions, not stored)
-        users.update_one(
-            {'_id': user['_id']},
-            {'$set': {
-                'cash_balance': new_cash_balance,
-                'updated_at': datetime.now(timezone.utc)
-            }}
-        )
-        
-        # Note: Portfolio is now built from transactions, not stored in user document
-        
-        # Record transaction
-        transaction = {
-            'user_id': str(user['_id']),
-            'type': 'buy',
-            'ticker': ticker,
-            'quantity': quantity,
-            'price': current_price,
-            'total': total_cost,
-            'timestamp': datetime.now(timezone.utc)
-        }
-        transactions.insert_one(transaction)
+        # Debit cash, record the trade and update holdings; the funds check is atomic
+        new_cash_balance = order_executor.buy(user['_id'], ticker, quantity, current_price)
+        if new_cash_balance is None:
+            # Another order spent the cash between the check above and this update
+            latest = users.find_one({'_id': user['_id']}, {'cash_balance': 1}) or {}
+            return jsonify({
+                'error': 'Insufficient funds',
+                'required': total_cost,
+                'available': latest.get('cash_balance', 0)
+            }), 400
         
         # Calculate portfolio value after purchase (for response)
-        user_obj_id = str(user['_id'])
-        all_transactions_after = list(transactions.find({'user_id': user_obj_id}).sort('timestamp', 1))
+        holdings_after = holdings_store.get_positions(str(user['_id']))
         
-        holdings_after = {}
-        for tx in all_transactions_after:
-            ticker_tx = tx['ticker']
-            if ticker_tx not in holdings_after:
-                holdings_after[ticker_tx] = {'quantity': 0}
-            
-            if tx['type'] == 'buy':
-                holdings_after[ticker_tx]['quantity'] += tx['quantity']
-            elif tx['type'] == 'sell':
-                holdings_after[ticker_tx]['quantity'] -= tx['quantity']
-        
-        portfolio_value = sum(
-            h['quantity'] * (get_real_stock_price(t) or 0)
-            for t, h in holdings_after.items() 
-            if h['quantity'] > 0
-        )
+        # Value all open positions with one batch price fetch
+        open_positions = {t: h['quantity'] for t, h in holdings_after.items()}
+        prices = get_stock_prices(list(open_positions))
+        portfolio_value = value_positions(list(open_positions.values()), prices.values)
         
         return jsonify({
             'success': True,
@@ -273,54 +192,16 @@ def sell_stock():
         if not user_id or not ticker or quantity <= 0:
             return jsonify({'error': 'Invalid request data'}), 400
         
-        users = get_user_collection()
-        transactions = get_transactions_collection()
-        
-        # Find user (try ObjectId, email, or google_id)
-        user = None
-        try:
-            # Try as ObjectId if it looks like one (24 hex characters)
-            if len(user_id) == 24 and all(c in '0123456789abcdefABCDEF' for c in user_id):
-                try:
-                    user = users.find_one({'_id': ObjectId(user_id)})
-                except:
-                    pass
-        except:
-            pass
-        
-        # If not found, try as email
-        if not user:
-            user = users.find_one({'email': user_id})
-        
-        # If still not found, try as google_id
-        if not user:
-            user = users.find_one({'google_id': user_id})
         
+        user = user_resolver.find_user(user_id, {'cash_balance': 1, MATERIALIZED_FLAG: 1})
         if not user:
             print(f" User not found for user_id: {user_id} (type: {type(user_id).__name__})")
             return jsonify({'error': 'User not found', 'user_id_received': str(user_id)}), 404
         
-        # Build current portfolio from transactions to check holdings
+        # Current holdings come from the materialized snapshot
         user_obj_id = str(user['_id'])
-        all_transactions = list(transactions.find({'user_id': user_obj_id}).sort('timestamp', 1))
-        
-        # Calculate current holdings from transactions
-        holdings = {}
-        for tx in all_transactions:
-            ticker_tx = tx['ticker']
-            if ticker_tx not in holdings:
-                holdings[ticker_tx] = {'quantity': 0, 'total_cost': 0}
-            
-            if tx['type'] == 'buy':
-                holdings[ticker_tx]['quantity'] += tx['quantity']
-                holdings[ticker_tx]['total_cost'] += tx['total']
-            elif tx['type'] == 'sell':
-                sold_qty = tx['quantity']
-                remaining_qty = holdings[ticker_tx]['quantity']
-                if remaining_qty > 0:
-                    avg_cost_per_share = holdings[ticker_tx]['total_cost'] / remaining_qty
-                    holdings[ticker_tx]['quantity'] -= sold_qty
-                    holdings[ticker_tx]['total_cost'] -= (avg_cost_per_share * sold_qty)
+        holdings_store.ensure_materialized(user)
+        holdings = holdings_store.get_positions(user_obj_id)
         
         # Check if user owns enough shares
         current_quantity = holdings.get(ticker, {}).get('quantity', 0)
@@ -339,42 +220,25 @@ def sell_stock():
         # Calculate total proceeds
         total_proceeds = current_price * quantity
         
-        # Update cash balance (portfolio is calculated from transactions, not stored)
-        new_cash_balance = user.get('cash_balance', STARTING_CASH) + total_proceeds
-        
-        users.update_one(
-            {'_id': user['_id']},
-            {'$set': {
-                'cash_balance': new_cash_balance,
-                'updated_at': datetime.now(timezone.utc)
-            }}
-        )
-        
-        # Record transaction
-        transaction = {
-            'user_id': user_obj_id,
-            'type': 'sell',
-            'ticker': ticker,
-            'quantity': quantity,
-            'price': current_price,
-            'total': total_proceeds,
-            'timestamp': datetime.now(timezone.utc)
-        }
-        transactions.insert_one(transaction)
+        # Remove the shares, record the trade and credit cash; the shares check is atomic
+        result = order_executor.sell(user['_id'], ticker, quantity, current_price)
+        if result is None:
+            # Shares were sold by a concurrent order after the check above
+            return jsonify({
+                'error': 'Insufficient shares',
+                'owned': holdings_store.get_positions(user_obj_id).get(ticker, {}).get('quantity', 0),
+                'requested': quantity
+            }), 400
+        new_cash_balance, position_after = result
         
         # Calculate portfolio value after sale (for response)
-        holdings_after_sale = holdings.copy()
-        if ticker in holdings_after_sale:
-            holdings_after_sale[ticker]['quantity'] -= quantity
-            if holdings_after_sale[ticker]['quantity'] > 0:
-                avg_cost = holdings_after_sale[ticker]['total_cost'] / holdings_after_sale[ticker]['quantity']
-                holdings_after_sale[ticker]['total_cost'] -= (avg_cost * quantity)
-        
-        portfolio_value = sum(
-            h['quantity'] * (get_real_stock_price(t) or 0)
-            for t, h in holdings_after_sale.items() 
-            if h['quantity'] > 0
-        )
+        holdings_after_sale = dict(holdings)
+        holdings_after_sale[ticker] = position_after
+        
+        # Value all open positions with one batch price fetch
+        open_positions = {t: h['quantity'] for t, h in holdings_after_sale.items() if h['quantity'] > 0}
+        prices = get_stock_prices(list(open_positions))
+        portfolio_value = value_positions(list(open_positions.values()), prices.values)
         
         return jsonify({
             'success': True,
@@ -407,69 +271,76 @@ def get_transactions():
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        users = get_user_collection()
         transactions = get_transactions_collection()
         
-        # Find user (by ObjectId or email) to get correct user_id string
-        try:
-            user = users.find_one({'_id': ObjectId(user_id)})
-        except:
-            user = users.find_one({'email': user_id})
-        
-        # Auto-create user if they don't exist (for frontend-only auth users)
-        if not user and '@' in user_id:
-            print(f" User not found in get_transactions, auto-creating: {user_id}")
-            new_user = {
-                'email': user_id,
-                'cash_balance': STARTING_CASH,
-                'created_at': datetime.now(timezone.utc),
-                'updated_at': datetime.now(timezone.utc),
-                'onboarding_completed': False
-            }
-            result = users.insert_one(new_user)
-            user = users.find_one({'_id': result.inserted_id})
-            print(f" Auto-created user: {user_id}")
-        
-        # Auto-create user if they don't exist (for frontend-only auth users)
-        if not user and '@' in user_id:
-            print(f" User not found in get_transactions, auto-creating: {user_id}")
-            new_user = {
-                'email': user_id,
-                'cash_balance': STARTING_CASH,
-                'created_at': datetime.now(timezone.utc),
-                'updated_at': datetime.now(timezone.utc),
-                'onboarding_completed': False
-            }
-            result = users.insert_one(new_user)
-            user = users.find_one({'_id': result.inserted_id})
-            print(f"✅ Auto-created user: {user_id}")
+        # Resolve the user's _id (usually from cache, no query)
+        user_oid = user_resolver.resolve_id(user_id)
+        if user_oid is None and '@' in user_id:
+            user_oid = find_or_create_trader(user_id, {'_id': 1})['_id']
         
-        if not user:
+        if user_oid is None:
             return jsonify({'error': 'User not found'}), 404
         
         # Use the string version of user _id for transaction lookup
-        user_id_str = str(user['_id'])
+        user_id_str = str(user_oid)
         
-        # Get transactions for user
-        user_transactions = list(transactions.find(
-            {'user_id': user_id_str},
-            {'_id': 0}
-        ).sort('timestamp', -1).limit(limit))
+        # Get transactions for user, newest first; ?cursor=<next_cursor> continues from the last page
+        try:
+            user_transactions, next_cursor = keyset_page(transactions, {'user_id': user_id_str}, 'timestamp', limit,
+                                                         cursor=request.args.get('cursor'))
+        except InvalidCursorError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Convert datetime to string
         for txn in user_transactions:
+            txn.pop('_id', None)
             if 'timestamp' in txn:
                 txn['timestamp'] = txn['timestamp'].isoformat()
         
         return jsonify({
             'success': True,
-            'transactions': user_transactions
+            'transactions': user_transactions,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
         print(f"Error in get_transactions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@trading_bp.route('/transactions/export', methods=['GET'])
+def export_transactions():
+    """Stream a user's whole trade ledger (?format=ndjson|csv, ?from=/?to= ISO dates), oldest first"""
+    try:
+        if not db.is_connected:
+            log_db_error('export_transactions')
+            return jsonify(get_db_error_response()), 500
+        user_id = request.args.get('user_id')
+        export_format = request.args.get('format', 'ndjson')
+        
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"Unknown format '{export_format}'. Choose from: {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        user_oid = user_resolver.resolve_id(user_id)
+        if user_oid is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+        try:
+            date_range = date_range_filter('timestamp', request.args.get('from'), request.args.get('to'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid date: {e}'}), 400
+        
+        chunks = export_chunks(get_transactions_collection(), {'user_id': str(user_oid), **date_range}, 'timestamp',
+                               TRANSACTION_EXPORT_FIELDS, export_format)
+        return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format],
+                        headers={'Content-Disposition': f'attachment; filename=transactions.{export_format}',
+                                 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+    except Exception as e:
+        print(f"Error in export_transactions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @trading_bp.route('/portfolio', methods=['GET'])
 def get_portfolio():
     """Get user's current portfolio built from actual transactions only (no mock/onboarding data)"""
@@ -483,88 +354,47 @@ def get_portfolio():
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        users = get_user_collection()
-        transactions = get_transactions_collection()
-        
-        # Find user
-        try:
-            user = users.find_one({'_id': ObjectId(user_id)})
-        except:
-            user = users.find_one({'email': user_id})
-        
-        # Auto-create user if they don't exist (for frontend-only auth users)
-        if not user and '@' in user_id:
-            print(f" User not found in get_portfolio, auto-creating: {user_id}")
-            new_user = {
-                'email': user_id,
-                'cash_balance': STARTING_CASH,
-                'created_at': datetime.now(timezone.utc),
-                'updated_at': datetime.now(timezone.utc),
-                'onboarding_completed': False
-            }
-            result = users.insert_one(new_user)
-            user = users.find_one({'_id': result.inserted_id})
-            print(f" Auto-created user: {user_id}")
         
+        user = find_or_create_trader(user_id, {'cash_balance': 1, MATERIALIZED_FLAG: 1})
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Build portfolio from ACTUAL TRANSACTIONS ONLY (no onboarding/mock data)
+        # Build portfolio from the holdings snapshot of ACTUAL TRADES (no onboarding/mock data)
         user_obj_id = str(user['_id'])
-        all_transactions = list(transactions.find({'user_id': user_obj_id}).sort('timestamp', 1))
-        
-        # Calculate holdings from transactions
-        holdings = {}  # {ticker: {quantity, total_cost, transactions}}
-        
-        for tx in all_transactions:
-            ticker = tx['ticker']
-            if ticker not in holdings:
-                holdings[ticker] = {'quantity': 0, 'total_cost': 0, 'transactions': []}
-            
-            if tx['type'] == 'buy':
-                holdings[ticker]['quantity'] += tx['quantity']
-                holdings[ticker]['total_cost'] += tx['total']
-                holdings[ticker]['transactions'].append(tx)
-            elif tx['type'] == 'sell':
-                # Calculate average cost for sold shares (FIFO)
-                sold_qty = tx['quantity']
-                remaining_qty = holdings[ticker]['quantity']
-                
-                if remaining_qty > 0:
-                    avg_cost_per_share = holdings[ticker]['total_cost'] / remaining_qty
-                    holdings[ticker]['quantity'] -= sold_qty
-                    holdings[ticker]['total_cost'] -= (avg_cost_per_share * sold_qty)
-                    holdings[ticker]['transactions'].append(tx)
+        holdings_store.ensure_materialized(user)
+        holdings = holdings_store.get_positions(user_obj_id)  # {ticker: {quantity, total_cost, realized_pnl}}
         
         # Build portfolio array from holdings (only positions with quantity > 0)
+        open_tickers = [t for t, h in holdings.items() if h['quantity'] > 0]
+        quantities = np.array([holdings[t]['quantity'] for t in open_tickers], dtype=float)
+        avg_prices = np.array([holdings[t]['total_cost'] for t in open_tickers], dtype=float) / np.maximum(quantities, 1)
+        
+        # Fetch REAL-TIME prices for every position in one batch call
+        current_prices = get_stock_prices(open_tickers).values
+        missing = np.isnan(current_prices)
+        if missing.any():
+            # If price fetch fails, use avg_price as fallback
+            print(f"⚠️ Could not fetch current price for {[t for t, m in zip(open_tickers, missing) if m]}, using avg_price")
+            current_prices = np.where(missing, avg_prices, current_prices)
+        
         portfolio = []
-        for ticker, holding in holdings.items():
-            if holding['quantity'] > 0:
-                avg_price = holding['total_cost'] / holding['quantity'] if holding['quantity'] > 0 else 0
-                # Fetch REAL-TIME current price from Yahoo Finance
-                current_price = get_real_stock_price(ticker)
-                
-                if current_price is None:
-                    # If price fetch fails, use avg_price as fallback
-                    current_price = avg_price
-                    print(f"⚠️ Could not fetch current price for {ticker}, using avg_price: {avg_price}")
-                
-                portfolio.append({
-                    'ticker': ticker,
-                    'company': ticker,  # Can be enhanced with company name lookup
-                    'quantity': holding['quantity'],
-                    'avgPrice': avg_price,
-                    'currentPrice': current_price,  # REAL-TIME price from Yahoo Finance
-                    'reason': 'Paper trading purchase',
-                    'logo': ''
-                })
+        for ticker, quantity, avg_price, current_price in zip(open_tickers, quantities, avg_prices, current_prices):
+            portfolio.append({
+                'ticker': ticker,
+                'company': ticker,  # Can be enhanced with company name lookup
+                'quantity': holdings[ticker]['quantity'],
+                'avgPrice': float(avg_price),
+                'currentPrice': float(current_price),  # REAL-TIME price from Yahoo Finance
+                'reason': 'Paper trading purchase',
+                'logo': ''
+            })
         
         # Calculate total portfolio value using REAL-TIME prices
-        total_value = sum(p['quantity'] * p['currentPrice'] for p in portfolio)
+        total_value = value_positions(quantities, current_prices)
         cash_balance = user.get('cash_balance', STARTING_CASH)
         total_account_value = total_value + cash_balance
         
-        print(f"✅ Portfolio built from {len(all_transactions)} transactions: {len(portfolio)} positions")
+        print(f"✅ Portfolio built from holdings snapshot: {len(portfolio)} positions")
         print(f"   Portfolio value: ${total_value:.2f}, Cash: ${cash_balance:.2f}, Total: ${total_account_value:.2f}")
         
         return jsonify({
@@ -593,15 +423,9 @@ def get_portfolio_history():
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        users = get_user_collection()
         transactions = get_transactions_collection()
         
-        # Find user
-        try:
-            user = users.find_one({'_id': ObjectId(user_id)})
-        except:
-            user = users.find_one({'email': user_id})
-        
+        user = user_resolver.find_user(user_id, {'cash_balance': 1})
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -669,13 +493,10 @@ def get_portfolio_history():
                 'cash_balance': running_cash
             })
         
-        # Add current point with real-time prices
-        current_portfolio_value = 0
-        for ticker, holding in holdings.items():
-            if holding['quantity'] > 0:
-                current_price = get_real_stock_price(ticker)
-                if current_price:
-                    current_portfolio_value += holding['quantity'] * current_price
+        # Add current point with real-time prices (one batch price fetch)
+        open_positions = {t: h['quantity'] for t, h in holdings.items() if h['quantity'] > 0}
+        current_prices = get_stock_prices(list(open_positions))
+        current_portfolio_value = value_positions(list(open_positions.values()), current_prices.values)
         
         current_total = current_portfolio_value + running_cash
         now = datetime.now(timezone.utc)
@@ -0,0 +1,29 @@
+"""Bounded receipt uploads: size limits enforced while reading, never after"""
+import os
+
+# Largest single receipt image accepted
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', 15)) * 1024 * 1024
+# Largest request body (a batch of receipts); Flask answers 413 above this before any parsing
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_MB', 100)) * 1024 * 1024
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """An upload exceeded its byte limit; the message is shown to the user"""
+
+    def __init__(self, file_name, limit=MAX_UPLOAD_BYTES):
+        super().__init__(f'{file_name} is larger than {limit // (1024 * 1024)} MB')
+        self.limit = limit
+
+
+def read_upload(file, limit=MAX_UPLOAD_BYTES):
+    """Bytes of an uploaded file, read in chunks and abandoned as soon as it passes limit"""
+    buffer = bytearray()
+    while True:
+        chunk = file.stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+        if len(buffer) > limit:
+            raise UploadTooLargeError(file.filename, limit)
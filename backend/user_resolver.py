@@ -0,0 +1,122 @@
+"""Resolve user identifiers (ObjectId string, email or google_id) to user documents"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from bson import ObjectId
+from database import ReceiptDatabase
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+
+
+def identifier_query(identifier):
+    """Single $or filter matching a user by _id, email or google_id"""
+    conditions = [{'email': identifier}, {'google_id': identifier}]
+    # Only 24-hex strings can be ObjectIds
+    if len(identifier) == 24 and ObjectId.is_valid(identifier):
+        conditions.insert(0, {'_id': ObjectId(identifier)})
+    return {'$or': conditions}
+
+
+class UserResolver:
+    """One $or query per unknown identifier, behind an in-process LRU of identifier -> _id"""
+
+    def __init__(self, receipt_db, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.receipt_db = receipt_db
+        self.max_entries = max_entries
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def users(self):
+        if not self.receipt_db.is_connected:
+            raise ConnectionError('Database not connected')
+        return self.receipt_db.db['users']
+
+    def _cached_id(self, identifier):
+        with self._lock:
+            user_oid = self._ids.get(identifier)
+            if user_oid is not None:
+                self._ids.move_to_end(identifier)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return user_oid
+
+    def _remember(self, identifier, user_oid):
+        with self._lock:
+            self._ids[identifier] = user_oid
+            self._ids.move_to_end(identifier)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+    def invalidate(self, *identifiers):
+        """Forget cached mappings, e.g. after a user is created or their email changes"""
+        with self._lock:
+            for identifier in identifiers:
+                if identifier is not None:
+                    self._ids.pop(str(identifier), None)
+
+    def resolve_id(self, identifier):
+        """Canonical user _id for an identifier, or None; no query on a cache hit"""
+        if not identifier:
+            return None
+        user_oid = self._cached_id(identifier)
+        if user_oid is not None:
+            return user_oid
+        user = self.users.find_one(identifier_query(identifier), {'_id': 1})
+        if user is None:
+            return None
+        self._remember(identifier, user['_id'])
+        return user['_id']
+
+    def find_user(self, identifier, projection=None):
+        """User document (limited to projection) for an identifier, in at most one query"""
+        if not identifier:
+            return None
+        user_oid = self._cached_id(identifier)
+        if user_oid is not None:
+            user = self.users.find_one({'_id': user_oid}, projection)
+            if user is not None:
+                return user
+            # Cached user no longer exists
+            self.invalidate(identifier)
+
+        user = self.users.find_one(identifier_query(identifier), projection)
+        if user is not None:
+            self._remember(identifier, user['_id'])
+        return user
+
+    def create_user(self, user_doc):
+        """Insert a new user and drop any cached mappings for its identifiers"""
+        result = self.users.insert_one(user_doc)
+        user_doc['_id'] = result.inserted_id
+        self.invalidate(user_doc.get('email'), user_doc.get('google_id'), str(result.inserted_id))
+        return user_doc
+
+    def find_or_create_user(self, identifier, new_user_fields, projection=None):
+        """find_user, auto-creating the user when the identifier is an email (frontend-only auth users)"""
+        user = self.find_user(identifier, projection)
+        if user is None and '@' in identifier:
+            print(f"⚠️ User not found for user_id: {identifier}, auto-creating user...")
+            now = datetime.now(timezone.utc)
+            user_doc = {
+                'email': identifier,
+                'created_at': now,
+                'updated_at': now,
+                'onboarding_completed': False
+            }
+            user_doc.update(new_user_fields)
+            user = self.create_user(user_doc)
+            print(f"✅ Auto-created user: {identifier}")
+        return user
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._ids), 'hits': self.hits, 'misses': self.misses}
+
+
+# Process-wide resolver shared by all blueprints so creations invalidate everywhere
+user_resolver = UserResolver(ReceiptDatabase())